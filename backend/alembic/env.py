@@ -2,7 +2,8 @@ from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
-from database import Base
+from database import Base, SQLALCHEMY_DATABASE_URL
+import models  # noqa: F401  (jadvallar metadata'ga ro'yxatdan o'tishi uchun)
 from alembic import context
 
 # this is the Alembic Config object, which provides
@@ -14,6 +15,10 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# Ilova bilan bir xil DATABASE_URL ishlatiladi (migrations.upgrade_to_head() boshqasini berishi mumkin)
+database_url = config.attributes.get("database_url", SQLALCHEMY_DATABASE_URL)
+config.set_main_option("sqlalchemy.url", database_url.replace("%", "%%"))
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 # from myapp import mymodel
@@ -0,0 +1,70 @@
+"""Add attendance event log and daily rollups
+
+Revision ID: 1d8b6e3f5a72
+Revises: 6f1a3c8d2e57
+Create Date: 2026-10-19 23:10:00.000000
+
+students.attendance_baseline keeps the counter as it was before the log, so
+attendance = attendance_baseline + folded events stays true for old rows.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1d8b6e3f5a72'
+down_revision: Union[str, None] = '6f1a3c8d2e57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('students', sa.Column('attendance_baseline', sa.Float(), nullable=True))
+    op.execute("UPDATE students SET attendance_baseline = COALESCE(attendance, 0)")
+
+    op.create_table('attendance_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=True),
+    sa.Column('group_id', sa.Integer(), nullable=True),
+    sa.Column('task_id', sa.Integer(), nullable=True),
+    sa.Column('source', sa.String(length=20), nullable=True),
+    sa.Column('occurred_at', sa.DateTime(), nullable=True),
+    sa.Column('recorded_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['group_id'], ['groups.id'], ),
+    sa.ForeignKeyConstraint(['student_id'], ['students.id'], ),
+    sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_attendance_events_student_id_occurred_at', 'attendance_events', ['student_id', 'occurred_at'], unique=False)
+
+    op.create_table('attendance_daily',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=True),
+    sa.Column('group_id', sa.Integer(), nullable=True),
+    sa.Column('day', sa.Date(), nullable=True),
+    sa.Column('events', sa.Integer(), nullable=True),
+    sa.Column('first_at', sa.DateTime(), nullable=True),
+    sa.Column('last_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['student_id'], ['students.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('student_id', 'day', 'group_id', name='uq_attendance_daily_student_day_group')
+    )
+    op.create_index('ix_attendance_daily_group_id_day', 'attendance_daily', ['group_id', 'day', 'student_id'], unique=False)
+
+    op.create_table('rollup_watermarks',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('rollup_watermarks')
+    op.drop_index('ix_attendance_daily_group_id_day', table_name='attendance_daily')
+    op.drop_table('attendance_daily')
+    op.drop_index('ix_attendance_events_student_id_occurred_at', table_name='attendance_events')
+    op.drop_table('attendance_events')
+    op.drop_column('students', 'attendance_baseline')
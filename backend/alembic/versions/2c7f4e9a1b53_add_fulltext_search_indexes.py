@@ -0,0 +1,39 @@
+"""Add FULLTEXT search indexes
+
+Revision ID: 2c7f4e9a1b53
+Revises: 9e4b2d7c6a18
+Create Date: 2026-10-19 21:10:00.000000
+
+MySQL only; other databases use the in-process index in search.py.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c7f4e9a1b53'
+down_revision: Union[str, None] = '9e4b2d7c6a18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ft_groups_name_description', 'groups', ['name', 'description']),
+    ('ft_homeworks_title_description', 'homeworks', ['title', 'description']),
+    ('ft_videos_title', 'videos', ['title']),
+]
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
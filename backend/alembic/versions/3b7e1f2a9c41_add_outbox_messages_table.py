@@ -0,0 +1,47 @@
+"""Add outbox_messages table
+
+Revision ID: 3b7e1f2a9c41
+Revises: c4a1d9e2f7b3
+Create Date: 2026-10-19 15:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7e1f2a9c41'
+down_revision: Union[str, None] = 'c4a1d9e2f7b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # create_all() bilan yaratilgan bazalarda jadval allaqachon bor
+    if sa.inspect(op.get_bind()).has_table('outbox_messages'):
+        return
+    op.create_table('outbox_messages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('provider', sa.String(length=20), nullable=True),
+    sa.Column('recipient', sa.String(length=100), nullable=True),
+    sa.Column('body', sa.Text(), nullable=True),
+    sa.Column('dedup_key', sa.String(length=100), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.String(length=255), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('dedup_key')
+    )
+    op.create_index('ix_outbox_messages_id', 'outbox_messages', ['id'], unique=False)
+    op.create_index('ix_outbox_messages_status_next_attempt_at', 'outbox_messages', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_outbox_messages_status_next_attempt_at', table_name='outbox_messages')
+    op.drop_index('ix_outbox_messages_id', table_name='outbox_messages')
+    op.drop_table('outbox_messages')
@@ -0,0 +1,59 @@
+"""Add jobs table and media results on tasks and videos
+
+Revision ID: 4b9e2a6c8d31
+Revises: 1d8b6e3f5a72
+Create Date: 2026-10-20 01:20:00.000000
+
+Existing tasks and videos keep media_status NULL: nothing is queued for them.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b9e2a6c8d31'
+down_revision: Union[str, None] = '1d8b6e3f5a72'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    for table in ('tasks', 'videos'):
+        op.add_column(table, sa.Column('media_status', sa.String(length=20), nullable=True))
+        op.add_column(table, sa.Column('media_info', sa.JSON(), nullable=True))
+
+    op.create_table('jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=True),
+    sa.Column('payload', sa.JSON(), nullable=True),
+    sa.Column('target_type', sa.String(length=20), nullable=True),
+    sa.Column('target_id', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('run_after', sa.DateTime(), nullable=True),
+    sa.Column('locked_by', sa.String(length=64), nullable=True),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('last_error', sa.String(length=255), nullable=True),
+    sa.Column('created_by', sa.Integer(), nullable=True),
+    sa.Column('notify', sa.String(length=100), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['created_by'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_jobs_id', 'jobs', ['id'], unique=False)
+    op.create_index('ix_jobs_status_run_after', 'jobs', ['status', 'run_after'], unique=False)
+    op.create_index('ix_jobs_target_type_target_id', 'jobs', ['target_type', 'target_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_jobs_target_type_target_id', table_name='jobs')
+    op.drop_index('ix_jobs_status_run_after', table_name='jobs')
+    op.drop_index('ix_jobs_id', table_name='jobs')
+    op.drop_table('jobs')
+    for table in ('videos', 'tasks'):
+        op.drop_column(table, 'media_info')
+        op.drop_column(table, 'media_status')
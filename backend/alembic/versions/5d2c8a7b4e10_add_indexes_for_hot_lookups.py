@@ -0,0 +1,45 @@
+"""Add indexes for hot lookups
+
+Revision ID: 5d2c8a7b4e10
+Revises: 3b7e1f2a9c41
+Create Date: 2026-10-19 17:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2c8a7b4e10'
+down_revision: Union[str, None] = '3b7e1f2a9c41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_users_phone_number', 'users', ['phone_number']),
+    ('ix_teachers_user_id', 'teachers', ['user_id']),
+    ('ix_students_user_id', 'students', ['user_id']),
+    ('ix_tasks_teacher_id', 'tasks', ['teacher_id']),
+    ('ix_tasks_student_id', 'tasks', ['student_id']),
+    ('ix_groups_created_by', 'groups', ['created_by']),
+    ('ix_group_memberships_student_id', 'group_memberships', ['student_id']),
+    ('ix_group_memberships_group_id_status', 'group_memberships', ['group_id', 'status']),
+    ('ix_homeworks_group_id', 'homeworks', ['group_id']),
+    ('ix_videos_group_id', 'videos', ['group_id']),
+]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        # create_all() bilan yaratilgan bazalarda indeks allaqachon bo'lishi mumkin
+        if name in {index['name'] for index in inspector.get_indexes(table)}:
+            continue
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade() -> None:
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
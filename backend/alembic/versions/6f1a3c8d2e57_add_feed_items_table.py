@@ -0,0 +1,57 @@
+"""Add feed_items table
+
+Revision ID: 6f1a3c8d2e57
+Revises: 2c7f4e9a1b53
+Create Date: 2026-10-19 21:50:00.000000
+
+Existing homeworks and videos get created_at = now. Feeds start empty; members
+get a group's latest items when they are accepted, and new items fan out.
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f1a3c8d2e57'
+down_revision: Union[str, None] = '2c7f4e9a1b53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('groups', sa.Column('fanout_on_read', sa.Boolean(), nullable=True, server_default=sa.false()))
+    now = datetime.utcnow()
+    for table in ('homeworks', 'videos'):
+        op.add_column(table, sa.Column('created_at', sa.DateTime(), nullable=True))
+        # Bound as a DateTime so SQLite stores it in the same format as rows written by the app
+        created_at = sa.column('created_at', sa.DateTime())
+        op.execute(sa.table(table, created_at).update().where(created_at.is_(None)).values(created_at=now))
+        op.create_index(f'ix_{table}_group_id_created_at', table, ['group_id', 'created_at'], unique=False)
+
+    op.create_table('feed_items',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=True),
+    sa.Column('group_id', sa.Integer(), nullable=True),
+    sa.Column('item_type', sa.String(length=20), nullable=True),
+    sa.Column('item_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['group_id'], ['groups.id'], ),
+    sa.ForeignKeyConstraint(['student_id'], ['students.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('student_id', 'item_type', 'item_id', name='uq_feed_items_student_item')
+    )
+    op.create_index('ix_feed_items_id', 'feed_items', ['id'], unique=False)
+    op.create_index('ix_feed_items_student_id_created_at', 'feed_items', ['student_id', 'created_at', 'item_type', 'item_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_feed_items_student_id_created_at', table_name='feed_items')
+    op.drop_index('ix_feed_items_id', table_name='feed_items')
+    op.drop_table('feed_items')
+    for table in ('videos', 'homeworks'):
+        op.drop_index(f'ix_{table}_group_id_created_at', table_name=table)
+        op.drop_column(table, 'created_at')
+    op.drop_column('groups', 'fanout_on_read')
@@ -0,0 +1,30 @@
+"""Add passport thumbnail and processing status to users
+
+Revision ID: 7c3f5a9e1b24
+Revises: 4b9e2a6c8d31
+Create Date: 2026-10-20 03:10:00.000000
+
+Existing photos keep passport_status NULL; `python jobs.py --backfill-passports`
+queues thumbnails for them.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3f5a9e1b24'
+down_revision: Union[str, None] = '4b9e2a6c8d31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('passport_thumbnail', sa.String(length=255), nullable=True))
+    op.add_column('users', sa.Column('passport_status', sa.String(length=20), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'passport_status')
+    op.drop_column('users', 'passport_thumbnail')
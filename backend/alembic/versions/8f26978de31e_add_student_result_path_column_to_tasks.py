@@ -4,12 +4,14 @@ Revision ID: 8f26978de31e
 Revises: 
 Create Date: 2024-09-13 15:24:48.981614
 
+This revision was autogenerated against an empty metadata, so it dropped every
+table instead of adding the column. It is kept as a no-op so existing
+alembic_version rows stay valid; the tables are created by c4a1d9e2f7b3.
 """
 from typing import Sequence, Union
 
 from alembic import op
 import sqlalchemy as sa
-from sqlalchemy.dialects import mysql
 
 # revision identifiers, used by Alembic.
 revision: str = '8f26978de31e'
@@ -19,133 +21,8 @@ depends_on: Union[str, Sequence[str], None] = None
 
 
 def upgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_index('ix_teachers_id', table_name='teachers')
-    op.drop_table('teachers')
-    op.drop_index('ix_videos_id', table_name='videos')
-    op.drop_index('ix_videos_title', table_name='videos')
-    op.drop_table('videos')
-    op.drop_index('ix_tasks_id', table_name='tasks')
-    op.drop_table('tasks')
-    op.drop_index('ix_groups_id', table_name='groups')
-    op.drop_index('ix_groups_name', table_name='groups')
-    op.drop_table('groups')
-    op.drop_index('ix_students_id', table_name='students')
-    op.drop_table('students')
-    op.drop_index('ix_group_memberships_id', table_name='group_memberships')
-    op.drop_table('group_memberships')
-    op.drop_index('ix_users_id', table_name='users')
-    op.drop_index('ix_users_username', table_name='users')
-    op.drop_table('users')
-    op.drop_index('ix_homeworks_id', table_name='homeworks')
-    op.drop_index('ix_homeworks_title', table_name='homeworks')
-    op.drop_table('homeworks')
-    # ### end Alembic commands ###
+    pass
 
 
 def downgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.create_table('homeworks',
-    sa.Column('id', mysql.INTEGER(display_width=11), autoincrement=True, nullable=False),
-    sa.Column('title', mysql.VARCHAR(length=255), nullable=True),
-    sa.Column('description', mysql.TEXT(), nullable=True),
-    sa.Column('group_id', mysql.INTEGER(display_width=11), autoincrement=False, nullable=True),
-    sa.ForeignKeyConstraint(['group_id'], ['groups.id'], name='homeworks_ibfk_1'),
-    sa.PrimaryKeyConstraint('id'),
-    mysql_default_charset='latin1',
-    mysql_engine='InnoDB'
-    )
-    op.create_index('ix_homeworks_title', 'homeworks', ['title'], unique=False)
-    op.create_index('ix_homeworks_id', 'homeworks', ['id'], unique=False)
-    op.create_table('users',
-    sa.Column('id', mysql.INTEGER(display_width=11), autoincrement=True, nullable=False),
-    sa.Column('username', mysql.VARCHAR(length=50), nullable=True),
-    sa.Column('hashed_password', mysql.VARCHAR(length=128), nullable=True),
-    sa.Column('role', mysql.VARCHAR(length=20), nullable=True),
-    sa.Column('fullname', mysql.VARCHAR(length=100), nullable=True),
-    sa.Column('phone_number', mysql.VARCHAR(length=15), nullable=True),
-    sa.Column('passport_image', mysql.VARCHAR(length=255), nullable=True),
-    sa.Column('is_active', mysql.TINYINT(display_width=1), autoincrement=False, nullable=True),
-    sa.Column('verification_code', mysql.VARCHAR(length=6), nullable=True),
-    sa.PrimaryKeyConstraint('id'),
-    mysql_default_charset='latin1',
-    mysql_engine='InnoDB'
-    )
-    op.create_index('ix_users_username', 'users', ['username'], unique=True)
-    op.create_index('ix_users_id', 'users', ['id'], unique=False)
-    op.create_table('group_memberships',
-    sa.Column('id', mysql.INTEGER(display_width=11), autoincrement=True, nullable=False),
-    sa.Column('group_id', mysql.INTEGER(display_width=11), autoincrement=False, nullable=True),
-    sa.Column('student_id', mysql.INTEGER(display_width=11), autoincrement=False, nullable=True),
-    sa.Column('status', mysql.VARCHAR(length=20), nullable=True),
-    sa.ForeignKeyConstraint(['group_id'], ['groups.id'], name='group_memberships_ibfk_1'),
-    sa.ForeignKeyConstraint(['student_id'], ['students.id'], name='group_memberships_ibfk_2'),
-    sa.PrimaryKeyConstraint('id'),
-    mysql_default_charset='latin1',
-    mysql_engine='InnoDB'
-    )
-    op.create_index('ix_group_memberships_id', 'group_memberships', ['id'], unique=False)
-    op.create_table('students',
-    sa.Column('id', mysql.INTEGER(display_width=11), autoincrement=True, nullable=False),
-    sa.Column('user_id', mysql.INTEGER(display_width=11), autoincrement=False, nullable=True),
-    sa.Column('teacher_id', mysql.INTEGER(display_width=11), autoincrement=False, nullable=True),
-    sa.Column('attendance', mysql.FLOAT(), nullable=True),
-    sa.Column('rating', mysql.FLOAT(), nullable=True),
-    sa.ForeignKeyConstraint(['teacher_id'], ['teachers.id'], name='students_ibfk_2'),
-    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='students_ibfk_1'),
-    sa.PrimaryKeyConstraint('id'),
-    mysql_default_charset='latin1',
-    mysql_engine='InnoDB'
-    )
-    op.create_index('ix_students_id', 'students', ['id'], unique=False)
-    op.create_table('groups',
-    sa.Column('id', mysql.INTEGER(display_width=11), autoincrement=True, nullable=False),
-    sa.Column('name', mysql.VARCHAR(length=100), nullable=True),
-    sa.Column('description', mysql.TEXT(), nullable=True),
-    sa.Column('created_by', mysql.INTEGER(display_width=11), autoincrement=False, nullable=True),
-    sa.ForeignKeyConstraint(['created_by'], ['teachers.id'], name='groups_ibfk_1'),
-    sa.PrimaryKeyConstraint('id'),
-    mysql_default_charset='latin1',
-    mysql_engine='InnoDB'
-    )
-    op.create_index('ix_groups_name', 'groups', ['name'], unique=False)
-    op.create_index('ix_groups_id', 'groups', ['id'], unique=False)
-    op.create_table('tasks',
-    sa.Column('id', mysql.INTEGER(display_width=11), autoincrement=True, nullable=False),
-    sa.Column('teacher_id', mysql.INTEGER(display_width=11), autoincrement=False, nullable=True),
-    sa.Column('student_id', mysql.INTEGER(display_width=11), autoincrement=False, nullable=True),
-    sa.Column('task_description', mysql.VARCHAR(length=1000), nullable=True),
-    sa.Column('grade', mysql.INTEGER(display_width=11), autoincrement=False, nullable=True),
-    sa.Column('video_path', mysql.VARCHAR(length=255), nullable=True),
-    sa.ForeignKeyConstraint(['student_id'], ['students.id'], name='tasks_ibfk_2'),
-    sa.ForeignKeyConstraint(['teacher_id'], ['teachers.id'], name='tasks_ibfk_1'),
-    sa.PrimaryKeyConstraint('id'),
-    mysql_default_charset='latin1',
-    mysql_engine='InnoDB'
-    )
-    op.create_index('ix_tasks_id', 'tasks', ['id'], unique=False)
-    op.create_table('videos',
-    sa.Column('id', mysql.INTEGER(display_width=11), autoincrement=True, nullable=False),
-    sa.Column('title', mysql.VARCHAR(length=255), nullable=True),
-    sa.Column('video_path', mysql.VARCHAR(length=255), nullable=True),
-    sa.Column('group_id', mysql.INTEGER(display_width=11), autoincrement=False, nullable=True),
-    sa.ForeignKeyConstraint(['group_id'], ['groups.id'], name='videos_ibfk_1'),
-    sa.PrimaryKeyConstraint('id'),
-    mysql_default_charset='latin1',
-    mysql_engine='InnoDB'
-    )
-    op.create_index('ix_videos_title', 'videos', ['title'], unique=False)
-    op.create_index('ix_videos_id', 'videos', ['id'], unique=False)
-    op.create_table('teachers',
-    sa.Column('id', mysql.INTEGER(display_width=11), autoincrement=True, nullable=False),
-    sa.Column('user_id', mysql.INTEGER(display_width=11), autoincrement=False, nullable=True),
-    sa.Column('name', mysql.VARCHAR(length=50), nullable=True),
-    sa.Column('subject', mysql.VARCHAR(length=100), nullable=True),
-    sa.Column('rating', mysql.FLOAT(), nullable=True),
-    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='teachers_ibfk_1'),
-    sa.PrimaryKeyConstraint('id'),
-    mysql_default_charset='latin1',
-    mysql_engine='InnoDB'
-    )
-    op.create_index('ix_teachers_id', 'teachers', ['id'], unique=False)
-    # ### end Alembic commands ###
+    pass
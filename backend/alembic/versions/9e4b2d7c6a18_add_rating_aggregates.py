@@ -0,0 +1,69 @@
+"""Add rating aggregates
+
+Revision ID: 9e4b2d7c6a18
+Revises: 7a3e5c1d9b22
+Create Date: 2026-10-19 20:30:00.000000
+
+Existing grades get graded_at = now, so they all start with the same decay
+weight. Run `python ratings.py` once after upgrading to fill the aggregates.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4b2d7c6a18'
+down_revision: Union[str, None] = '7a3e5c1d9b22'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+RATING_COLUMNS = [
+    ('rating_sum', sa.Integer(), '0'),
+    ('rating_count', sa.Integer(), '0'),
+    ('rating_decayed', sa.Float(), None),
+    ('rating_decayed_sum', sa.Float(), '0'),
+    ('rating_decayed_weight', sa.Float(), '0'),
+    ('rating_updated_at', sa.DateTime(), None),
+]
+
+
+def upgrade() -> None:
+    for table in ('students', 'teachers'):
+        for name, type_, default in RATING_COLUMNS:
+            op.add_column(table, sa.Column(name, type_, nullable=True, server_default=default))
+
+    op.add_column('tasks', sa.Column('group_id', sa.Integer(), nullable=True))
+    op.add_column('tasks', sa.Column('graded_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_tasks_group_id', 'tasks', ['group_id'], unique=False)
+    # SQLite ALTER TABLE cannot add a constraint; the column is enough there
+    if op.get_bind().dialect.name != 'sqlite':
+        op.create_foreign_key('fk_tasks_group_id_groups', 'tasks', 'groups', ['group_id'], ['id'])
+    op.execute("UPDATE tasks SET graded_at = CURRENT_TIMESTAMP WHERE grade IS NOT NULL")
+
+    op.create_table('rating_breakdowns',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('owner_type', sa.String(length=20), nullable=True),
+    sa.Column('owner_id', sa.Integer(), nullable=True),
+    sa.Column('dimension', sa.String(length=20), nullable=True),
+    sa.Column('dimension_key', sa.String(length=100), nullable=True),
+    sa.Column('rating_sum', sa.Integer(), nullable=True),
+    sa.Column('rating_count', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('owner_type', 'owner_id', 'dimension', 'dimension_key', name='uq_rating_breakdowns_owner_dimension')
+    )
+    op.create_index('ix_rating_breakdowns_id', 'rating_breakdowns', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_rating_breakdowns_id', table_name='rating_breakdowns')
+    op.drop_table('rating_breakdowns')
+    if op.get_bind().dialect.name != 'sqlite':
+        op.drop_constraint('fk_tasks_group_id_groups', 'tasks', type_='foreignkey')
+    op.drop_index('ix_tasks_group_id', table_name='tasks')
+    op.drop_column('tasks', 'graded_at')
+    op.drop_column('tasks', 'group_id')
+    for table in ('teachers', 'students'):
+        for name, _, _ in reversed(RATING_COLUMNS):
+            op.drop_column(table, name)
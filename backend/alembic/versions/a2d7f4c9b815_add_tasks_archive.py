@@ -0,0 +1,71 @@
+"""Add tasks_archive, partitioned by year on MySQL
+
+Revision ID: a2d7f4c9b815
+Revises: 7c3f5a9e1b24
+Create Date: 2026-10-20 04:30:00.000000
+
+On MySQL the table is partitioned with RANGE (YEAR(graded_at)) and starts with
+one catch-all partition, p_max; archive.py splits yearly partitions off it
+before moving rows. A partition key has to be in every unique key, hence the
+(id, graded_at) primary key. The foreign key from attendance_events.task_id to
+tasks is dropped, since archived tasks leave that table (SQLite does not
+enforce it, so it stays there). tasks itself is not partitioned: MySQL does not
+partition tables that have foreign keys.
+
+Downgrading moves archived tasks back into tasks.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a2d7f4c9b815'
+down_revision: Union[str, None] = '7c3f5a9e1b24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TASK_COLUMNS = ('id, teacher_id, student_id, task_description, grade, video_path, student_result_path, '
+                'start_time, end_time, group_id, graded_at, media_status, media_info')
+
+
+def upgrade() -> None:
+    op.create_table('tasks_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('graded_at', sa.DateTime(), nullable=False),
+    sa.Column('teacher_id', sa.Integer(), nullable=True),
+    sa.Column('student_id', sa.Integer(), nullable=True),
+    sa.Column('task_description', sa.String(length=1000), nullable=True),
+    sa.Column('grade', sa.Integer(), nullable=True),
+    sa.Column('video_path', sa.String(length=255), nullable=True),
+    sa.Column('student_result_path', sa.String(length=255), nullable=True),
+    sa.Column('start_time', sa.Time(), nullable=True),
+    sa.Column('end_time', sa.Time(), nullable=True),
+    sa.Column('group_id', sa.Integer(), nullable=True),
+    sa.Column('media_status', sa.String(length=20), nullable=True),
+    sa.Column('media_info', sa.JSON(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id', 'graded_at')
+    )
+    op.create_index('ix_tasks_archive_student_id_graded_at', 'tasks_archive', ['student_id', 'graded_at'], unique=False)
+    op.create_index('ix_tasks_archive_teacher_id_graded_at', 'tasks_archive', ['teacher_id', 'graded_at'], unique=False)
+    op.create_index('ix_tasks_archive_graded_at', 'tasks_archive', ['graded_at'], unique=False)
+
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    op.execute('ALTER TABLE tasks_archive PARTITION BY RANGE (YEAR(graded_at)) '
+               '(PARTITION p_max VALUES LESS THAN MAXVALUE)')
+    for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys('attendance_events'):
+        if foreign_key['referred_table'] == 'tasks':
+            op.drop_constraint(foreign_key['name'], 'attendance_events', type_='foreignkey')
+
+
+def downgrade() -> None:
+    op.execute(f'INSERT INTO tasks ({TASK_COLUMNS}) SELECT {TASK_COLUMNS} FROM tasks_archive')
+    if op.get_bind().dialect.name == 'mysql':
+        op.create_foreign_key(None, 'attendance_events', 'tasks', ['task_id'], ['id'])
+    op.drop_index('ix_tasks_archive_graded_at', table_name='tasks_archive')
+    op.drop_index('ix_tasks_archive_teacher_id_graded_at', table_name='tasks_archive')
+    op.drop_index('ix_tasks_archive_student_id_graded_at', table_name='tasks_archive')
+    op.drop_table('tasks_archive')
@@ -0,0 +1,37 @@
+"""Record the subject a task was graded under
+
+Revision ID: b6e3a1f8c4d2
+Revises: e5b1c8d3f640
+Create Date: 2026-10-21 10:00:00.000000
+
+ratings.apply_grade used the teacher's current subject for the subject
+breakdown, so a re-grade after the subject changed took the old grade out of
+the wrong bucket. Graded tasks get their teacher's current subject, which is
+what the stored breakdowns were built from.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6e3a1f8c4d2'
+down_revision: Union[str, None] = 'e5b1c8d3f640'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    for table in ('tasks', 'tasks_archive'):
+        op.add_column(table, sa.Column('graded_subject', sa.String(length=100), nullable=True))
+        op.execute(
+            f"UPDATE {table} SET graded_subject = "
+            f"(SELECT teachers.subject FROM teachers WHERE teachers.user_id = {table}.teacher_id) "
+            f"WHERE grade IS NOT NULL"
+        )
+
+
+def downgrade() -> None:
+    op.drop_column('tasks_archive', 'graded_subject')
+    op.drop_column('tasks', 'graded_subject')
@@ -0,0 +1,139 @@
+"""Create base schema
+
+Revision ID: c4a1d9e2f7b3
+Revises: 8f26978de31e
+Create Date: 2026-10-19 18:20:00.000000
+
+Until now the tables were created by Base.metadata.create_all() when the app
+started, so most databases already have them. Tables that exist are left alone.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4a1d9e2f7b3'
+down_revision: Union[str, None] = '8f26978de31e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _missing(table: str) -> bool:
+    return not sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade() -> None:
+    if _missing('users'):
+        op.create_table('users',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('username', sa.String(length=50), nullable=True),
+        sa.Column('hashed_password', sa.String(length=128), nullable=True),
+        sa.Column('role', sa.String(length=20), nullable=True),
+        sa.Column('fullname', sa.String(length=100), nullable=True),
+        sa.Column('phone_number', sa.String(length=15), nullable=True),
+        sa.Column('passport_image', sa.String(length=255), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('verification_code', sa.String(length=6), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_users_id', 'users', ['id'], unique=False)
+        op.create_index('ix_users_username', 'users', ['username'], unique=True)
+    if _missing('teachers'):
+        op.create_table('teachers',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('name', sa.String(length=50), nullable=True),
+        sa.Column('subject', sa.String(length=100), nullable=True),
+        sa.Column('rating', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_teachers_id', 'teachers', ['id'], unique=False)
+    if _missing('students'):
+        op.create_table('students',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('teacher_id', sa.Integer(), nullable=True),
+        sa.Column('attendance', sa.Float(), nullable=True),
+        sa.Column('rating', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['teacher_id'], ['teachers.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_students_id', 'students', ['id'], unique=False)
+    if _missing('groups'):
+        op.create_table('groups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['teachers.id']),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_groups_id', 'groups', ['id'], unique=False)
+        op.create_index('ix_groups_name', 'groups', ['name'], unique=False)
+    if _missing('group_memberships'):
+        op.create_table('group_memberships',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.Column('student_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.ForeignKeyConstraint(['group_id'], ['groups.id']),
+        sa.ForeignKeyConstraint(['student_id'], ['students.id']),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_group_memberships_id', 'group_memberships', ['id'], unique=False)
+    if _missing('homeworks'):
+        op.create_table('homeworks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=255), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['group_id'], ['groups.id']),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_homeworks_id', 'homeworks', ['id'], unique=False)
+        op.create_index('ix_homeworks_title', 'homeworks', ['title'], unique=False)
+    if _missing('videos'):
+        op.create_table('videos',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=255), nullable=True),
+        sa.Column('video_path', sa.String(length=255), nullable=True),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['group_id'], ['groups.id']),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_videos_id', 'videos', ['id'], unique=False)
+        op.create_index('ix_videos_title', 'videos', ['title'], unique=False)
+    if _missing('tasks'):
+        op.create_table('tasks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('teacher_id', sa.Integer(), nullable=True),
+        sa.Column('student_id', sa.Integer(), nullable=True),
+        sa.Column('task_description', sa.String(length=1000), nullable=True),
+        sa.Column('grade', sa.Integer(), nullable=True),
+        sa.Column('video_path', sa.String(length=255), nullable=True),
+        sa.Column('student_result_path', sa.String(length=255), nullable=True),
+        sa.Column('start_time', sa.Time(), nullable=True),
+        sa.Column('end_time', sa.Time(), nullable=True),
+        sa.ForeignKeyConstraint(['student_id'], ['students.id']),
+        sa.ForeignKeyConstraint(['teacher_id'], ['teachers.id']),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_tasks_id', 'tasks', ['id'], unique=False)
+    else:
+        # Jadval create_all()'ning eski versiyasidan qolgan bo'lsa, yangi ustunlar yo'q
+        columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('tasks')}
+        if 'student_result_path' not in columns:
+            op.add_column('tasks', sa.Column('student_result_path', sa.String(length=255), nullable=True))
+        if 'start_time' not in columns:
+            op.add_column('tasks', sa.Column('start_time', sa.Time(), nullable=True))
+        if 'end_time' not in columns:
+            op.add_column('tasks', sa.Column('end_time', sa.Time(), nullable=True))
+
+
+def downgrade() -> None:
+    for table in ('tasks', 'videos', 'homeworks', 'group_memberships', 'groups', 'students', 'teachers', 'users'):
+        op.drop_table(table)
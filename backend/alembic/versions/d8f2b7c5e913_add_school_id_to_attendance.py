@@ -0,0 +1,38 @@
+"""Add school_id to the attendance tables
+
+Revision ID: d8f2b7c5e913
+Revises: b6e3a1f8c4d2
+Create Date: 2026-10-22 09:00:00.000000
+
+attendance.py writes events and daily rows into the database of the student's
+school; school_id keeps them scoped like the students they belong to. Existing
+rows take their student's school.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8f2b7c5e913'
+down_revision: Union[str, None] = 'b6e3a1f8c4d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('attendance_events', 'attendance_daily')
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.add_column(table, sa.Column('school_id', sa.Integer(), server_default='1', nullable=False))
+        op.execute(
+            f"UPDATE {table} SET school_id = "
+            f"(SELECT students.school_id FROM students WHERE students.id = {table}.student_id) "
+            f"WHERE student_id IN (SELECT id FROM students)"
+        )
+
+
+def downgrade() -> None:
+    for table in reversed(TABLES):
+        op.drop_column(table, 'school_id')
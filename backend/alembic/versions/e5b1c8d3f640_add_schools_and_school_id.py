@@ -0,0 +1,59 @@
+"""Add schools and a school_id column on every school-owned table
+
+Revision ID: e5b1c8d3f640
+Revises: a2d7f4c9b815
+Create Date: 2026-10-20 06:00:00.000000
+
+Existing rows belong to school 1, which is created here; the server default
+keeps it that way for rows inserted without a school_id (seed, Core inserts).
+There is no foreign key to schools: a school on its own database has its rows
+there, while schools stays in the default database. Usernames become unique per
+school instead of globally.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b1c8d3f640'
+down_revision: Union[str, None] = 'a2d7f4c9b815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCOPED_TABLES = ('users', 'teachers', 'students', 'tasks', 'tasks_archive', 'groups', 'group_memberships',
+                 'homeworks', 'videos', 'jobs')
+
+
+def upgrade() -> None:
+    schools = op.create_table('schools',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=True),
+    sa.Column('slug', sa.String(length=50), nullable=True),
+    sa.Column('database', sa.String(length=50), nullable=True),
+    sa.Column('storage_prefix', sa.String(length=100), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_schools_slug', 'schools', ['slug'], unique=True)
+    op.bulk_insert(schools, [{'id': 1, 'name': 'Default', 'slug': 'default', 'database': 'default'}])
+
+    for table in SCOPED_TABLES:
+        op.add_column(table, sa.Column('school_id', sa.Integer(), server_default='1', nullable=False))
+    op.drop_index('ix_users_username', table_name='users')
+    op.create_index('ix_users_school_id_username', 'users', ['school_id', 'username'], unique=True)
+    # archive.py looks for the newest archived grade of the current school
+    op.drop_index('ix_tasks_archive_graded_at', table_name='tasks_archive')
+    op.create_index('ix_tasks_archive_school_id_graded_at', 'tasks_archive', ['school_id', 'graded_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_archive_school_id_graded_at', table_name='tasks_archive')
+    op.create_index('ix_tasks_archive_graded_at', 'tasks_archive', ['graded_at'], unique=False)
+    op.drop_index('ix_users_school_id_username', table_name='users')
+    op.create_index('ix_users_username', 'users', ['username'], unique=True)
+    for table in reversed(SCOPED_TABLES):
+        op.drop_column(table, 'school_id')
+    op.drop_index('ix_schools_slug', table_name='schools')
+    op.drop_table('schools')
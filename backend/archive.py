@@ -0,0 +1,170 @@
+"""Term archival of graded tasks.
+
+Every lesson and homework is a tasks row, but only the current term is read
+often. archive() moves graded tasks whose graded_at is before a cutoff (by
+default the start of the current term, see TERM_STARTS) into tasks_archive, in
+batches of ARCHIVE_BATCH rows per transaction. After each batch it sleeps at
+least as long as the batch took, so archival holds row locks for at most half
+of the time (--pause 0 turns this off). Rows being graded at that moment are skipped (SKIP LOCKED), as are
+tasks whose media job has not finished; the next run picks them up.
+
+    python archive.py                      # before the start of the current term, on every database
+    python archive.py --before 2026-02-01 --batch 500 --pause 1
+    python archive.py --dry-run            # only count what would move
+
+On MySQL tasks_archive is partitioned by YEAR(graded_at); archive() adds the
+yearly partitions it needs before moving rows. Archived tasks keep their ids and
+are read-only. Ratings include them (ratings.recompute reads both tables).
+
+Only graded tasks have a date, so read ranges apply to graded_at. lessons()
+reads tasks_archive only when the requested range reaches back to archived
+grades; tasks that are not graded yet are current work and always listed.
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+from sqlalchemy import DateTime, and_, delete, func, insert, literal, or_, select, text
+from sqlalchemy.orm import Session
+
+from models import Task, TaskArchive
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "1000"))
+ARCHIVE_PAUSE = float(os.getenv("ARCHIVE_PAUSE", "0.2"))  # seconds, at least, between batches
+# Term start days as MM-DD
+TERM_STARTS = [tuple(int(part) for part in value.split("-"))
+               for value in os.getenv("TERM_STARTS", "09-01,02-01").split(",")]
+
+tasks = Task.__table__
+archived = TaskArchive.__table__
+
+
+def term_start(day: date) -> date:
+    starts = [date(year, month, dom) for year in (day.year - 1, day.year) for month, dom in TERM_STARTS]
+    return max(start for start in starts if start <= day)
+
+
+def _movable(before: datetime):
+    return and_(
+        tasks.c.grade.is_not(None),
+        tasks.c.graded_at < before,
+        # jobs._media_done must still find the task when its job finishes
+        or_(tasks.c.media_status.is_(None), tasks.c.media_status != "pending"),
+    )
+
+
+def _ensure_partitions(bind, years):
+    """Splits yearly partitions off p_max for the given years (MySQL)."""
+    with bind.connect() as conn:
+        bounds = conn.execute(text(
+            "SELECT PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks_archive' AND PARTITION_NAME IS NOT NULL"
+        )).scalars().all()
+        if "MAXVALUE" not in bounds:
+            return
+        highest = max((int(bound) for bound in bounds if bound != "MAXVALUE"), default=None)
+        # Years below the lowest bound already fall into the first partition
+        missing = [year for year in years if highest is None or year >= highest]
+        if not missing:
+            return
+        definitions = "".join(f"PARTITION p{year} VALUES LESS THAN ({year + 1}), " for year in missing)
+        # p_max is empty here, so this does not copy rows; DDL commits by itself
+        conn.execute(text(f"ALTER TABLE tasks_archive REORGANIZE PARTITION p_max INTO "
+                          f"({definitions}PARTITION p_max VALUES LESS THAN MAXVALUE)"))
+
+
+def archive(bind, before: datetime, batch: int = ARCHIVE_BATCH, pause: float = ARCHIVE_PAUSE,
+            dry_run: bool = False) -> int:
+    """Moves graded tasks with graded_at < before to tasks_archive; returns how many moved."""
+    movable = _movable(before)
+    with bind.connect() as conn:
+        if dry_run:
+            return conn.execute(select(func.count()).select_from(tasks).where(movable)).scalar()
+        oldest = conn.execute(select(func.min(tasks.c.graded_at)).where(movable)).scalar()
+    if oldest is None:
+        return 0
+    if bind.dialect.name == "mysql":
+        _ensure_partitions(bind, range(oldest.year, before.year + 1))
+
+    columns = [column.name for column in tasks.columns]
+    moved = last_id = 0
+    while True:
+        started = time.monotonic()
+        with bind.begin() as conn:
+            ids = conn.execute(
+                select(tasks.c.id).where(movable, tasks.c.id > last_id)
+                .order_by(tasks.c.id).limit(batch).with_for_update(skip_locked=True)
+            ).scalars().all()
+            if not ids:
+                break
+            conn.execute(insert(archived).from_select(
+                columns + ["archived_at"],
+                select(*[tasks.c[name] for name in columns], literal(datetime.utcnow(), DateTime))
+                .where(tasks.c.id.in_(ids)),
+            ))
+            conn.execute(delete(tasks).where(tasks.c.id.in_(ids)))
+        moved += len(ids)
+        last_id = ids[-1]
+        logger.info("Archived %d tasks (up to id %d)", moved, last_id)
+        if pause > 0:
+            time.sleep(max(pause, time.monotonic() - started))
+    return moved
+
+
+# --- O'qish ---
+
+def _between(column, lo, hi) -> list:
+    return ([column >= lo] if lo else []) + ([column < hi] if hi else [])
+
+
+def _needs_archive(db: Session, start) -> bool:
+    newest = db.query(func.max(TaskArchive.graded_at)).scalar()
+    return newest is not None and (start is None or start <= newest)
+
+
+def lessons(db: Session, user_id: int, start: date = None, end: date = None) -> list:
+    """A student's tasks (tasks.student_id holds the user id).
+
+    Without a range: the tasks table only. With one: graded tasks with
+    start <= graded_at < end + 1 day, from the archive too when it has any.
+    """
+    query = db.query(Task).filter(Task.student_id == user_id)
+    if start is None and end is None:
+        return query.all()
+    lo = datetime.combine(start, dt_time.min) if start else None
+    hi = datetime.combine(end + timedelta(days=1), dt_time.min) if end else None
+    rows = query.filter(or_(Task.graded_at.is_(None), and_(*_between(Task.graded_at, lo, hi)))).all()
+    if _needs_archive(db, lo):
+        rows += (db.query(TaskArchive)
+                 .filter(TaskArchive.student_id == user_id, *_between(TaskArchive.graded_at, lo, hi)).all())
+    return sorted(rows, key=lambda task: task.id)
+
+
+def find(db: Session, task_id: int, options=()):
+    return db.query(TaskArchive).options(*options).filter(TaskArchive.id == task_id).first()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--before", type=date.fromisoformat, help="cutoff day (default: start of the current term)")
+    parser.add_argument("--batch", type=int, default=ARCHIVE_BATCH, help="tasks per transaction")
+    parser.add_argument("--pause", type=float, default=ARCHIVE_PAUSE, help="minimum seconds between batches")
+    parser.add_argument("--dry-run", action="store_true", help="count the tasks that would move")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    from database import engines
+
+    # Har bir maktab bazasi alohida arxivlanadi
+    before = datetime.combine(args.before or term_start(date.today()), dt_time.min)
+    for name, bind in engines.items():
+        count = archive(bind, before, batch=args.batch, pause=args.pause, dry_run=args.dry_run)
+        print(f"{name}: {count} tasks {'to archive' if args.dry_run else 'archived'} before {before:%Y-%m-%d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""Attendance: an append-only event log with daily rollups.
+
+mark_attendance no longer rewrites the student row. A check-in becomes an
+attendance_events row (student, group, lesson, source, time). The writer
+thread inserts the buffered events in one executemany every
+ATTENDANCE_FLUSH_INTERVAL, or as soon as ATTENDANCE_BATCH_SIZE are waiting. A
+check-in is answered with 202 before it is written; events still in the buffer
+are lost if the worker is killed (a normal shutdown flushes them).
+
+Student ids are only unique within one database, so every database in
+database.engines has its own writer and compactor. record() buffers a
+check-in for the database of the request's school and stamps it with the
+school; the rollups keep that school_id.
+
+The compactor folds new events into attendance_daily, one row per (student,
+group, UTC day), and adds them to Student.attendance, which stays the total
+number of check-ins (attendance_baseline + events). rollup_watermarks holds
+the id of the last folded event. Rollups, counters and the watermark change
+in one transaction, so an event is counted exactly once. Events younger than
+ATTENDANCE_SETTLE_SECONDS are left for the next run: a concurrent insert may
+still commit a smaller id. Rates over a date range are read from the rollups
+and lag the check-ins by up to a compaction interval.
+
+A group's session days are the days on which any member checked in. A
+student's rate in a group is their attended days over the group's session
+days.
+
+    python attendance.py            # fold pending events now, on every database
+    python attendance.py --rebuild  # rebuild rollups and counters from the event log
+    python attendance.py --check    # only report students whose counter differs
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+import tenancy
+from database import engines
+from models import AttendanceDaily, AttendanceEvent, RollupWatermark, Student
+
+logger = logging.getLogger(__name__)
+
+ATTENDANCE_FLUSH_INTERVAL = float(os.getenv("ATTENDANCE_FLUSH_INTERVAL", "1"))
+ATTENDANCE_BATCH_SIZE = int(os.getenv("ATTENDANCE_BATCH_SIZE", "500"))
+ATTENDANCE_MAX_PENDING = int(os.getenv("ATTENDANCE_MAX_PENDING", "50000"))
+ATTENDANCE_COMPACT_INTERVAL = float(os.getenv("ATTENDANCE_COMPACT_INTERVAL", "30"))
+ATTENDANCE_SETTLE_SECONDS = float(os.getenv("ATTENDANCE_SETTLE_SECONDS", "10"))
+COMPACT_BATCH = 5000
+MAX_RANGE_DAYS = 366
+DEFAULT_RANGE_DAYS = 30
+SOURCES = {"api", "teacher", "kiosk"}
+NO_GROUP = 0
+WATERMARK = "attendance_daily"
+
+events = AttendanceEvent.__table__
+daily = AttendanceDaily.__table__
+watermarks = RollupWatermark.__table__
+students = Student.__table__
+
+
+# --- Yozish ---
+
+class AttendanceWriter:
+    """Buffers check-ins and inserts them in batches."""
+
+    def __init__(self, bind, interval: float = ATTENDANCE_FLUSH_INTERVAL, batch_size: int = ATTENDANCE_BATCH_SIZE,
+                 max_pending: int = ATTENDANCE_MAX_PENDING):
+        self.bind = bind
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, rows):
+        """rows: dicts with school_id, student_id, group_id, task_id, source, occurred_at."""
+        with self._lock:
+            if len(self._pending) + len(rows) > self.max_pending:
+                # The database has not taken a batch for a while; do not grow without bound
+                raise HTTPException(status_code=503, detail="Attendance is not being written right now",
+                                    headers={"Retry-After": "5"})
+            self._pending.extend(rows)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        written = 0
+        while True:
+            with self._lock:
+                batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            if not batch:
+                return written
+            now = datetime.utcnow()
+            try:
+                with self.bind.begin() as conn:
+                    conn.execute(insert(events), [{**row, "recorded_at": now} for row in batch])
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = batch  # keep the order; retried on the next flush
+                raise
+            written += len(batch)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(5)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Final attendance flush failed")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Attendance flush failed")
+
+
+# --- Yig'ish ---
+
+def _claim(conn, now: datetime) -> int:
+    """Locks the watermark row for this transaction and returns it.
+
+    An UPDATE rather than SELECT ... FOR UPDATE: it also takes SQLite's write lock
+    up front, so two compactors cannot both read the same watermark.
+    """
+    claimed = conn.execute(update(watermarks).where(watermarks.c.name == WATERMARK).values(updated_at=now)).rowcount
+    if not claimed:
+        conn.execute(insert(watermarks).values(name=WATERMARK, last_id=0, updated_at=now))
+        return 0
+    return conn.execute(select(watermarks.c.last_id).where(watermarks.c.name == WATERMARK)).scalar()
+
+
+def _fold(conn, rows):
+    """Adds events to the daily rollups and the students' counters."""
+    buckets = {}  # (student, group, day) -> [events, first_at, last_at, school]
+    per_student = defaultdict(int)
+    for row in rows:
+        key = (row.student_id, row.group_id or NO_GROUP, row.occurred_at.date())
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [1, row.occurred_at, row.occurred_at, row.school_id]
+        else:
+            bucket[0] += 1
+            bucket[1] = min(bucket[1], row.occurred_at)
+            bucket[2] = max(bucket[2], row.occurred_at)
+        per_student[row.student_id] += 1
+
+    # Only the watermark holder writes rollups, so read-then-write is safe here
+    existing = {}
+    student_ids = {key[0] for key in buckets}
+    days = {key[2] for key in buckets}
+    for row in conn.execute(
+        select(daily.c.id, daily.c.student_id, daily.c.group_id, daily.c.day, daily.c.first_at, daily.c.last_at)
+        .where(daily.c.student_id.in_(student_ids), daily.c.day.in_(days))
+    ):
+        existing[(row.student_id, row.group_id, row.day)] = row
+    updates, inserts = [], []
+    for key, (count, first_at, last_at, school_id) in buckets.items():
+        row = existing.get(key)
+        if row is None:
+            inserts.append(dict(school_id=school_id, student_id=key[0], group_id=key[1], day=key[2], events=count,
+                                first_at=first_at, last_at=last_at))
+        else:
+            updates.append(dict(row_id=row.id, delta=count, first=min(row.first_at, first_at),
+                                last=max(row.last_at, last_at)))
+    if updates:
+        conn.execute(
+            update(daily).where(daily.c.id == bindparam("row_id"))
+            .values(events=daily.c.events + bindparam("delta"), first_at=bindparam("first"), last_at=bindparam("last")),
+            updates,
+        )
+    if inserts:
+        conn.execute(insert(daily), inserts)
+    conn.execute(
+        update(students).where(students.c.id == bindparam("student"))
+        .values(attendance=func.coalesce(students.c.attendance, 0.0) + bindparam("delta")),
+        [{"student": student_id, "delta": count} for student_id, count in per_student.items()],
+    )
+
+
+class AttendanceCompactor:
+    def __init__(self, bind, interval: float = ATTENDANCE_COMPACT_INTERVAL,
+                 settle: float = ATTENDANCE_SETTLE_SECONDS, batch: int = COMPACT_BATCH):
+        self.bind = bind
+        self.interval = interval
+        self.settle = settle
+        self.batch = batch
+        self._stop = threading.Event()
+        self._thread = None
+
+    def compact(self) -> int:
+        """Folds every settled event past the watermark; returns how many."""
+        folded = 0
+        while True:
+            now = datetime.utcnow()
+            cutoff = now - timedelta(seconds=self.settle)
+            with self.bind.begin() as conn:
+                last_id = _claim(conn, now)
+                rows = conn.execute(
+                    select(events.c.id, events.c.school_id, events.c.student_id, events.c.group_id,
+                           events.c.occurred_at, events.c.recorded_at)
+                    .where(events.c.id > last_id).order_by(events.c.id).limit(self.batch)
+                ).all()
+                fetched = len(rows)
+                # Stop at the first unsettled event: everything after it waits as well
+                for i, row in enumerate(rows):
+                    if row.recorded_at > cutoff:
+                        rows = rows[:i]
+                        break
+                if not rows:
+                    return folded
+                _fold(conn, rows)
+                conn.execute(update(watermarks).where(watermarks.c.name == WATERMARK).values(last_id=rows[-1].id))
+            folded += len(rows)
+            if len(rows) < fetched or fetched < self.batch:
+                return folded
+
+    def rebuild(self) -> int:
+        """Drops the rollups, resets the counters to their baseline and folds the whole log again."""
+        with self.bind.begin() as conn:
+            _claim(conn, datetime.utcnow())
+            conn.execute(delete(daily))
+            conn.execute(update(students).values(attendance=func.coalesce(students.c.attendance_baseline, 0.0)))
+            conn.execute(update(watermarks).where(watermarks.c.name == WATERMARK).values(last_id=0))
+        return self.compact()
+
+    def check(self, report=print) -> int:
+        """Reports students whose counter or rollups differ from the folded events."""
+        problems = 0
+        with self.bind.connect() as conn:
+            last_id = conn.execute(select(watermarks.c.last_id).where(watermarks.c.name == WATERMARK)).scalar() or 0
+            logged = dict(conn.execute(
+                select(events.c.student_id, func.count()).where(events.c.id <= last_id).group_by(events.c.student_id)).all())
+            rolled = dict(conn.execute(
+                select(daily.c.student_id, func.sum(daily.c.events)).group_by(daily.c.student_id)).all())
+            for student_id, attendance, baseline in conn.execute(
+                    select(students.c.id, students.c.attendance, students.c.attendance_baseline)):
+                expected = (baseline or 0.0) + logged.get(student_id, 0)
+                if (attendance or 0.0) != expected or (rolled.get(student_id) or 0) != logged.get(student_id, 0):
+                    report(f"student {student_id}: attendance {attendance}, rollups {rolled.get(student_id) or 0}, "
+                           f"expected {expected} ({logged.get(student_id, 0)} events)")
+                    problems += 1
+        return problems
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="attendance-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                started = time.perf_counter()
+                folded = self.compact()
+                if folded:
+                    logger.debug("Folded %d attendance events in %.2fs", folded, time.perf_counter() - started)
+            except Exception:
+                logger.exception("Attendance compaction failed")
+
+
+writers = {name: AttendanceWriter(bind) for name, bind in engines.items()}
+compactors = {name: AttendanceCompactor(bind) for name, bind in engines.items()}
+
+
+def _school_id(db: Session) -> int:
+    return tenancy.school_of(db) or tenancy.DEFAULT_SCHOOL_ID
+
+
+def record(db: Session, student_id: int, group_id: int = None, task_id: int = None, source: str = "api",
+           occurred_at: datetime = None):
+    """Buffers a check-in for the database of db's school."""
+    if source not in SOURCES:
+        raise HTTPException(status_code=400, detail=f"source must be one of: {', '.join(sorted(SOURCES))}")
+    row = dict(school_id=_school_id(db), student_id=student_id, group_id=group_id, task_id=task_id, source=source,
+               occurred_at=occurred_at or datetime.utcnow())
+    writers[tenancy.database_of(db)].record([row])
+    return row
+
+
+def record_many(db: Session, student_ids, group_id: int, task_id: int = None, source: str = "teacher"):
+    occurred_at = datetime.utcnow()
+    school_id = _school_id(db)
+    rows = [dict(school_id=school_id, student_id=student_id, group_id=group_id, task_id=task_id, source=source,
+                 occurred_at=occurred_at)
+            for student_id in student_ids]
+    writers[tenancy.database_of(db)].record(rows)
+    return rows
+
+
+# --- O'qish ---
+
+def date_range(start: date = None, end: date = None):
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    if start > end or (end - start).days >= MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"start must not be after end, and the range is at most "
+                                                    f"{MAX_RANGE_DAYS} days")
+    return start, end
+
+
+def _rate(attended: int, sessions: int):
+    return round(attended / sessions, 4) if sessions else None
+
+
+def student_rates(conn, student_id: int, start: date, end: date) -> dict:
+    """Attended days per group and overall, with the group's session days in the range."""
+    in_range = daily.c.day.between(start, end)
+    attended = {
+        group_id: (days, total)
+        for group_id, days, total in conn.execute(
+            select(daily.c.group_id, func.count(), func.sum(daily.c.events))
+            .where(daily.c.student_id == student_id, in_range).group_by(daily.c.group_id)
+        )
+    }
+    group_ids = [group_id for group_id in attended if group_id != NO_GROUP]
+    sessions = dict(conn.execute(
+        select(daily.c.group_id, func.count(daily.c.day.distinct()))
+        .where(daily.c.group_id.in_(group_ids), in_range).group_by(daily.c.group_id)
+    ).all()) if group_ids else {}
+    groups = [
+        {"group_id": group_id, "attended_days": days, "session_days": sessions.get(group_id, 0),
+         "rate": _rate(days, sessions.get(group_id, 0)), "events": total}
+        for group_id, (days, total) in sorted(attended.items()) if group_id != NO_GROUP
+    ]
+    attended_days = sum(group["attended_days"] for group in groups)
+    session_days = sum(group["session_days"] for group in groups)
+    return {
+        "start": start, "end": end,
+        "events": sum(total for _, total in attended.values()),
+        "attended_days": attended_days,
+        "session_days": session_days,
+        "rate": _rate(attended_days, session_days),
+        "ungrouped_days": attended.get(NO_GROUP, (0, 0))[0],
+        "groups": groups,
+    }
+
+
+def student_days(conn, student_id: int, start: date, end: date):
+    """Daily check-in counts, oldest first."""
+    return [
+        {"day": day, "events": total}
+        for day, total in conn.execute(
+            select(daily.c.day, func.sum(daily.c.events))
+            .where(daily.c.student_id == student_id, daily.c.day.between(start, end))
+            .group_by(daily.c.day).order_by(daily.c.day)
+        )
+    ]
+
+
+def group_rates(conn, group_id: int, member_ids, start: date, end: date) -> dict:
+    """Per-day turnout and per-member rates for one group."""
+    in_range = (daily.c.group_id == group_id, daily.c.day.between(start, end))
+    days = [
+        {"day": day, "present": present}
+        for day, present in conn.execute(
+            select(daily.c.day, func.count()).where(*in_range).group_by(daily.c.day).order_by(daily.c.day))
+    ]
+    attended = dict(conn.execute(
+        select(daily.c.student_id, func.count()).where(*in_range).group_by(daily.c.student_id)).all())
+    sessions = len(days)
+    members = [
+        {"student_id": student_id, "attended_days": attended.get(student_id, 0),
+         "rate": _rate(attended.get(student_id, 0), sessions)}
+        for student_id in member_ids
+    ]
+    present = sum(member["attended_days"] for member in members)
+    return {
+        "group_id": group_id, "start": start, "end": end,
+        "session_days": sessions,
+        "rate": _rate(present, sessions * len(members)),
+        "days": days,
+        "members": members,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="rebuild rollups and counters from the event log")
+    parser.add_argument("--check", action="store_true", help="report differences without writing")
+    args = parser.parse_args()
+
+    problems = 0
+    for name, bind in engines.items():
+        if args.check:
+            count = AttendanceCompactor(bind).check()
+            print(f"{name}: {count} problems")
+            problems += count
+            continue
+        folded = AttendanceCompactor(bind).rebuild() if args.rebuild else AttendanceCompactor(bind, settle=0).compact()
+        print(f"{name}: {folded} events folded")
+    if args.check:
+        raise SystemExit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,26 +2,60 @@ from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from models import User
-from database import SessionLocal
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from database import SessionLocal, shared_session
 from typing import Optional
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from contextvars import ContextVar
+import os
+from metrics import Gauge
+from utils import password_context
+import tenancy
 
 SECRET_KEY = "salom100"  # Maxfiy kalit
 ALGORITHM = "HS256"  # Algoritm
 ACCESS_TOKEN_EXPIRE_MINUTES = 60   # Token muddati
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Batch ichidagi so'rovlar: (token, User) - JWT va foydalanuvchi bir marta tekshiriladi
+batch_principal: ContextVar = ContextVar("batch_principal", default=None)
 
 def hash_password(password: str):
-    return pwd_context.hash(password)
+    return password_context().hash(password)
 
 def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_context().verify(plain_password, hashed_password)
+
+# bcrypt CPU'ni band qiladi: async route'lar uni cheklangan pool'da bajaradi,
+# navbat to'lib qolsa so'rov darhol 503 bilan qaytariladi
+PASSWORD_HASH_WORKERS = os.cpu_count() or 1
+PASSWORD_HASH_MAX_QUEUE = PASSWORD_HASH_WORKERS * 8
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+password_queue_depth = 0
+password_queue_gauge = Gauge("password_hash_queue_depth", "bcrypt jobs queued or running in the password pool.")
+
+async def _run_password_job(func, *args):
+    global password_queue_depth
+    if password_queue_depth >= PASSWORD_HASH_MAX_QUEUE:
+        raise HTTPException(status_code=503, detail="Server band, keyinroq urinib ko'ring", headers={"Retry-After": "1"})
+    password_queue_depth += 1
+    password_queue_gauge.inc()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, func, *args)
+    finally:
+        password_queue_depth -= 1
+        password_queue_gauge.dec()
+
+async def hash_password_async(password: str):
+    return await _run_password_job(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str):
+    return await _run_password_job(verify_password, plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    from jose import jwt  # ~30ms importi; birinchi token bilan yuklanadi
+
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
@@ -30,6 +64,10 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 def get_db():
+    shared = shared_session.get()
+    if shared is not None:
+        yield shared
+        return
     db = SessionLocal()
     try:
         yield db
@@ -37,6 +75,13 @@ def get_db():
         db.close()
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+    principal = batch_principal.get()
+    if principal is not None and principal[0] == token:
+        tenancy.bind_token_school(db, principal[1].school_id)
+        return db.merge(principal[1], load=False)
+
+    from jose import JWTError, jwt
+
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
@@ -51,8 +96,15 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError as e:
         print(f"JWTError: {e}")
         raise credentials_exception
+    # Maktab tokendan: sessiya so'rovlari shu maktab (va uning bazasi) bilan cheklanadi
+    tenancy.bind_token_school(db, payload.get("school"))
     user = db.query(User).filter(User.id == user_id).first()
     if user is None:
         print("User not found")
         raise credentials_exception
-    return user
\ No newline at end of file
+    return user
+
+def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can access this resource")
+    return current_user
@@ -0,0 +1,342 @@
+"""End-to-end benchmark of the real user flows.
+
+    python benchmarks/flows.py --users 50 --concurrency 10 --output results.json
+    python benchmarks/flows.py --baseline benchmarks/baseline.json --max-regression 0.25
+
+By default the migrations are applied to a fresh SQLite file in a temporary
+directory and a uvicorn server is started against it. Use --database-url for a
+local MySQL, or --server-url together with --database-url to measure a server
+that is already running. The database URL is also used to read verification
+codes, which the app only sends by SMS.
+
+Every student runs register -> verify -> /token -> lessons -> ongoing lessons ->
+join request. The teacher then lists and accepts the request, creates a task with
+a video, the student uploads a result and the teacher grades it. The report has
+throughput and p50/p95/p99 per step. Results are saved as JSON. The run fails
+(exit code 1) if any step errored, or if a step's latency regressed against the
+baseline by more than --max-regression.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+from sqlalchemy import create_engine, text
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STEPS = [
+    "register", "verify", "token", "lessons", "lessons_ongoing", "join_request",
+    "join_requests_list", "join_accept", "task_create", "result_upload", "grade",
+]
+
+
+def _passport_png(side: int = 640) -> bytes:
+    # A decodable photo-sized image: registration rejects files that are not images
+    buffer = io.BytesIO()
+    Image.radial_gradient("L").resize((side, side)).convert("RGB").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+PNG_BYTES = _passport_png()
+
+
+class StepFailed(Exception):
+    pass
+
+
+def _multipart(fields: dict, files: dict):
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for name, value in fields.items():
+        body += f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    for name, (filename, content, content_type) in files.items():
+        body += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        body += content + b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return bytes(body), f"multipart/form-data; boundary={boundary}"
+
+
+class Client:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, path, params=None, form=None, json_body=None, files=None, token=None):
+        url = self.base_url + path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        headers = {}
+        data = None
+        if files:
+            data, headers["Content-Type"] = _multipart(form or {}, files)
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        request = urllib.request.Request(url, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class Recorder:
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def step(self, name, func):
+        started = time.perf_counter()
+        status, body = func()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.timings[name].append(elapsed)
+            if status >= 400:
+                self.errors[name] += 1
+        if status >= 400:
+            raise StepFailed(f"{name}: HTTP {status} {body[:200]!r}")
+        return json.loads(body) if body else None
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(recorder: Recorder, wall_time: float) -> dict:
+    steps = {}
+    for name in STEPS:
+        values = sorted(recorder.timings.get(name, []))
+        steps[name] = {
+            "count": len(values),
+            "errors": recorder.errors.get(name, 0),
+            "throughput_rps": round(len(values) / wall_time, 2) if wall_time else None,
+            "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else None,
+            "p50_ms": round(_percentile(values, 0.50) * 1000, 2) if values else None,
+            "p95_ms": round(_percentile(values, 0.95) * 1000, 2) if values else None,
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 2) if values else None,
+        }
+    return steps
+
+
+class Context:
+    def __init__(self, client: Client, database_url: str, recorder: Recorder, video_bytes: bytes):
+        self.client = client
+        self.engine = create_engine(database_url)
+        self.recorder = recorder
+        self.video_bytes = video_bytes
+        self.run_id = f"{int(time.time()) % 100:02d}"
+        self.teacher_token = None
+        self.group_id = None
+
+    def scalar(self, sql, **params):
+        with self.engine.connect() as conn:
+            return conn.execute(text(sql), params).scalar()
+
+    def setup_teacher(self):
+        c = self.client
+        username = f"bench_teacher_{uuid.uuid4().hex[:8]}"
+        phone = f"+998{self.run_id}9999999"
+        status, body = c.request(
+            "POST", "/admin/register_teacher/", params={"phone_number": phone, "password": "benchpass"},
+            json_body={"fullname": "Bench Teacher", "subject": "Math", "username": username, "password": "benchpass"},
+        )
+        if status >= 400:
+            raise StepFailed(f"teacher setup: HTTP {status} {body[:200]!r}")
+        code = json.loads(body)["code"]
+        c.request("POST", "/admin/verify_teacher/", params={"phone_number": phone, "verification_code": code})
+        status, body = c.request("POST", "/token", form={"username": username, "password": "benchpass"})
+        self.teacher_token = json.loads(body)["access_token"]
+        status, body = c.request("POST", "/teacher/groups/", json_body={"name": "Bench group"}, token=self.teacher_token)
+        self.group_id = json.loads(body)["id"]
+
+    def student_flow(self, i: int):
+        c, r, teacher = self.client, self.recorder, self.teacher_token
+        username = f"bench_{self.run_id}_{i}_{uuid.uuid4().hex[:6]}"
+        phone = f"+998{self.run_id}{i:07d}"
+        password = "benchpass"
+
+        user = r.step("register", lambda: c.request(
+            "POST", "/student/register_student/",
+            params={"fullname": "Bench Student", "phone_number": phone, "username": username, "password": password},
+            files={"passport_image": ("passport.png", PNG_BYTES, "image/png")},
+        ))
+        code = self.scalar("SELECT verification_code FROM users WHERE id = :id", id=user["user_id"])
+        r.step("verify", lambda: c.request(
+            "POST", "/student/verify_code/", params={"phone_number": phone, "verification_code": code}))
+        token = r.step("token", lambda: c.request(
+            "POST", "/token", form={"username": username, "password": password}))["access_token"]
+        r.step("lessons", lambda: c.request("GET", "/student/lessons/", token=token))
+        r.step("lessons_ongoing", lambda: c.request("GET", "/student/lessons/ongoing/", token=token))
+        r.step("join_request", lambda: c.request(
+            "POST", f"/student/groups/{self.group_id}/join-request/", token=token))
+
+        student_id = self.scalar("SELECT id FROM students WHERE user_id = :id", id=user["user_id"])
+        pending = r.step("join_requests_list", lambda: c.request(
+            "GET", f"/teacher/groups/{self.group_id}/join-requests/", token=teacher))
+        request_id = next(item["id"] for item in pending if item["student_id"] == student_id)
+        r.step("join_accept", lambda: c.request(
+            "PUT", f"/teacher/groups/{self.group_id}/join-requests/{request_id}/accept", token=teacher))
+
+        # tasks.student_id holds the user id: that is what the student routes filter by
+        task_json = json.dumps({"teacher_id": 0, "student_id": user["user_id"], "task_description": "Bench task"})
+        task = r.step("task_create", lambda: c.request(
+            "POST", "/teacher/tasks/", form={"task": task_json},
+            files={"video": ("lesson.mp4", self.video_bytes, "video/mp4")}, token=teacher))
+        r.step("result_upload", lambda: c.request(
+            "POST", f"/student/tasks/{task['id']}/upload_result/",
+            files={"result_file": ("result.txt", b"answer\n" * 64, "text/plain")}, token=token))
+        r.step("grade", lambda: c.request(
+            "PUT", f"/teacher/tasks/{task['id']}/grade", params={"grade": random.randint(1, 5)}, token=teacher))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def migrate(database_url: str):
+    # The server no longer creates tables; the schema comes from the migrations, as in a release
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"],
+                   cwd=BACKEND_DIR, env={**os.environ, "DATABASE_URL": database_url}, check=True)
+
+
+def start_server(database_url: str, workdir: str):
+    port = _free_port()
+    env = {**os.environ, "DATABASE_URL": database_url, "RATE_LIMIT_ENABLED": "0"}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+         "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url + "/", timeout=1).read()
+            return process, url
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError("Server exited during startup")
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server did not start in time")
+
+
+def compare(current: dict, baseline: dict, metric: str, max_regression: float, min_delta_ms: float):
+    regressions = []
+    for name, base in baseline.get("steps", {}).items():
+        now = current["steps"].get(name, {})
+        if base.get(metric) is None or now.get(metric) is None:
+            continue
+        limit = base[metric] * (1 + max_regression)
+        if now[metric] > limit and now[metric] - base[metric] > min_delta_ms:
+            regressions.append(f"{name}: {metric} {base[metric]} -> {now[metric]} ms (limit {limit:.2f})")
+    return regressions
+
+
+def print_report(steps: dict):
+    print(f"{'step':<20}{'count':>7}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, s in steps.items():
+        print(f"{name:<20}{s['count']:>7}{s['errors']:>5}{s['throughput_rps'] or 0:>9}"
+              f"{s['p50_ms'] or 0:>9}{s['p95_ms'] or 0:>9}{s['p99_ms'] or 0:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="student flows to run")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--video-kb", type=int, default=256, help="size of the uploaded lesson video")
+    parser.add_argument("--database-url", help="default: fresh SQLite file in a temp dir")
+    parser.add_argument("--server-url", help="benchmark a running server instead of starting one")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--metric", default="p95_ms", choices=["p50_ms", "p95_ms", "p99_ms", "mean_ms"])
+    parser.add_argument("--max-regression", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    if args.server_url and not args.database_url:
+        parser.error("--server-url needs --database-url to read verification codes")
+
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    process = None
+    if args.server_url:
+        base_url = args.server_url
+    else:
+        migrate(database_url)
+        process, base_url = start_server(database_url, workdir)
+
+    recorder = Recorder()
+    failures = []
+    try:
+        ctx = Context(Client(base_url), database_url, recorder, os.urandom(args.video_kb * 1024))
+        ctx.setup_teacher()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for future in [pool.submit(ctx.student_flow, i) for i in range(args.users)]:
+                try:
+                    future.result()
+                except StepFailed as e:
+                    failures.append(str(e))
+        wall_time = time.perf_counter() - started
+    finally:
+        if process:
+            process.terminate()
+            process.wait(10)
+
+    results = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "database": database_url.split("://")[0],
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "video_kb": args.video_kb,
+            "wall_time_s": round(wall_time, 3),
+        },
+        "steps": summarize(recorder, wall_time),
+    }
+    print_report(results["steps"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    for failure in failures[:10]:
+        print("FAILED", failure)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.metric, args.max_regression, args.min_delta_ms)
+        for regression in regressions:
+            print("REGRESSION", regression)
+    sys.exit(1 if failures or regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
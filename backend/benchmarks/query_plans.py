@@ -0,0 +1,192 @@
+"""Query-plan regression checks for the hot endpoints.
+
+    python benchmarks/query_plans.py                    # seeded temp SQLite, compare to snapshot
+    python benchmarks/query_plans.py --update           # accept the current plans
+    python benchmarks/query_plans.py --database-url mysql+pymysql://root:@localhost/start_up_seeded
+
+Each case calls a route through the TestClient (needs httpx) and captures the SQL
+it emits with SQLAlchemy cursor events. Every SELECT is then EXPLAINed against
+the same database. A case fails if a statement does a full table scan on
+FORBIDDEN_SCANS, if the route issues more than its query budget, or if a plan
+differs from benchmarks/query_plans.<dialect>.json. Differences are shown as a
+unified diff. Without --database-url a small dataset from seed.py is generated
+first. A MySQL database has to be seeded beforehand.
+"""
+import argparse
+import difflib
+import json
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+FORBIDDEN_SCANS = {"tasks", "tasks_archive", "group_memberships", "users", "feed_items", "attendance_events", "attendance_daily"}
+
+# Seeded ids: 1 admin, 2..101 teachers, the rest students (see seed.py)
+STUDENT_ID = 500
+TEACHER_ID = 2
+GROUP_ID = 1
+OWN_GROUP_ID = 88  # created by TEACHER_ID
+
+CASES = [
+    # name, method, path, user id for the token (or None), request kwargs, max queries
+    ("login", "POST", "/token", None, {"data": {"username": f"user{STUDENT_ID}", "password": "password"}}, 1),
+    ("users_me", "GET", "/users/me", STUDENT_ID, {}, 1),
+    ("student_lessons", "GET", "/student/lessons/", STUDENT_ID, {}, 2),
+    ("student_lessons_archived", "GET", "/student/lessons/", STUDENT_ID,
+     {"params": {"start": "2026-04-01", "end": "2026-06-30"}}, 4),
+    ("student_lessons_ongoing", "GET", "/student/lessons/ongoing/", STUDENT_ID, {}, 2),
+    ("teacher_join_requests", "GET", f"/teacher/groups/{GROUP_ID}/join-requests/", TEACHER_ID, {}, 2),
+    ("teacher_members_count", "GET", f"/teacher/groups/{GROUP_ID}/members/count/", TEACHER_ID, {}, 2),
+    ("teacher_dashboard", "GET", "/teacher/groups/", TEACHER_ID,
+     {"params": {"include": "members.student.user,homeworks,videos"}}, 6),
+    ("student_feed", "GET", "/student/feed/", STUDENT_ID, {}, 6),
+    ("student_attendance", "GET", "/student/attendance/", STUDENT_ID,
+     {"params": {"start": "2026-08-01", "end": "2026-08-31"}}, 6),
+    ("teacher_group_attendance", "GET", f"/teacher/groups/{OWN_GROUP_ID}/attendance", TEACHER_ID,
+     {"params": {"start": "2026-08-01", "end": "2026-08-31"}}, 6),
+]
+
+
+def _explain(engine, statement, parameters):
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if engine.dialect.name == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            rows = cursor.fetchall()
+            depth = {0: -1}
+            lines = []
+            for node_id, parent, _, detail in rows:
+                depth[node_id] = depth.get(parent, -1) + 1
+                lines.append("  " * depth[node_id] + detail)
+            return lines
+        cursor.execute("EXPLAIN " + statement, parameters)
+        columns = [column[0] for column in cursor.description]
+        lines = []
+        for row in cursor.fetchall():
+            row = dict(zip(columns, row))
+            lines.append(f"{row.get('table')}: type={row.get('type')} key={row.get('key')} extra={row.get('Extra')}")
+        return lines
+    finally:
+        raw.close()
+
+
+def _full_scans(dialect: str, plan_lines):
+    scans = set()
+    for line in plan_lines:
+        line = line.strip()
+        if dialect == "sqlite" and line.startswith("SCAN "):
+            scans.add(line.split()[1])
+        elif dialect != "sqlite" and " type=ALL " in line:
+            scans.add(line.split(":")[0])
+    return scans
+
+
+def run_cases(engine):
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    import main
+    from auth import create_access_token
+    from query_stats import statement_shape
+
+    client = TestClient(main.app)
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    results = {}
+    problems = []
+    try:
+        for name, method, path, user_id, kwargs, max_queries in CASES:
+            headers = {"Authorization": f"Bearer {create_access_token({'sub': user_id})}"} if user_id else {}
+            captured.clear()
+            response = client.request(method, path, headers=headers, **kwargs)
+            statements = list(captured)
+            if response.status_code >= 400:
+                problems.append(f"{name}: HTTP {response.status_code} {response.text[:200]}")
+            if len(statements) > max_queries:
+                problems.append(f"{name}: {len(statements)} queries, budget is {max_queries}")
+            plans = []
+            for statement, parameters in statements:
+                if not statement.lstrip().upper().startswith("SELECT"):
+                    continue
+                plan = _explain(engine, statement, parameters)
+                plans.append({"sql": statement_shape(statement), "plan": plan})
+                for table in _full_scans(engine.dialect.name, plan) & FORBIDDEN_SCANS:
+                    problems.append(f"{name}: full scan on {table}: {statement_shape(statement)[:160]}")
+            results[name] = {"queries": len(statements), "statements": plans}
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return results, problems
+
+
+def _render(case: dict):
+    lines = [f"queries: {case['queries']}"]
+    # Eager loaders may run their SELECTs in any order
+    for item in sorted(case["statements"], key=lambda item: item["sql"]):
+        lines.append(item["sql"])
+        lines.extend("    " + line for line in item["plan"])
+    return lines
+
+
+def diff_snapshots(expected: dict, actual: dict):
+    diffs = []
+    for name in sorted(set(expected) | set(actual)):
+        before = _render(expected[name]) if name in expected else []
+        after = _render(actual[name]) if name in actual else []
+        if before != after:
+            diffs.append("\n".join(difflib.unified_diff(
+                before, after, fromfile=f"{name} (snapshot)", tofile=f"{name} (current)", lineterm="")))
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="already seeded database; default: seed a temp SQLite file")
+    parser.add_argument("--snapshot", help="default: benchmarks/query_plans.<dialect>.json")
+    parser.add_argument("--update", action="store_true", help="overwrite the snapshot with the current plans")
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='plans_'), 'plans.db')}"
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["RATE_LIMIT_ENABLED"] = "0"
+
+    from database import engine
+
+    if args.database_url is None:
+        from migrations import upgrade_to_head
+        from seed import SCALES, Seeder
+
+        upgrade_to_head(database_url)
+        Seeder(engine, seed=42, batch_size=10_000, **SCALES["small"]).run()
+
+    results, problems = run_cases(engine)
+
+    snapshot = args.snapshot or os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                             f"query_plans.{engine.dialect.name}.json")
+    if args.update:
+        with open(snapshot, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"snapshot written to {snapshot}")
+    elif os.path.exists(snapshot):
+        with open(snapshot) as f:
+            problems.extend(diff_snapshots(json.load(f), results))
+    else:
+        problems.append(f"no snapshot at {snapshot}; run with --update")
+
+    for problem in problems:
+        print(problem)
+    print(f"{len(CASES)} cases, {len(problems)} problems")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
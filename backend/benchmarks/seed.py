@@ -0,0 +1,318 @@
+"""Deterministic synthetic data for performance work.
+
+    python benchmarks/seed.py --scale small --database-url sqlite:///seed.db --create-schema
+    python benchmarks/seed.py --scale production --seed 42
+    python benchmarks/seed.py --users 100000 --tasks 2000000
+
+The target database must be empty: ids are assigned explicitly, so the same seed
+always gives the same rows. Students and teachers get the same id as their user.
+Code that stores user ids in tasks.student_id/teacher_id therefore also sees
+valid foreign keys. Rows go in through executemany batches. Foreign key and
+unique checks are switched off on MySQL while loading. Ratings are rebuilt from
+the seeded grades at the end (ratings.recompute), grades before ARCHIVED_BEFORE
+are moved to tasks_archive (archive.archive), and the attendance rollups are
+built from the seeded check-ins (attendance.AttendanceCompactor).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, time as dtime
+from itertools import accumulate
+
+from sqlalchemy import create_engine, event, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models  # noqa: E402,F401
+from database import Base, SQLALCHEMY_DATABASE_URL  # noqa: E402
+from migrations import upgrade_to_head  # noqa: E402
+from archive import archive  # noqa: E402
+from attendance import AttendanceCompactor  # noqa: E402
+from ratings import recompute  # noqa: E402
+from utils import hash_password  # noqa: E402
+
+SCALES = {
+    "small": dict(users=2_000, teachers=100, groups=200, tasks=50_000),
+    "medium": dict(users=50_000, teachers=2_000, groups=5_000, tasks=1_000_000),
+    "production": dict(users=500_000, teachers=20_000, groups=50_000, tasks=10_000_000),
+}
+MEMBERSHIPS_PER_STUDENT = ([0, 1, 2, 3, 4, 6], [10, 35, 25, 15, 10, 5])
+MEMBERSHIP_STATUSES = (["accepted", "pending", "rejected"], [75, 15, 10])
+GRADES = ([None, 1, 2, 3, 4, 5], [35, 2, 6, 17, 22, 18])
+# Fixed, so the same seed gives the same rows whenever it runs
+GRADED_UNTIL = datetime(2026, 9, 1)
+ARCHIVED_BEFORE = datetime(2026, 6, 1)  # grades older than this end up in tasks_archive
+ATTENDANCE_DAYS = 20  # har bir guruhning oxirgi dars kunlari
+ATTENDANCE_RATE = 0.85
+HOMEWORKS_PER_GROUP = 12
+VIDEOS_PER_GROUP = 6
+SUBJECTS = ["Matematika", "Fizika", "Kimyo", "Biologiya", "Ingliz tili", "Ona tili", "Tarix", "Informatika"]
+WORDS = ("dars mashq vazifa takrorlash test misol masala nazorat mavzu loyiha "
+         "algebra geometriya grammatika lug'at tajriba tahlil").split()
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _skewed_weights(rng: random.Random, count: int):
+    """Cumulative pareto weights: a few groups/teachers are much bigger than the rest."""
+    return list(accumulate(rng.paretovariate(1.2) for _ in range(count)))
+
+
+class Seeder:
+    def __init__(self, engine, seed: int, batch_size: int, users: int, teachers: int, groups: int, tasks: int):
+        self.engine = engine
+        self.seed = seed
+        self.batch_size = batch_size
+        self.users = users
+        self.teachers = teachers
+        self.groups = groups
+        self.tasks = tasks
+        self.password_hash = hash_password("password")
+        # id 1 - admin, keyin o'qituvchilar, qolganlari talabalar
+        self.teacher_ids = range(2, teachers + 2)
+        self.student_ids = range(teachers + 2, users + 1)
+
+    def rng(self, table: str) -> random.Random:
+        # Each table gets its own stream, so changing one table's counts leaves the others as they were
+        return random.Random(f"{self.seed}:{table}")
+
+    def insert(self, table, rows):
+        started = time.perf_counter()
+        total = 0
+        batch = []
+        with self.engine.begin() as conn:
+            if self.engine.dialect.name == "mysql":
+                conn.execute(text("SET foreign_key_checks = 0, unique_checks = 0"))
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    conn.execute(table.insert(), batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                conn.execute(table.insert(), batch)
+                total += len(batch)
+        elapsed = time.perf_counter() - started
+        print(f"{table.name:<20}{total:>12,} rows {elapsed:8.1f}s {total / max(elapsed, 1e-9):>12,.0f} rows/s")
+
+    def user_rows(self):
+        rng = self.rng("users")
+        for user_id in range(1, self.users + 1):
+            role = "admin" if user_id == 1 else "teacher" if user_id in self.teacher_ids else "student"
+            yield {
+                "id": user_id,
+                "username": f"user{user_id}",
+                "hashed_password": self.password_hash,
+                "role": role,
+                "fullname": f"Foydalanuvchi {user_id}",
+                "phone_number": f"+998{900000000 + user_id}",
+                "passport_image": f"passport_images/{user_id}.jpg" if role == "student" else None,
+                "is_active": rng.random() < 0.97,
+                "verification_code": None,
+            }
+
+    def teacher_rows(self):
+        rng = self.rng("teachers")
+        for teacher_id in self.teacher_ids:
+            yield {
+                "id": teacher_id,
+                "user_id": teacher_id,
+                "name": f"Foydalanuvchi {teacher_id}",
+                "subject": rng.choice(SUBJECTS),
+                "rating": 0.0,
+            }
+
+    def teacher_subjects(self) -> dict:
+        return {row["user_id"]: row["subject"] for row in self.teacher_rows()}
+
+    def student_rows(self):
+        rng = self.rng("students")
+        for student_id in self.student_ids:
+            yield {
+                "id": student_id,
+                "user_id": student_id,
+                "teacher_id": rng.choice(self.teacher_ids),
+                "attendance": 0.0,
+                "attendance_baseline": 0.0,
+                "rating": 0.0,
+            }
+
+    def group_rows(self):
+        rng = self.rng("groups")
+        teacher_weights = _skewed_weights(rng, len(self.teacher_ids))
+        creators = rng.choices(self.teacher_ids, cum_weights=teacher_weights, k=self.groups)
+        for group_id, creator in enumerate(creators, start=1):
+            yield {
+                "id": group_id,
+                "name": f"{rng.choice(SUBJECTS)} {group_id}-guruh",
+                "description": _text(rng, 12),
+                "created_by": creator,
+            }
+
+    def membership_rows(self):
+        rng = self.rng("group_memberships")
+        group_ids = range(1, self.groups + 1)
+        group_weights = _skewed_weights(rng, self.groups)
+        membership_id = 0
+        for student_id in self.student_ids:
+            count = rng.choices(*MEMBERSHIPS_PER_STUDENT)[0]
+            for group_id in set(rng.choices(group_ids, cum_weights=group_weights, k=count)):
+                membership_id += 1
+                yield {
+                    "id": membership_id,
+                    "group_id": group_id,
+                    "student_id": student_id,
+                    "status": rng.choices(*MEMBERSHIP_STATUSES)[0],
+                }
+
+    def homework_rows(self):
+        rng = self.rng("homeworks")
+        for homework_id in range(1, self.groups * HOMEWORKS_PER_GROUP + 1):
+            yield {
+                "id": homework_id,
+                "title": _text(rng, 4).capitalize(),
+                "description": _text(rng, 30),
+                "group_id": rng.randint(1, self.groups),
+            }
+
+    def video_rows(self):
+        rng = self.rng("videos")
+        for video_id in range(1, self.groups * VIDEOS_PER_GROUP + 1):
+            yield {
+                "id": video_id,
+                "title": _text(rng, 4).capitalize(),
+                "video_path": f"uploads/video_{video_id}.mp4",
+                "group_id": rng.randint(1, self.groups),
+            }
+
+    def task_rows(self):
+        rng = self.rng("tasks")
+        # Separate stream, so the columns above keep the values they had before these were added
+        grading_rng = self.rng("tasks:grading")
+        students = self.student_ids
+        descriptions = [_text(rng, 8) for _ in range(1000)]
+        subjects = self.teacher_subjects()
+        for task_id in range(1, self.tasks + 1):
+            # Lessons happen between 08:00 and 18:00, on half-hour slots, for 45-90 minutes
+            start_minutes = 8 * 60 + 30 * rng.randint(0, 19)
+            end_minutes = start_minutes + rng.choice((45, 60, 90))
+            row = {
+                "id": task_id,
+                "teacher_id": rng.choice(self.teacher_ids),
+                "student_id": students[rng.randrange(len(students))],
+                "task_description": descriptions[rng.randrange(1000)],
+                "grade": rng.choices(*GRADES)[0],
+                "video_path": f"uploads/lesson_{task_id % 5000}.mp4",
+                "student_result_path": None,
+                "start_time": dtime(start_minutes // 60, start_minutes % 60),
+                "end_time": dtime(end_minutes // 60, end_minutes % 60),
+                "group_id": grading_rng.randint(1, self.groups),
+                "graded_at": None,
+                "graded_subject": None,
+            }
+            if row["grade"] is not None:
+                row["graded_at"] = GRADED_UNTIL - timedelta(seconds=grading_rng.randrange(180 * 86400))
+                row["graded_subject"] = subjects[row["teacher_id"]]
+            yield row
+
+    def attendance_rows(self, memberships):
+        rng = self.rng("attendance_events")
+        members = {}
+        for group_id, student_id in memberships:
+            members.setdefault(group_id, []).append(student_id)
+        event_id = 0
+        for group_id in sorted(members):
+            lesson_start = timedelta(hours=8 + rng.randint(0, 9))
+            for days_ago in range(ATTENDANCE_DAYS, 0, -1):
+                lesson_day = GRADED_UNTIL - timedelta(days=days_ago) + lesson_start
+                for student_id in members[group_id]:
+                    if rng.random() >= ATTENDANCE_RATE:
+                        continue
+                    event_id += 1
+                    occurred_at = lesson_day + timedelta(seconds=rng.randrange(600))
+                    yield {
+                        "id": event_id,
+                        "student_id": student_id,
+                        "group_id": group_id,
+                        "task_id": None,
+                        "source": "api",
+                        "occurred_at": occurred_at,
+                        "recorded_at": occurred_at,
+                    }
+
+    def run(self):
+        tables = Base.metadata.tables
+        self.insert(tables["users"], self.user_rows())
+        self.insert(tables["teachers"], self.teacher_rows())
+        self.insert(tables["students"], self.student_rows())
+        self.insert(tables["groups"], self.group_rows())
+        self.insert(tables["group_memberships"], self.membership_rows())
+        self.insert(tables["homeworks"], self.homework_rows())
+        self.insert(tables["videos"], self.video_rows())
+        self.insert(tables["tasks"], self.task_rows())
+        started = time.perf_counter()
+        owners = recompute(self.engine, chunk=max(self.batch_size // 10, 100))
+        print(f"{'ratings':<20}{owners:>12,} rows {time.perf_counter() - started:8.1f}s")
+        started = time.perf_counter()
+        archived = archive(self.engine, ARCHIVED_BEFORE, batch=self.batch_size, pause=0)
+        print(f"{'tasks_archive':<20}{archived:>12,} rows {time.perf_counter() - started:8.1f}s")
+        with self.engine.connect() as conn:
+            memberships = conn.execute(text(
+                "SELECT DISTINCT group_id, student_id FROM group_memberships WHERE status = 'accepted' "
+                "ORDER BY group_id, student_id")).all()
+        self.insert(tables["attendance_events"], self.attendance_rows(memberships))
+        started = time.perf_counter()
+        events = AttendanceCompactor(self.engine, settle=0, batch=self.batch_size).compact()
+        print(f"{'attendance_daily':<20}{events:>12,} events {time.perf_counter() - started:8.1f}s")
+
+
+def make_engine(url: str):
+    engine = create_engine(url)
+    if url.startswith("sqlite"):
+        @event.listens_for(engine, "connect")
+        def _fast_sqlite(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode = OFF")
+            cursor.execute("PRAGMA synchronous = OFF")
+            cursor.close()
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--teachers", type=int)
+    parser.add_argument("--groups", type=int)
+    parser.add_argument("--tasks", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--create-schema", action="store_true", help="apply the migrations first")
+    args = parser.parse_args()
+
+    counts = dict(SCALES[args.scale])
+    for name in counts:
+        if getattr(args, name) is not None:
+            counts[name] = getattr(args, name)
+    if counts["teachers"] + 1 >= counts["users"]:
+        parser.error("--users must be larger than --teachers + 1")
+
+    engine = make_engine(args.database_url)
+    if args.create_schema:
+        upgrade_to_head(args.database_url)
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT COUNT(*) FROM users")).scalar():
+            parser.error("target database is not empty")
+
+    started = time.perf_counter()
+    Seeder(engine, args.seed, args.batch_size, **counts).run()
+    print(f"done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Cold start benchmark: how long a new worker takes before it can serve traffic.
+
+    python benchmarks/startup.py --runs 10 --output startup.json
+    python benchmarks/startup.py --baseline benchmarks/startup_baseline.json --max-regression 0.2
+    python benchmarks/startup.py --importtime 20
+
+Each run starts a fresh interpreter, so nothing is cached between runs except
+the OS page cache. "import" is the time to `import main`. "first_response" is
+the time from spawning uvicorn to the first successful GET /, which also
+includes the startup hooks (schema revision check, background threads). The
+database is migrated once before the runs. --importtime lists the packages that
+are slowest to import, using `python -X importtime`.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from flows import BACKEND_DIR, _free_port, migrate
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+
+def _env(database_url: str) -> dict:
+    return {**os.environ, "DATABASE_URL": database_url, "RATE_LIMIT_ENABLED": "0"}
+
+
+def measure_import(database_url: str) -> float:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=_env(database_url),
+                            check=True, capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def measure_first_response(database_url: str, workdir: str) -> float:
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+         "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=_env(database_url),
+    )
+    try:
+        deadline = started + 60
+        while time.perf_counter() < deadline:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1).read()
+                return time.perf_counter() - started
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError("Server exited during startup")
+                time.sleep(0.005)
+        raise RuntimeError("Server did not start in time")
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def slowest_imports(database_url: str, limit: int):
+    """Largest cumulative import time per top-level package (nested packages are counted in their parent too)."""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+                            env=_env(database_url), check=True, capture_output=True, text=True).stderr
+    packages = {}
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = max(packages.get(package, 0), int(cumulative))
+    return sorted(((us, name) for name, us in packages.items()), reverse=True)[:limit]
+
+
+def _summary(values) -> dict:
+    return {
+        "runs": len(values),
+        "median_ms": round(statistics.median(values) * 1000, 1),
+        "min_ms": round(min(values) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1),
+    }
+
+
+def compare(current: dict, baseline: dict, max_regression: float, min_delta_ms: float):
+    regressions = []
+    for name, base in baseline.get("phases", {}).items():
+        now = current["phases"].get(name)
+        if not now:
+            continue
+        limit = base["median_ms"] * (1 + max_regression)
+        if now["median_ms"] > limit and now["median_ms"] - base["median_ms"] > min_delta_ms:
+            regressions.append(f"{name}: median {base['median_ms']} -> {now['median_ms']} ms (limit {limit:.1f})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--database-url", help="default: fresh SQLite file in a temp dir")
+    parser.add_argument("--importtime", type=int, metavar="N", help="also list the N slowest packages to import")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed relative slowdown of the median")
+    parser.add_argument("--min-delta-ms", type=float, default=20.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="startup_")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'startup.db')}"
+    migrate(database_url)
+
+    imports = [measure_import(database_url) for _ in range(args.runs)]
+    first_responses = [measure_first_response(database_url, workdir) for _ in range(args.runs)]
+    results = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "database": database_url.split("://")[0],
+            "python": sys.version.split()[0],
+        },
+        "phases": {"import": _summary(imports), "first_response": _summary(first_responses)},
+    }
+
+    print(f"{'phase':<16}{'runs':>6}{'median':>10}{'min':>10}{'max':>10}")
+    for name, s in results["phases"].items():
+        print(f"{name:<16}{s['runs']:>6}{s['median_ms']:>10}{s['min_ms']:>10}{s['max_ms']:>10}")
+    if args.importtime:
+        print()
+        for cumulative, name in slowest_imports(database_url, args.importtime):
+            print(f"{cumulative / 1000:>10.1f} ms  {name}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression, args.min_delta_ms)
+        for regression in regressions:
+            print("REGRESSION", regression)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
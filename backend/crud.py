@@ -5,6 +5,10 @@ from sqlalchemy.orm import Session
 from models import User, Teacher, Student, Task, Group, GroupMembership, Homework, Video
 from schemas import UserCreate, TeacherCreate, StudentCreate, TaskCreate, GroupCreate, HomeworkCreate, VideoCreate
 from utils import hash_password
+from ratings import apply_grade
+import feed
+import jobs
+import search
 import random
 import string
 
@@ -47,6 +51,7 @@ def create_student(db: Session, student: StudentCreate):
         user_id=student.user_id,
         teacher_id=student.teacher_id,
         attendance=student.attendance,
+        attendance_baseline=student.attendance,  # davomat jurnalidan oldingi qiymat
         rating=student.rating
     )
     db.add(db_student)
@@ -59,10 +64,12 @@ def create_task(db: Session, task: TaskCreate):
         teacher_id=task.teacher_id,
         student_id=task.student_id,
         task_description=task.task_description,
-        grade=task.grade,
-        video_path=task.video_path
+        video_path=task.video_path,
+        group_id=task.group_id
     )
     db.add(db_task)
+    if task.grade is not None:
+        apply_grade(db, db_task, task.grade)
     db.commit()
     db.refresh(db_task)
     return db_task
@@ -74,6 +81,8 @@ def create_group(db: Session, group: GroupCreate, creator_id: int):
         created_by=creator_id
     )
     db.add(db_group)
+    db.flush()
+    search.stage(db, "group", db_group)
     db.commit()
     db.refresh(db_group)
     return db_group
@@ -87,13 +96,21 @@ def add_member(db: Session, group_id: int, student_id: int):
 def create_homework(db: Session, homework: HomeworkCreate):
     db_homework = Homework(**homework.dict())
     db.add(db_homework)
+    db.flush()
+    search.stage(db, "homework", db_homework)
+    feed.fan_out(db, "homework", db_homework)
     db.commit()
     db.refresh(db_homework)
     return db_homework
 
-def create_video(db: Session, video: VideoCreate):
+def create_video(db: Session, video: VideoCreate, user: User = None, notify: bool = False):
     db_video = Video(**video.dict())
     db.add(db_video)
+    db.flush()
+    search.stage(db, "video", db_video)
+    feed.fan_out(db, "video", db_video)
+    # Probing/poster/checksum so'rovdan tashqarida, job worker'da; faqat ilova saqlagan fayllar uchun
+    jobs.enqueue_media(db, db_video, db_video.video_path, user=user, notify=notify)
     db.commit()
     db.refresh(db_video)
     return db_video
@@ -1,23 +1,60 @@
+import os
+from contextvars import ContextVar
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from replicas import DATABASE_REPLICA_URLS, ReplicaSet, RoutingSession
 
 username = "root"
 hostname = "localhost"
 database = "start_up"
 
 
-SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{username}:@{hostname}/{database}"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", f"mysql+pymysql://{username}:@{hostname}/{database}")
+
+def make_engine(url: str):
+    # SQLite (benchmark va testlar uchun) bir nechta thread'dan ishlatiladi
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    return create_engine(url, connect_args=connect_args)
 
 # SQLAlchemy engine and session setup
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = make_engine(SQLALCHEMY_DATABASE_URL)
+# Read replica'lar (DATABASE_REPLICA_URLS, vergul bilan); bo'lmasa hammasi primary'ga
+replica_set = ReplicaSet([make_engine(url) for url in DATABASE_REPLICA_URLS])
+# Katta maktablar o'z bazasida: TENANT_DATABASE_URLS="nom=url,..."; qaysi maktab qayerda - schools.database
+TENANT_DATABASE_URLS = dict(
+    item.strip().split("=", 1) for item in os.getenv("TENANT_DATABASE_URLS", "").split(",") if item.strip()
+)
+shard_engines = {name: make_engine(url) for name, url in TENANT_DATABASE_URLS.items()}
+DEFAULT_DATABASE = "default"
+# Fon ishlari (jobs, outbox, davomat, reyting, lenta) har bir baza bilan alohida ishlaydi
+engines = {DEFAULT_DATABASE: engine, **shard_engines}
+
+def _school_engine(session):
+    from tenancy import school_engine  # tenancy bu modulni import qiladi
+
+    return school_engine(session)
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine,
+                            replicas=replica_set, shard_for=_school_engine)
+# Fon ishlari uchun sessiyalar: maktabsiz (hamma qatorlar), har biri o'z bazasida
+worker_sessions = {
+    DEFAULT_DATABASE: SessionLocal,
+    **{name: sessionmaker(autocommit=False, autoflush=False, bind=shard) for name, shard in shard_engines.items()},
+}
 
 # Base class for our models
 Base = declarative_base()
 
+# Batch so'rovining ketma-ket qismlari bitta sessiyadan foydalanadi (routers/batch.py)
+shared_session: ContextVar = ContextVar("shared_session", default=None)
+
 # Dependency to get the DB session
 def get_db():
+    shared = shared_session.get()
+    if shared is not None:
+        yield shared
+        return
     db = SessionLocal()
     try:
         yield db
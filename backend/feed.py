@@ -0,0 +1,258 @@
+"""Per-student feed of the latest homeworks and videos from their groups.
+
+create_homework/create_video fan the new item out to every accepted member in
+the same transaction: one INSERT ... SELECT into feed_items. A group with more
+than FEED_FANOUT_LIMIT accepted members is switched to fan-out on read instead
+(groups.fanout_on_read, which stays set): its items are read straight from
+homeworks/videos when a member opens the feed and merged with feed_items.
+
+Pages are ordered by (created_at, type, id), newest first; the cursor is the
+last item of the previous page. Each student keeps at most FEED_MAX_ITEMS rows:
+the trimmer thread drops older ones for the groups that received new items
+since its last run, in the database of the school the group belongs to. A student who joins a group gets its latest
+FEED_BACKFILL_ITEMS items, and loses them again when the membership is rejected.
+"""
+import base64
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import and_, delete, event, false, func, insert, literal, or_, select, true
+from sqlalchemy.orm import Session
+
+import tenancy
+from database import engines
+from models import FeedItem, Group, GroupMembership, Homework, Student, Video
+
+logger = logging.getLogger(__name__)
+
+FEED_FANOUT_LIMIT = int(os.getenv("FEED_FANOUT_LIMIT", "2000"))
+FEED_MAX_ITEMS = int(os.getenv("FEED_MAX_ITEMS", "300"))
+FEED_BACKFILL_ITEMS = int(os.getenv("FEED_BACKFILL_ITEMS", "50"))
+FEED_TRIM_INTERVAL = float(os.getenv("FEED_TRIM_INTERVAL", "60"))
+TRIM_BATCH = 200
+MAX_PAGE_SIZE = 50
+
+SOURCES = {"homework": Homework, "video": Video}
+
+feed_items = FeedItem.__table__
+
+
+def _accepted_members(group_id: int):
+    return (
+        select(GroupMembership.student_id)
+        .where(GroupMembership.group_id == group_id, GroupMembership.status == "accepted")
+        .distinct()
+    )
+
+
+def fan_out(db: Session, item_type: str, item):
+    """Puts a new homework/video into its group's feeds; call after flush, before commit."""
+    group = db.get(Group, item.group_id)
+    if group is None:
+        return
+    if not group.fanout_on_read:
+        members = db.execute(
+            select(func.count()).select_from(GroupMembership)
+            .where(GroupMembership.group_id == group.id, GroupMembership.status == "accepted")
+        ).scalar()
+        if members > FEED_FANOUT_LIMIT:
+            logger.info("Group %s has %d members; switching its feed to fan-out on read", group.id, members)
+            group.fanout_on_read = True
+    if group.fanout_on_read:
+        return
+    members = _accepted_members(group.id).subquery()
+    db.execute(insert(feed_items).from_select(
+        ["student_id", "group_id", "item_type", "item_id", "created_at"],
+        select(members.c.student_id, literal(group.id), literal(item_type), literal(item.id),
+               literal(item.created_at, type_=feed_items.c.created_at.type)),
+    ))
+    db.info.setdefault("feed_groups", set()).add(group.id)
+
+
+def backfill(db: Session, student_id: int, group_id: int):
+    """Gives a new member the group's latest items."""
+    group = db.get(Group, group_id)
+    remove(db, student_id, group_id)
+    if group is None or group.fanout_on_read:
+        return
+    for item_type, model in SOURCES.items():
+        latest = (
+            select(literal(student_id), literal(group_id), literal(item_type), model.id, model.created_at)
+            .where(model.group_id == group_id)
+            .order_by(model.created_at.desc(), model.id.desc())
+            .limit(FEED_BACKFILL_ITEMS)
+        )
+        db.execute(insert(feed_items).from_select(
+            ["student_id", "group_id", "item_type", "item_id", "created_at"], latest))
+    db.info.setdefault("feed_groups", set()).add(group_id)
+
+
+def remove(db: Session, student_id: int, group_id: int):
+    db.execute(delete(feed_items).where(feed_items.c.student_id == student_id, feed_items.c.group_id == group_id))
+
+
+# --- O'qish ---
+
+def encode_cursor(created_at: datetime, item_type: str, item_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), item_type, item_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, item_type, item_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), str(item_type), int(item_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _before(created_at_column, type_expression, id_column, item_type: str, cursor):
+    """Rows that sort after the cursor in (created_at, type, id) descending order."""
+    if cursor is None:
+        return true()
+    created_at, cursor_type, cursor_id = cursor
+    if item_type is None:
+        same_time = or_(type_expression < cursor_type, and_(type_expression == cursor_type, id_column < cursor_id))
+    elif item_type < cursor_type:
+        same_time = true()
+    elif item_type == cursor_type:
+        same_time = id_column < cursor_id
+    else:
+        same_time = false()
+    return or_(created_at_column < created_at, and_(created_at_column == created_at, same_time))
+
+
+def page(db: Session, student: Student, cursor: str = None, limit: int = 20) -> dict:
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be 1-{MAX_PAGE_SIZE}")
+    position = decode_cursor(cursor) if cursor else None
+
+    queries = [
+        select(feed_items.c.created_at, feed_items.c.item_type, feed_items.c.item_id)
+        .where(feed_items.c.student_id == student.id,
+               _before(feed_items.c.created_at, feed_items.c.item_type, feed_items.c.item_id, None, position))
+        .order_by(feed_items.c.created_at.desc(), feed_items.c.item_type.desc(), feed_items.c.item_id.desc())
+        .limit(limit + 1)
+    ]
+    large_groups = [
+        group_id for (group_id,) in db.query(Group.id)
+        .join(GroupMembership, GroupMembership.group_id == Group.id)
+        .filter(GroupMembership.student_id == student.id, GroupMembership.status == "accepted",
+                Group.fanout_on_read.is_(True))
+    ]
+    if large_groups:
+        for item_type, model in SOURCES.items():
+            queries.append(
+                select(model.created_at, literal(item_type), model.id)
+                .where(model.group_id.in_(large_groups),
+                       _before(model.created_at, None, model.id, item_type, position))
+                .order_by(model.created_at.desc(), model.id.desc())
+                .limit(limit + 1)
+            )
+
+    # Katta guruh elementlari fan-out qilingan paytdan feed_items'da ham bo'lishi mumkin
+    keys = set()
+    for query in queries:
+        keys.update(tuple(row) for row in db.execute(query))
+    keys = sorted(keys, reverse=True)
+    has_more = len(keys) > limit
+    keys = keys[:limit]
+
+    items = {}
+    for item_type, model in SOURCES.items():
+        ids = [item_id for _, key_type, item_id in keys if key_type == item_type]
+        if ids:
+            for row in db.query(model).filter(model.id.in_(ids)):
+                items[(item_type, row.id)] = row
+    result = []
+    for created_at, item_type, item_id in keys:
+        row = items.get((item_type, item_id))
+        if row is not None:
+            result.append({"type": item_type, "id": item_id, "group_id": row.group_id, "title": row.title,
+                           "created_at": created_at})
+    next_cursor = encode_cursor(*keys[-1]) if has_more and keys else None
+    return {"items": result, "next_cursor": next_cursor}
+
+
+# --- Trim ---
+
+class FeedTrimmer:
+    """Keeps feeds at FEED_MAX_ITEMS rows, for the groups that got new items."""
+
+    def __init__(self, binds: dict, interval: float = FEED_TRIM_INTERVAL, max_items: int = FEED_MAX_ITEMS):
+        self.binds = binds  # database name -> engine
+        self.interval = interval
+        self.max_items = max_items
+        self._groups = set()  # (database, group id)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def touch(self, database: str, group_ids):
+        with self._lock:
+            self._groups.update((database, group_id) for group_id in group_ids)
+
+    def trim_students(self, conn, student_ids) -> int:
+        ranked = (
+            select(feed_items.c.id, func.row_number().over(
+                partition_by=feed_items.c.student_id,
+                order_by=(feed_items.c.created_at.desc(), feed_items.c.item_type.desc(), feed_items.c.item_id.desc()),
+            ).label("position"))
+            .where(feed_items.c.student_id.in_(student_ids))
+            .subquery()
+        )
+        return conn.execute(delete(feed_items).where(
+            feed_items.c.id.in_(select(ranked.c.id).where(ranked.c.position > self.max_items)))).rowcount
+
+    def trim(self) -> int:
+        with self._lock:
+            groups, self._groups = self._groups, set()
+        trimmed = 0
+        for database, group_id in groups:
+            bind = self.binds[database]
+            with bind.connect() as conn:
+                members = conn.execute(_accepted_members(group_id)).scalars().all()
+            for i in range(0, len(members), TRIM_BATCH):
+                with bind.begin() as conn:
+                    trimmed += self.trim_students(conn, members[i:i + TRIM_BATCH])
+        return trimmed
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="feed-trimmer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.interval)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                trimmed = self.trim()
+                if trimmed:
+                    logger.debug("Trimmed %d feed items", trimmed)
+            except Exception:
+                logger.exception("Feed trim failed")
+
+
+trimmer = FeedTrimmer(engines)
+
+
+@event.listens_for(Session, "after_commit")
+def _touch_groups(session):
+    groups = session.info.pop("feed_groups", None)
+    if groups:
+        trimmer.touch(tenancy.database_of(session), groups)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_groups(session):
+    session.info.pop("feed_groups", None)
@@ -0,0 +1,240 @@
+"""Idempotency-Key support for POST/PUT.
+
+A client that retries with the same Idempotency-Key gets the stored response
+back (with `Idempotent-Replayed: true`) instead of running the route again. A
+duplicate that arrives while the first request is still running waits for it,
+then gets its response; after IDEMPOTENCY_WAIT_SECONDS it gets 409. Reusing a
+key for a different request is a 409 as well. Keys are scoped to the caller (bearer
+token, or IP when anonymous) and kept for IDEMPOTENCY_TTL_SECONDS in the
+idempotency_keys table, so all workers share them.
+
+The fingerprint covers method, path, query, content type and length. Small
+non-multipart bodies are hashed as well. Uploads are not read for the
+fingerprint, so a retried upload costs one key lookup.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from database import engine
+from metrics import Counter
+from models import IdempotencyKey
+from rate_limit import client_ip
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+# An in_flight row older than this belongs to a worker that died; a new request may take it over
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "600"))
+IDEMPOTENCY_PURGE_INTERVAL = 300
+IDEMPOTENT_METHODS = {"POST", "PUT"}
+EXCLUDED_PATHS = {"/token"}  # access token'lar bazaga yozilmasin
+MAX_KEY_LENGTH = 255
+MAX_FINGERPRINT_BODY = 64 * 1024
+MAX_STORED_BODY = 64 * 1024
+POLL_INTERVAL = 0.25
+
+idempotency_requests_total = Counter(
+    "idempotency_requests_total", "Requests with an Idempotency-Key by outcome.", ("outcome",))
+
+table = IdempotencyKey.__table__
+
+
+class IdempotencyStore:
+    def __init__(self, bind):
+        self.bind = bind
+
+    def begin(self, key: str, fingerprint: str):
+        """Returns ("new", None), ("replay", row), ("in_flight", None) or ("mismatch", None)."""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        for _ in range(3):
+            try:
+                with self.bind.begin() as conn:
+                    conn.execute(insert(table).values(
+                        key=key, fingerprint=fingerprint, status="in_flight", created_at=now, expires_at=expires_at))
+                return "new", None
+            except IntegrityError:
+                pass
+            with self.bind.begin() as conn:
+                row = conn.execute(select(table).where(table.c.key == key)).first()
+                if row is None:
+                    continue  # deleted in between; try the insert again
+                stale = row.expires_at <= now or (
+                    row.status == "in_flight" and row.created_at <= now - timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT))
+                if stale:
+                    # created_at in the WHERE clause: only one request can take the row over
+                    taken = conn.execute(
+                        update(table)
+                        .where(table.c.key == key, table.c.created_at == row.created_at)
+                        .values(fingerprint=fingerprint, status="in_flight", response_status=None,
+                                response_headers=None, response_body=None, created_at=now, expires_at=expires_at)
+                    ).rowcount
+                    if taken:
+                        return "new", None
+                    continue
+                if row.fingerprint != fingerprint:
+                    return "mismatch", None
+                if row.status == "done":
+                    return "replay", row
+                return "in_flight", None
+        return "in_flight", None
+
+    def complete(self, key: str, status: int, headers, body: bytes):
+        with self.bind.begin() as conn:
+            conn.execute(update(table).where(table.c.key == key).values(
+                status="done", response_status=status, response_headers=json.dumps(headers), response_body=body))
+
+    def release(self, key: str):
+        with self.bind.begin() as conn:
+            conn.execute(delete(table).where(table.c.key == key, table.c.status == "in_flight"))
+
+    def purge_expired(self):
+        with self.bind.begin() as conn:
+            return conn.execute(delete(table).where(table.c.expires_at < datetime.utcnow())).rowcount
+
+
+def _header(scope, name: bytes):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value
+    return None
+
+
+async def _read_body(receive):
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    body = b"".join(chunks)
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+
+async def _send_json(send, status: int, detail: str, extra_headers=()):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    *extra_headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, store: IdempotencyStore = None):
+        self.app = app
+        self.store = store or IdempotencyStore(engine)
+        self._local = {}  # key -> asyncio.Event for requests running in this worker
+        self._last_purge = time.monotonic()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in IDEMPOTENT_METHODS or scope["path"] in EXCLUDED_PATHS:
+            return await self.app(scope, receive, send)
+        raw_key = _header(scope, b"idempotency-key")
+        if raw_key is None:
+            return await self.app(scope, receive, send)
+        if not raw_key or len(raw_key) > MAX_KEY_LENGTH:
+            return await _send_json(send, 400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+        principal = _header(scope, b"authorization") or client_ip(scope).encode()
+        key = hashlib.sha256(b"|".join([principal, scope["method"].encode(), scope["path"].encode(), raw_key])).hexdigest()
+        fingerprint, receive = await self._fingerprint(scope, receive)
+
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            outcome, row = await run_in_threadpool(self.store.begin, key, fingerprint)
+            if outcome != "in_flight":
+                break
+            if time.monotonic() >= deadline:
+                idempotency_requests_total.inc("conflict")
+                return await _send_json(send, 409, "A request with this Idempotency-Key is still in progress",
+                                        [(b"retry-after", b"1")])
+            local = self._local.get(key)
+            if local is not None:
+                try:
+                    await asyncio.wait_for(local.wait(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(POLL_INTERVAL)  # running in another worker
+
+        idempotency_requests_total.inc(outcome)
+        if outcome == "mismatch":
+            return await _send_json(send, 409, "Idempotency-Key was already used for a different request")
+        if outcome == "replay":
+            headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(row.response_headers)]
+            await send({"type": "http.response.start", "status": row.response_status,
+                        "headers": headers + [(b"idempotent-replayed", b"true")]})
+            await send({"type": "http.response.body", "body": row.response_body or b""})
+            return
+
+        await self._run(key, scope, receive, send)
+        if time.monotonic() - self._last_purge > IDEMPOTENCY_PURGE_INTERVAL:
+            self._last_purge = time.monotonic()
+            purged = await run_in_threadpool(self.store.purge_expired)
+            logger.debug("Purged %d expired idempotency keys", purged)
+
+    async def _fingerprint(self, scope, receive):
+        content_type = (_header(scope, b"content-type") or b"").split(b";")[0].strip()
+        length = _header(scope, b"content-length")
+        parts = [scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""),
+                 content_type, length or b""]
+        # Multipart boundaries change between retries and uploads are large: the length is enough
+        if content_type != b"multipart/form-data" and length is not None and int(length) <= MAX_FINGERPRINT_BODY:
+            body, receive = await _read_body(receive)
+            parts.append(body)
+        return hashlib.sha256(b"\0".join(parts)).hexdigest(), receive
+
+    async def _run(self, key, scope, receive, send):
+        event = self._local[key] = asyncio.Event()
+        response = {"status": None, "headers": [], "body": bytearray(), "too_big": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [(name.decode("latin-1"), value.decode("latin-1"))
+                                       for name, value in message.get("headers", [])]
+            elif message["type"] == "http.response.body" and not response["too_big"]:
+                response["body"] += message.get("body", b"")
+                response["too_big"] = len(response["body"]) > MAX_STORED_BODY
+            await send(message)
+
+        try:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            except BaseException:
+                await run_in_threadpool(self.store.release, key)
+                raise
+            status = response["status"]
+            # 5xx/409/429 are not final answers: the client may retry them for real
+            if status is None or status >= 500 or status in (409, 429) or response["too_big"]:
+                await run_in_threadpool(self.store.release, key)
+            else:
+                await run_in_threadpool(self.store.complete, key, status, response["headers"], bytes(response["body"]))
+        finally:
+            # Waiters in this worker re-read the row only once it is stored
+            self._local.pop(key, None)
+            event.set()
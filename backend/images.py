@@ -0,0 +1,132 @@
+"""Passport photo processing.
+
+receive() runs in the request: it stores the upload under passport_images/incoming,
+below the school's storage prefix if it has one (at most PASSPORT_MAX_BYTES),
+and reads the image header, so a file that is not a JPEG/PNG/WebP photo is
+refused before a user is created.
+
+process_passport() runs in the job worker processes (see jobs.py), so like
+media.py this module has no database imports. It decodes the whole image,
+turns it upright according to its EXIF orientation, and writes two files with
+no metadata at all: a JPEG of at most PASSPORT_MAX_SIDE pixels a side, which
+replaces the upload, and a PASSPORT_THUMB_SIDE WebP thumbnail for the admin
+review list. Every run writes new file names, so a name never changes content.
+"""
+import os
+import uuid
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+PASSPORT_DIR = "passport_images"
+INCOMING_DIR = "incoming"  # under the root (PASSPORT_DIR, or a school's prefix + PASSPORT_DIR)
+THUMBNAIL_DIR = "thumbs"
+PASSPORT_MAX_BYTES = int(os.getenv("PASSPORT_MAX_BYTES", str(15 * 1024 * 1024)))
+PASSPORT_MAX_PIXELS = int(os.getenv("PASSPORT_MAX_PIXELS", str(60_000_000)))  # decompression bomb guard
+PASSPORT_MAX_SIDE = int(os.getenv("PASSPORT_MAX_SIDE", "2000"))
+PASSPORT_THUMB_SIDE = int(os.getenv("PASSPORT_THUMB_SIDE", "256"))
+JPEG_QUALITY = 85
+WEBP_QUALITY = 70
+ALLOWED_FORMATS = {"JPEG", "MPO", "PNG", "WEBP"}  # MPO: JPEG with a depth map, from some phones
+CHUNK = 1024 * 1024
+
+
+class ImageError(Exception):
+    """The upload is not a usable photo; retrying will not help."""
+
+    permanent = True
+
+
+class ImageTooLarge(ImageError):
+    pass
+
+
+def check_header(path: str):
+    """(format, width, height) from the header only; the pixels are not decoded."""
+    try:
+        with Image.open(path) as image:
+            image_format, (width, height) = image.format, image.size
+    except Image.DecompressionBombError:
+        raise ImageError("Image has too many pixels")
+    except (UnidentifiedImageError, OSError):
+        raise ImageError("File is not an image")
+    if image_format not in ALLOWED_FORMATS:
+        raise ImageError(f"Unsupported image format: {image_format}")
+    if width * height > PASSPORT_MAX_PIXELS:
+        raise ImageError(f"Image is too large: {width}x{height}")
+    return image_format, width, height
+
+
+def receive(fileobj, max_bytes: int = PASSPORT_MAX_BYTES, root: str = PASSPORT_DIR) -> str:
+    """Stores an upload in root/INCOMING_DIR and checks its header; returns the path."""
+    os.makedirs(os.path.join(root, INCOMING_DIR), exist_ok=True)
+    path = os.path.join(root, INCOMING_DIR, uuid.uuid4().hex)
+    written = 0
+    try:
+        with open(path, "wb") as buffer:
+            for chunk in iter(lambda: fileobj.read(CHUNK), b""):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise ImageTooLarge(f"Image must be at most {max_bytes // (1024 * 1024)} MB")
+                buffer.write(chunk)
+        check_header(path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def output_paths(user_id: int, root: str = PASSPORT_DIR):
+    """(original, thumbnail) file names for a new version of the user's photo."""
+    name = f"{user_id}-{uuid.uuid4().hex[:12]}"
+    return os.path.join(root, f"{name}.jpg"), os.path.join(root, THUMBNAIL_DIR, f"{name}.webp")
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _save(image: Image.Image, path: str, image_format: str, **options) -> int:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + ".part"
+    # No exif/icc_profile arguments: Pillow then writes no metadata
+    image.save(partial, image_format, **options)
+    os.replace(partial, path)
+    return os.path.getsize(path)
+
+
+def process_passport(source: str, original_path: str, thumbnail_path: str, remove_source: bool = True) -> dict:
+    """Returns the new paths and sizes; raises ImageError for a bad file."""
+    Image.MAX_IMAGE_PIXELS = PASSPORT_MAX_PIXELS
+    if not os.path.isfile(source):
+        raise ImageError(f"File not found: {source}")
+    check_header(source)
+    source_bytes = os.path.getsize(source)
+    try:
+        with Image.open(source) as opened:
+            opened.load()
+            image = _flatten(ImageOps.exif_transpose(opened))
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise ImageError(f"Image could not be decoded: {e}")
+
+    original = image.copy()
+    original.thumbnail((PASSPORT_MAX_SIDE, PASSPORT_MAX_SIDE), Image.LANCZOS)
+    original_bytes = _save(original, original_path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    thumbnail = image.copy()
+    thumbnail.thumbnail((PASSPORT_THUMB_SIDE, PASSPORT_THUMB_SIDE), Image.LANCZOS)
+    thumbnail_bytes = _save(thumbnail, thumbnail_path, "WEBP", quality=WEBP_QUALITY, method=4)
+    if remove_source and os.path.abspath(source) != os.path.abspath(original_path):
+        os.remove(source)
+    return {
+        "path": original_path,
+        "thumbnail_path": thumbnail_path,
+        "width": original.width,
+        "height": original.height,
+        "bytes": original_bytes,
+        "thumbnail_bytes": thumbnail_bytes,
+        "source_bytes": source_bytes,
+    }
@@ -0,0 +1,133 @@
+"""`include=` support for list/detail endpoints.
+
+    GET /teacher/groups/7?include=members.student.user,homeworks,videos
+
+Each include maps to a relationship and a loader strategy: joinedload for
+many-to-one, selectinload for collections. A response therefore needs one query
+for the root rows plus one per included collection, however many rows come
+back. Relationships that were not included are never lazy loaded: the root
+query uses raiseload("*") and the serializer only follows included paths.
+"""
+from fastapi import HTTPException
+from sqlalchemy.orm import joinedload, raiseload, selectinload
+
+from models import Group, GroupMembership, Homework, Student, Task, TaskArchive, Teacher, User, Video
+
+MAX_INCLUDE_DEPTH = 3
+MAX_INCLUDE_PATHS = 6
+MAX_PAGE_SIZE = 100
+# Collections multiply the response size, so list pages are smaller when one is included
+MAX_PAGE_SIZE_WITH_COLLECTIONS = 20
+
+HIDDEN_COLUMNS = {"hashed_password", "verification_code"}
+
+# include name -> (relationship attribute, "joined" | "selectin", nested includes)
+USER_INCLUDES = {}
+TEACHER_INCLUDES = {"user": ("user", "joined", USER_INCLUDES)}
+STUDENT_INCLUDES = {
+    "user": ("user", "joined", USER_INCLUDES),
+    "teacher": ("teacher", "joined", TEACHER_INCLUDES),
+}
+MEMBERSHIP_INCLUDES = {"student": ("student", "joined", STUDENT_INCLUDES)}
+GROUP_INCLUDES = {
+    "creator": ("creator", "joined", TEACHER_INCLUDES),
+    "members": ("memberships", "selectin", MEMBERSHIP_INCLUDES),
+    "homeworks": ("homeworks", "selectin", {}),
+    "videos": ("videos", "selectin", {}),
+}
+MEMBERSHIP_INCLUDES["group"] = ("group", "joined", GROUP_INCLUDES)
+STUDENT_INCLUDES["memberships"] = ("group_memberships", "selectin", MEMBERSHIP_INCLUDES)
+STUDENT_INCLUDES["tasks"] = ("tasks", "selectin", {})
+TASK_INCLUDES = {
+    "student": ("student", "joined", STUDENT_INCLUDES),
+    "teacher": ("teacher", "joined", TEACHER_INCLUDES),
+}
+
+RESOURCES = {
+    Group: GROUP_INCLUDES,
+    Student: STUDENT_INCLUDES,
+    Task: TASK_INCLUDES,
+    TaskArchive: TASK_INCLUDES,
+    Teacher: TEACHER_INCLUDES,
+    User: USER_INCLUDES,
+    GroupMembership: MEMBERSHIP_INCLUDES,
+    Homework: {},
+    Video: {},
+}
+
+
+def parse_include(raw, model) -> dict:
+    """"a.b,c" -> {"a": {"b": {}}, "c": {}}; unknown or too deep/wide includes are a 400."""
+    tree = {}
+    if not raw:
+        return tree
+    paths = [path.strip() for path in raw.split(",") if path.strip()]
+    if len(paths) > MAX_INCLUDE_PATHS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_INCLUDE_PATHS} includes are allowed")
+    for path in paths:
+        names = path.split(".")
+        if len(names) > MAX_INCLUDE_DEPTH:
+            raise HTTPException(status_code=400, detail=f"Include '{path}' is deeper than {MAX_INCLUDE_DEPTH}")
+        spec, node = RESOURCES[model], tree
+        for name in names:
+            if name not in spec:
+                raise HTTPException(status_code=400, detail=f"Unknown include '{path}'; allowed: {', '.join(sorted(spec)) or 'none'}")
+            node = node.setdefault(name, {})
+            spec = spec[name][2]
+    return tree
+
+
+def has_collection(model, tree: dict) -> bool:
+    spec = RESOURCES[model]
+    for name, children in tree.items():
+        attribute, strategy, _ = spec[name]
+        if strategy == "selectin":
+            return True
+        if has_collection(getattr(model, attribute).property.mapper.class_, children):
+            return True
+    return False
+
+
+def check_page_size(limit: int, model, tree: dict):
+    maximum = MAX_PAGE_SIZE_WITH_COLLECTIONS if has_collection(model, tree) else MAX_PAGE_SIZE
+    if limit > maximum:
+        raise HTTPException(status_code=400, detail=f"limit must be at most {maximum} with these includes")
+
+
+def loader_options(model, tree: dict) -> list:
+    options = []
+
+    def walk(current, node, loader):
+        spec = RESOURCES[current]
+        for name, children in node.items():
+            attribute, strategy, _ = spec[name]
+            relationship = getattr(current, attribute)
+            if loader is None:
+                child = (selectinload if strategy == "selectin" else joinedload)(relationship)
+            else:
+                child = loader.selectinload(relationship) if strategy == "selectin" else loader.joinedload(relationship)
+            target = relationship.property.mapper.class_
+            if children:
+                walk(target, children, child)
+            else:
+                options.append(child)
+
+    walk(model, tree, None)
+    options.append(raiseload("*"))
+    return options
+
+
+def serialize(obj, tree: dict) -> dict:
+    data = {
+        column.key: getattr(obj, column.key)
+        for column in obj.__mapper__.column_attrs
+        if column.key not in HIDDEN_COLUMNS
+    }
+    spec = RESOURCES[type(obj)]
+    for name, children in tree.items():
+        value = getattr(obj, spec[name][0])
+        if isinstance(value, list):
+            data[name] = [serialize(item, children) for item in value]
+        else:
+            data[name] = serialize(value, children) if value is not None else None
+    return data
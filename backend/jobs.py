@@ -0,0 +1,428 @@
+"""Background jobs, run in a process pool.
+
+Routes add a jobs row with enqueue() in their own transaction, so a job exists
+exactly when the upload it belongs to is committed. JobRunner claims queued
+jobs with SELECT ... FOR UPDATE SKIP LOCKED, like the outbox dispatcher, and
+hands them to a ProcessPoolExecutor started with "spawn": a handler never runs
+on the API's event loop or its threads, and a CPU-bound or crashing handler
+cannot hold up requests. The runner is a thread in every API worker
+(JOB_WORKERS pool processes; 0 turns it off there) or a process of its own:
+
+    python jobs.py --workers 4
+    python jobs.py --backfill-passports   # queue thumbnails for photos stored before the pipeline
+
+A runner claims from every database in database.engines (schools on their own
+database keep their jobs there) into one pool, starting with a different
+database each time. It has at most its pool size of jobs in flight, and at
+most Kind.max_running jobs of one kind run per database across all runners
+(counted when claiming, so concurrent claims can overshoot it briefly). A claimed job holds a
+lease of Kind.timeout seconds; when its runner dies, another one takes it over
+after the lease runs out. Failures are retried with exponential backoff up to
+Kind.max_attempts; an error with `permanent = True` (media.MediaError) fails
+the job at once. Clients poll GET /teacher/jobs/{id}; a job queued with
+`notify` (opt-in per upload) also sends its final status through the outbox.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, event, func, or_
+from sqlalchemy.orm import Session
+
+import images
+import media
+import tenancy
+from database import DEFAULT_DATABASE, worker_sessions
+from metrics import Counter
+from models import Job, Task, User, Video
+from notifications import enqueue_message
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # pool processes per API worker; 0: run `python jobs.py`
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_BACKOFF_BASE = 10.0  # seconds, doubled per attempt
+JOB_BACKOFF_MAX = 900.0
+JOB_MEDIA_CONCURRENCY = int(os.getenv("JOB_MEDIA_CONCURRENCY", "4"))
+JOB_IMAGE_CONCURRENCY = int(os.getenv("JOB_IMAGE_CONCURRENCY", "8"))
+FINAL_STATUSES = ("succeeded", "failed")
+
+jobs_total = Counter("jobs_total", "Finished job attempts by kind and outcome.", ("kind", "outcome"))
+
+
+class Kind:
+    def __init__(self, func, on_done=None, max_attempts: int = 3, max_running: int = 4, timeout: float = 3600):
+        self.func = func  # module-level function: it is pickled by name for the pool
+        self.on_done = on_done  # on_done(db, job) in the runner, once the job is final
+        self.max_attempts = max_attempts
+        self.max_running = max_running
+        self.timeout = timeout
+
+
+KINDS = {}
+
+
+def register_kind(name: str, func, **options):
+    KINDS[name] = Kind(func, **options)
+
+
+def enqueue(db: Session, kind: str, payload: dict, target=None, created_by: int = None, notify: str = None) -> Job:
+    """Adds a job. The caller commits it together with its own rows; target: (type, id)."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    target_type, target_id = target or (None, None)
+    job = Job(kind=kind, payload=payload, target_type=target_type, target_id=target_id, status="queued",
+              attempts=0, run_after=datetime.utcnow(), created_by=created_by, notify=notify)
+    db.add(job)
+    db.info["jobs_enqueued"] = True
+    return job
+
+
+def describe(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "target_type": job.target_type,
+        "target_id": job.target_id,
+        "result": job.result,
+        "last_error": job.last_error,
+        "run_after": job.run_after,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class JobRunner:
+    def __init__(self, session_factories: dict = None, workers: int = JOB_WORKERS,
+                 poll_interval: float = JOB_POLL_INTERVAL):
+        self.session_factories = session_factories or worker_sessions  # database name -> sessionmaker
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._pool = None
+        self._inflight = {}  # future -> (database, job id)
+        self._turn = 0  # which database is claimed from first
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def wake(self):
+        self._wake.set()
+
+    def start(self):
+        if self.workers <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="job-runner", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        # Unfinished jobs go back to the queue now instead of after their lease
+        inflight = {}
+        for database, job_id in self._inflight.values():
+            inflight.setdefault(database, []).append(job_id)
+        for database, job_ids in inflight.items():
+            self._release(database, job_ids)
+        self._inflight.clear()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _run(self):
+        self._pool = self._new_pool()
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Job runner iteration failed")
+            if self._inflight:
+                wait(list(self._inflight), timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+            else:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def run_once(self) -> int:
+        """Records finished jobs and submits new ones; returns how many were submitted."""
+        self._reap()
+        databases = list(self.session_factories)
+        self._turn = (self._turn + 1) % len(databases)
+        submitted = 0
+        for database in databases[self._turn:] + databases[:self._turn]:
+            free = self.workers - len(self._inflight)
+            if free <= 0:
+                break
+            for job_id, kind, payload in self._claim(database, free):
+                future = self._pool.submit(KINDS[kind].func, **payload)
+                self._inflight[future] = (database, job_id)
+                submitted += 1
+        return submitted
+
+    def _reap(self):
+        broken = False
+        for future in [future for future in self._inflight if future.done()]:
+            database, job_id = self._inflight.pop(future)
+            error = future.exception()
+            broken = broken or isinstance(error, BrokenProcessPool)
+            try:
+                self._finish(database, job_id, None if error else future.result(), error)
+            except Exception:
+                logger.exception("Could not record the result of job %s", job_id)
+        if broken:
+            # A pool process died (e.g. OOM); the pool cannot be used any more
+            logger.error("Job process pool broke; starting a new one")
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._new_pool()
+
+    def _claim(self, database: str, limit: int):
+        db = self.session_factories[database]()
+        try:
+            now = datetime.utcnow()
+            running = dict(
+                db.query(Job.kind, func.count())
+                .filter(Job.status == "running", Job.locked_until > now).group_by(Job.kind).all()
+            )
+            kinds = [name for name, kind in KINDS.items() if running.get(name, 0) < kind.max_running]
+            if not kinds:
+                return []
+            jobs = (
+                db.query(Job)
+                .filter(Job.kind.in_(kinds), or_(
+                    and_(Job.status == "queued", Job.run_after <= now),
+                    and_(Job.status == "running", Job.locked_until <= now),  # its runner is gone
+                ))
+                .order_by(Job.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            claimed = []
+            for job in jobs:
+                kind = KINDS[job.kind]
+                if job.status == "running" and job.attempts >= kind.max_attempts:
+                    self._final(db, job, "failed", error="Lease expired on the last attempt")
+                    continue
+                if running.get(job.kind, 0) >= kind.max_running:
+                    continue
+                running[job.kind] = running.get(job.kind, 0) + 1
+                job.status = "running"
+                job.attempts = (job.attempts or 0) + 1
+                job.locked_by = self.id
+                job.locked_until = now + timedelta(seconds=kind.timeout)
+                claimed.append((job.id, job.kind, dict(job.payload or {})))
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def _finish(self, database: str, job_id: int, result, error):
+        db = self.session_factories[database]()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).with_for_update().first()
+            if job is None or job.status != "running" or job.locked_by != self.id:
+                return  # the lease ran out and another runner has the job now
+            kind = KINDS.get(job.kind)
+            if error is None:
+                self._final(db, job, "succeeded", result=result)
+            elif getattr(error, "permanent", False) or kind is None or job.attempts >= kind.max_attempts:
+                self._final(db, job, "failed", error=error)
+            else:
+                delay = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * 2 ** (job.attempts - 1))
+                job.status = "queued"
+                job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+                job.last_error = _error_text(error)
+                job.locked_by = job.locked_until = None
+                jobs_total.inc(job.kind, "retried")
+            db.commit()
+        finally:
+            db.close()
+
+    def _final(self, db: Session, job: Job, status: str, result=None, error=None):
+        job.status = status
+        job.result = result
+        job.last_error = _error_text(error) if error is not None else None
+        job.finished_at = datetime.utcnow()
+        job.locked_by = job.locked_until = None
+        jobs_total.inc(job.kind, status)
+        kind = KINDS.get(job.kind)
+        if kind is not None and kind.on_done is not None:
+            kind.on_done(db, job)
+        if job.notify:
+            text = f"Ish #{job.id} bajarildi" if status == "succeeded" else f"Ish #{job.id} bajarilmadi: {job.last_error}"
+            enqueue_message(db, "sms", job.notify, text, dedup_key=f"job:{job.id}:{status}")
+
+    def _release(self, database: str, job_ids):
+        if not job_ids:
+            return
+        db = self.session_factories[database]()
+        try:
+            (db.query(Job)
+             .filter(Job.id.in_(job_ids), Job.status == "running", Job.locked_by == self.id)
+             .update({Job.status: "queued", Job.attempts: Job.attempts - 1, Job.locked_by: None,
+                      Job.locked_until: None, Job.run_after: datetime.utcnow()}, synchronize_session=False))
+            db.commit()
+        except Exception:
+            logger.exception("Could not release unfinished jobs")
+        finally:
+            db.close()
+
+
+def _error_text(error) -> str:
+    return (str(error) or type(error).__name__)[:255]
+
+
+# --- Media ---
+
+MEDIA_TARGETS = {"task": Task, "video": Video}
+
+
+def _media_done(db: Session, job: Job):
+    model = MEDIA_TARGETS.get(job.target_type)
+    target = db.get(model, job.target_id) if model else None
+    if target is None:
+        return
+    if job.status == "succeeded":
+        target.media_status, target.media_info = "ready", job.result
+    else:
+        target.media_status, target.media_info = "failed", {"error": job.last_error}
+
+
+register_kind("media.process", media.process, on_done=_media_done, max_running=JOB_MEDIA_CONCURRENCY,
+              timeout=media.MEDIA_TRANSCODE_TIMEOUT + 2 * media.MEDIA_PROBE_TIMEOUT)
+
+
+def stored_upload(path: str, school_id) -> bool:
+    """Whether path is inside the uploads directory the app saves the school's videos to."""
+    root = os.path.realpath(tenancy.storage_path(school_id, media.UPLOADS_DIR))
+    resolved = os.path.realpath(path)
+    return resolved != root and os.path.commonpath([root, resolved]) == root
+
+
+def enqueue_media(db: Session, target, path: str, expected_size: int = None, user=None,
+                  notify: bool = False) -> Job:
+    """Queues media.process for a task/video that has just been flushed.
+
+    media.process reads the file and writes posters next to it, so only files
+    the app stored itself are queued; for any other path (a link, a client's
+    string) nothing is queued and None is returned. With notify the user gets
+    an SMS when the job is finished.
+    """
+    if not stored_upload(path, target.school_id):
+        return None
+    target_type = "task" if isinstance(target, Task) else "video"
+    target.media_status = "pending"
+    return enqueue(db, "media.process", {"path": path, "expected_size": expected_size}, target=(target_type, target.id),
+                   created_by=user.id if user else None,
+                   notify=user.phone_number if user is not None and notify else None)
+
+
+# --- Passport ---
+
+def _passport_done(db: Session, job: Job):
+    user = db.get(User, job.target_id)
+    # A newer upload has replaced this one meanwhile
+    if user is None or user.passport_image != job.payload.get("source"):
+        return
+    if job.status == "succeeded":
+        user.passport_image, user.passport_thumbnail = job.result["path"], job.result["thumbnail_path"]
+        user.passport_status = "ready"
+    else:
+        user.passport_status = "failed"
+
+
+register_kind("passport.process", images.process_passport, on_done=_passport_done,
+              max_running=JOB_IMAGE_CONCURRENCY, timeout=300)
+
+
+def enqueue_passport(db: Session, user: User, remove_source: bool = True) -> Job:
+    """Queues thumbnailing of user.passport_image; the user must be flushed."""
+    original_path, thumbnail_path = images.output_paths(
+        user.id, root=tenancy.storage_path(user.school_id, images.PASSPORT_DIR))
+    user.passport_status = "pending"
+    payload = {"source": user.passport_image, "original_path": original_path, "thumbnail_path": thumbnail_path,
+               "remove_source": remove_source}
+    return enqueue(db, "passport.process", payload, target=("user", user.id))
+
+
+def backfill_passports(session_factory=worker_sessions[DEFAULT_DATABASE], batch: int = 500) -> int:
+    """Queues photos stored before the pipeline existed. They are kept, not replaced."""
+    queued = 0
+    last_id = 0
+    while True:
+        db = session_factory()
+        try:
+            users = (
+                db.query(User)
+                .filter(User.id > last_id, User.passport_image.isnot(None), User.passport_status.is_(None))
+                .order_by(User.id).limit(batch).all()
+            )
+            if not users:
+                return queued
+            for user in users:
+                enqueue_passport(db, user, remove_source=False)
+            db.commit()
+            queued += len(users)
+            last_id = users[-1].id
+        finally:
+            db.close()
+
+
+runner = JobRunner()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_runner(session):
+    if session.info.pop("jobs_enqueued", None):
+        runner.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_enqueued(session):
+    session.info.pop("jobs_enqueued", None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="pool processes")
+    parser.add_argument("--backfill-passports", action="store_true",
+                        help="queue thumbnails for passport photos that have none, then exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.backfill_passports:
+        for database, session_factory in worker_sessions.items():
+            print(f"{database}: {backfill_passports(session_factory)} passport photos queued")
+        return
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    worker = JobRunner(workers=args.workers)
+    worker.start()
+    logger.info("Job runner %s started with %d processes", worker.id, args.workers)
+    try:
+        while not stopped.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""Student leaderboards: every school and every group.
+
+Each board is a sorted set of student id -> rating (students with at least one
+grade; accepted members only for group boards). Rank, top-K and around-me pages
+are a bisect/ZREVRANK away instead of an ORDER BY over every student. Ties are
+ordered by student id, descending (compared as strings by Redis).
+
+Grading and membership changes stage their board updates on the session
+(`stage()`); they are applied after the commit, so a rolled back request never
+shows up on a board. Boards are rebuilt from every database in
+database.engines when the app starts. Group ids repeat across databases, so a
+group board is named after its school as well (school ids are global).
+
+MemorySortedSets keeps boards in the worker, so each worker only sees its own
+updates between rebuilds; LEADERBOARD_REBUILD_SECONDS bounds how stale the
+others get. With LEADERBOARD_REDIS_URL set, all workers share the Redis sorted
+sets and only the startup rebuild runs.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+import uuid
+
+from fastapi import HTTPException
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from database import engines
+from models import GroupMembership, Student, User
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_REDIS_URL = os.getenv("LEADERBOARD_REDIS_URL")  # unset: per-process boards
+LEADERBOARD_REBUILD_SECONDS = float(os.getenv("LEADERBOARD_REBUILD_SECONDS", "600"))
+MAX_PAGE_SIZE = 100
+MAX_AROUND_RADIUS = 25
+REBUILD_BATCH = 5000
+
+def school_board(school_id: int) -> str:
+    return f"school:{school_id}"
+
+
+def group_board(school_id: int, group_id: int) -> str:
+    return f"school:{school_id}:group:{group_id}"
+
+
+class MemorySortedSets:
+    """Sorted sets in this process, with the semantics the Redis backend has."""
+
+    is_remote = False
+
+    def __init__(self):
+        self._boards = {}  # board -> (member -> score, sorted [(score, member)])
+        self._lock = threading.Lock()
+
+    def set(self, board: str, member: int, score: float):
+        with self._lock:
+            scores, index = self._boards.setdefault(board, ({}, []))
+            old = scores.get(member)
+            if old is not None:
+                del index[bisect.bisect_left(index, (old, member))]
+            scores[member] = score
+            bisect.insort(index, (score, member))
+
+    def remove(self, board: str, member: int):
+        with self._lock:
+            scores, index = self._boards.get(board, ({}, []))
+            old = scores.pop(member, None)
+            if old is not None:
+                del index[bisect.bisect_left(index, (old, member))]
+
+    def rank(self, board: str, member: int):
+        """0-based position from the top, or None."""
+        with self._lock:
+            scores, index = self._boards.get(board, ({}, []))
+            score = scores.get(member)
+            if score is None:
+                return None
+            return len(index) - 1 - bisect.bisect_left(index, (score, member))
+
+    def score(self, board: str, member: int):
+        with self._lock:
+            return self._boards.get(board, ({}, []))[0].get(member)
+
+    def range(self, board: str, start: int, stop: int):
+        """[(member, score)] for positions start..stop-1 from the top."""
+        with self._lock:
+            index = self._boards.get(board, ({}, []))[1]
+            size = len(index)
+            start, stop = max(start, 0), min(stop, size)
+            if start >= stop:
+                return []
+            return [(member, score) for score, member in reversed(index[size - stop:size - start])]
+
+    def size(self, board: str) -> int:
+        with self._lock:
+            return len(self._boards.get(board, ({}, []))[1])
+
+    def replace(self, boards: dict):
+        built = {}
+        for board, scores in boards.items():
+            built[board] = (scores, sorted((score, member) for member, score in scores.items()))
+        with self._lock:
+            self._boards = built
+
+
+class RedisSortedSets:
+    """One Redis sorted set per board. Needs the `redis` package."""
+
+    is_remote = True
+
+    def __init__(self, url: str, prefix: str = "lb:"):
+        import redis  # only needed when this backend is configured
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._boards_key = prefix + "boards"  # every board that exists, to drop the empty ones on rebuild
+
+    def _key(self, board: str) -> str:
+        return self.prefix + board
+
+    def set(self, board: str, member: int, score: float):
+        pipe = self.client.pipeline()
+        pipe.zadd(self._key(board), {member: score})
+        pipe.sadd(self._boards_key, board)
+        pipe.execute()
+
+    def remove(self, board: str, member: int):
+        self.client.zrem(self._key(board), member)
+
+    def rank(self, board: str, member: int):
+        return self.client.zrevrank(self._key(board), member)
+
+    def score(self, board: str, member: int):
+        return self.client.zscore(self._key(board), member)
+
+    def range(self, board: str, start: int, stop: int):
+        if start >= stop:
+            return []
+        rows = self.client.zrevrange(self._key(board), max(start, 0), stop - 1, withscores=True)
+        return [(int(member), score) for member, score in rows]
+
+    def size(self, board: str) -> int:
+        return self.client.zcard(self._key(board))
+
+    def replace(self, boards: dict):
+        # Fill temporary keys first, then swap them in with one MULTI
+        token = uuid.uuid4().hex
+        pipe = self.client.pipeline(transaction=False)
+        for board, scores in boards.items():
+            items = list(scores.items())
+            for i in range(0, len(items), REBUILD_BATCH):
+                pipe.zadd(f"{self.prefix}tmp:{token}:{board}", dict(items[i:i + REBUILD_BATCH]))
+            pipe.execute()
+        stale = {name.decode() for name in self.client.smembers(self._boards_key)} - set(boards)
+        pipe = self.client.pipeline(transaction=True)
+        for board in boards:
+            pipe.rename(f"{self.prefix}tmp:{token}:{board}", self._key(board))
+        for board in stale:
+            pipe.delete(self._key(board))
+        pipe.delete(self._boards_key)
+        if boards:
+            pipe.sadd(self._boards_key, *boards)
+        pipe.execute()
+
+
+class Leaderboards:
+    def __init__(self, store, binds=(), rebuild_interval: float = LEADERBOARD_REBUILD_SECONDS):
+        self.store = store
+        self.binds = list(binds)
+        # Shared boards only need the startup rebuild
+        self.rebuild_interval = 0 if store.is_remote else rebuild_interval
+        self.ready = threading.Event()
+        self._replay = None  # updates that arrive while a rebuild is reading the database
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def apply(self, ops):
+        """ops: [("set", board, student_id, rating) | ("remove", board, student_id, None)]"""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.extend(ops)
+        for op, board, member, score in ops:
+            if op == "set":
+                self.store.set(board, member, score)
+            else:
+                self.store.remove(board, member)
+
+    def position(self, board: str, student_id: int):
+        """(1-based rank, rating) or None when the student is not on the board."""
+        rank = self.store.rank(board, student_id)
+        if rank is None:
+            return None
+        return rank + 1, self.store.score(board, student_id)
+
+    def page(self, board: str, start: int, stop: int):
+        return [
+            {"rank": start + i + 1, "student_id": member, "rating": score}
+            for i, (member, score) in enumerate(self.store.range(board, start, stop))
+        ]
+
+    def around(self, board: str, student_id: int, radius: int):
+        rank = self.store.rank(board, student_id)
+        if rank is None:
+            return []
+        start = max(rank - radius, 0)
+        return self.page(board, start, rank + radius + 1)
+
+    def size(self, board: str) -> int:
+        return self.store.size(board)
+
+    def rebuild(self):
+        started = time.perf_counter()
+        with self._lock:
+            self._replay = []
+        try:
+            boards = {}
+            graded = Student.rating_count > 0
+            for bind in self.binds:
+                with bind.connect() as conn:
+                    rows = conn.execute(select(Student.school_id, Student.id, Student.rating).where(graded))
+                    for school_id, student_id, rating in rows:
+                        boards.setdefault(school_board(school_id), {})[student_id] = rating
+                    rows = conn.execute(
+                        select(Student.school_id, GroupMembership.group_id, Student.id, Student.rating)
+                        .join(Student, Student.id == GroupMembership.student_id)
+                        .where(GroupMembership.status == "accepted", graded)
+                    )
+                    for school_id, group_id, student_id, rating in rows:
+                        boards.setdefault(group_board(school_id, group_id), {})[student_id] = rating
+            self.store.replace(boards)
+        finally:
+            with self._lock:
+                replay, self._replay = self._replay, None
+        # Updates committed while we were reading may be missing from the snapshot
+        self.apply(replay)
+        self.ready.set()
+        logger.info("Leaderboards rebuilt: %d boards in %.2fs", len(boards), time.perf_counter() - started)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leaderboard-rebuild", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+
+    def _run(self):
+        # Startup rebuild happens here so it does not hold up the first requests
+        while not self._stop.is_set():
+            try:
+                self.rebuild()
+            except Exception:
+                logger.exception("Leaderboard rebuild failed")
+            if self.ready.is_set() and self.rebuild_interval <= 0:
+                break
+            # Until the first rebuild succeeds, retry every 30s
+            if self._stop.wait(self.rebuild_interval if self.ready.is_set() else 30):
+                break
+
+
+def _default_store():
+    if LEADERBOARD_REDIS_URL:
+        return RedisSortedSets(LEADERBOARD_REDIS_URL)
+    return MemorySortedSets()
+
+
+def stage(db: Session, ops):
+    """Queues board updates until the session commits."""
+    db.info.setdefault("leaderboard_ops", []).extend(ops)
+
+
+def student_ops(db: Session, student: Student):
+    """Updates that put the student at their current rating on every board they belong to."""
+    group_ids = [
+        group_id for (group_id,) in db.query(GroupMembership.group_id)
+        .filter(GroupMembership.student_id == student.id, GroupMembership.status == "accepted")
+    ]
+    boards = [school_board(student.school_id)] + [group_board(student.school_id, group_id) for group_id in group_ids]
+    if student.rating_count:
+        return [("set", board, student.id, student.rating) for board in boards]
+    return [("remove", board, student.id, None) for board in boards]
+
+
+def membership_ops(student: Student, group_id: int, accepted: bool):
+    if student is None:
+        return []
+    board = group_board(student.school_id, group_id)
+    if accepted and student.rating_count:
+        return [("set", board, student.id, student.rating)]
+    return [("remove", board, student.id, None)]
+
+
+def _with_names(db: Session, entries):
+    ids = [entry["student_id"] for entry in entries]
+    names = dict(
+        db.query(Student.id, User.fullname).join(User, User.id == Student.user_id).filter(Student.id.in_(ids)).all()
+    ) if ids else {}
+    return [{**entry, "fullname": names.get(entry["student_id"])} for entry in entries]
+
+
+def board_page(db: Session, board: str, limit: int, offset: int, student_id: int = None) -> dict:
+    """Top-K page of a board, plus the caller's own position when student_id is given."""
+    if not leaderboards.ready.is_set():
+        raise HTTPException(status_code=503, detail="Leaderboards are being built", headers={"Retry-After": "5"})
+    if not 1 <= limit <= MAX_PAGE_SIZE or offset < 0:
+        raise HTTPException(status_code=400, detail=f"limit must be 1-{MAX_PAGE_SIZE} and offset non-negative")
+    result = {
+        "board": board,
+        "size": leaderboards.size(board),
+        "entries": _with_names(db, leaderboards.page(board, offset, offset + limit)),
+    }
+    if student_id is not None:
+        position = leaderboards.position(board, student_id)
+        result["me"] = {"rank": position[0], "rating": position[1]} if position else None
+    return result
+
+
+def around_page(db: Session, board: str, student_id: int, radius: int) -> dict:
+    if not leaderboards.ready.is_set():
+        raise HTTPException(status_code=503, detail="Leaderboards are being built", headers={"Retry-After": "5"})
+    if not 0 <= radius <= MAX_AROUND_RADIUS:
+        raise HTTPException(status_code=400, detail=f"radius must be 0-{MAX_AROUND_RADIUS}")
+    return {
+        "board": board,
+        "size": leaderboards.size(board),
+        "entries": _with_names(db, leaderboards.around(board, student_id, radius)),
+    }
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_staged(session):
+    ops = session.info.pop("leaderboard_ops", None)
+    if not ops:
+        return
+    try:
+        leaderboards.apply(ops)
+    except Exception:
+        # The grade is committed; the next rebuild puts the board right
+        logger.exception("Leaderboard update failed")
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_staged(session):
+    session.info.pop("leaderboard_ops", None)
+
+
+leaderboards = Leaderboards(_default_store(), engines.values())
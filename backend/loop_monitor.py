@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from metrics import Counter, Histogram, route_template
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_INTERVAL = 0.01  # seconds between heartbeats
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+# Test rejimi: route loop'ni shundan uzoq bloklasa so'rov xato bilan tugaydi
+LOOP_BLOCK_FAIL_MS = os.getenv("LOOP_BLOCK_FAIL_MS")
+STACK_DEPTH = 25
+
+event_loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds", "Scheduler delay of the event loop heartbeat.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+event_loop_blocks_total = Counter(
+    "event_loop_blocks_total", "Episodes where the event loop was blocked past the threshold.", ("route",))
+event_loop_blocked_seconds_total = Counter(
+    "event_loop_blocked_seconds_total", "Time the event loop spent blocked, by route.", ("route",))
+
+
+class LoopBlockedError(RuntimeError):
+    pass
+
+
+class LoopMonitor:
+    """A heartbeat coroutine plus a watchdog thread. When the heartbeat stalls past
+    the threshold the watchdog samples the loop thread's stack and the route of the
+    task that is running."""
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS):
+        self.interval = interval
+        self.threshold = threshold_ms / 1000
+        self.episodes = deque(maxlen=100)
+        self.task_scopes = {}   # asyncio.Task -> ASGI scope of the request it serves
+        self.task_blocked = {}  # asyncio.Task -> longest block seen while serving it
+        self.loop = None
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._probe_task = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._probe_task = self.loop.create_task(self._probe())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watchdog, name="loop-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._probe_task:
+            self._probe_task.cancel()
+        if self._thread:
+            self._thread.join(1.0)
+        self._thread = None
+
+    async def _probe(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            event_loop_lag_seconds.observe(max(0.0, now - expected))
+
+    def _watchdog(self):
+        episode = task = None
+        while not self._stop.wait(self.interval):
+            stalled = time.monotonic() - self._heartbeat - self.interval
+            if stalled >= self.threshold:
+                if episode is None:
+                    episode, task = self._sample()
+                episode["blocked_ms"] = round(stalled * 1000, 1)
+                if task is not None:
+                    self.task_blocked[task] = max(self.task_blocked.get(task, 0.0), stalled)
+            elif episode is not None:
+                self._finish(episode)
+                episode = task = None
+
+    def _sample(self):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame, limit=STACK_DEPTH) if frame else []
+        try:
+            task = asyncio.current_task(self.loop)
+        except RuntimeError:
+            task = None
+        scope = self.task_scopes.get(task) if task else None
+        episode = {
+            "route": route_template(scope) if scope else "unknown",
+            "started_at": time.time(),
+            "blocked_ms": 0.0,
+            "stack": "".join(stack),
+        }
+        return episode, task
+
+    def _finish(self, episode: dict):
+        route = episode["route"]
+        event_loop_blocks_total.inc(route)
+        event_loop_blocked_seconds_total.inc(route, amount=episode["blocked_ms"] / 1000)
+        self.episodes.append(episode)
+        logger.warning("Event loop blocked for %.1f ms in %s\n%s", episode["blocked_ms"], route, episode["stack"])
+
+
+monitor = LoopMonitor()
+
+
+class LoopMonitorMiddleware:
+    """Tags the request task with its scope; in test mode fails requests that block the loop."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not monitor.running:
+            return await self.app(scope, receive, send)
+
+        task = asyncio.current_task()
+        monitor.task_scopes[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            monitor.task_scopes.pop(task, None)
+            blocked = monitor.task_blocked.pop(task, 0.0)
+
+        if LOOP_BLOCK_FAIL_MS is not None and blocked * 1000 > float(LOOP_BLOCK_FAIL_MS):
+            raise LoopBlockedError(
+                f"{route_template(scope)} blocked the event loop for {blocked * 1000:.0f} ms "
+                f"(limit {LOOP_BLOCK_FAIL_MS} ms)"
+            )
@@ -1,32 +1,109 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from database import engine, Base, get_db
-from auth import ACCESS_TOKEN_EXPIRE_MINUTES, hash_password, verify_password, create_access_token, get_current_user
+from starlette.concurrency import run_in_threadpool
+from database import engine, get_db, replica_set, shard_engines
+from migrations import check_schema_revision
+from auth import ACCESS_TOKEN_EXPIRE_MINUTES, verify_password_async, create_access_token, get_current_user
 from models import User
-from routers import admin, teacher, student
+from routers import admin, teacher, student, batch, search as search_router
+from notifications import dispatcher
+from rate_limit import RateLimitMiddleware, client_ip, login_throttle
+from query_stats import QueryStatsMiddleware
+from metrics import REGISTRY, MetricsMiddleware, flusher, register_pool_metrics
+from loop_monitor import LoopMonitorMiddleware, monitor as loop_monitor
+from profiling import ProfilingMiddleware
+from replicas import ReadRoutingMiddleware
+from idempotency import IdempotencyMiddleware
+from leaderboard import leaderboards
+from search import backend as search_backend
+from feed import trimmer as feed_trimmer
+import attendance
+from jobs import runner as job_runner
+from tenancy import TenantMiddleware
+import math
 from typing import Optional
 from datetime import timedelta
 
 app = FastAPI()
-
-# Ma'lumotlar bazasini yaratish
-Base.metadata.create_all(bind=engine)
+app.add_middleware(TenantMiddleware)
+app.add_middleware(ReadRoutingMiddleware, replicas=replica_set)
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(LoopMonitorMiddleware)
+app.add_middleware(ProfilingMiddleware)
+register_pool_metrics(engine)
+for replica in replica_set.engines:
+    register_pool_metrics(replica, db=replica_set.names[replica])
+for name, shard in shard_engines.items():
+    register_pool_metrics(shard, db=name)
 
 # Routerni qo'shish
 app.include_router(admin.router, prefix="/admin", tags=["Admin"])
 app.include_router(teacher.router, prefix="/teacher", tags=["Teacher"])
 app.include_router(student.router, prefix="/student", tags=["Student"])
+app.include_router(batch.router, tags=["Batch"])
+app.include_router(search_router.router, prefix="/search", tags=["Search"])
+
+@app.on_event("startup")
+def start_background_workers():
+    # Sxema faqat `alembic upgrade head` orqali o'zgaradi; worker faqat tekshiradi
+    check_schema_revision(engine)
+    for shard in shard_engines.values():
+        check_schema_revision(shard)
+    dispatcher.start()
+    flusher.start()
+    loop_monitor.start()
+    replica_set.start()
+    leaderboards.start()
+    search_backend.start()
+    feed_trimmer.start()
+    for worker in (*attendance.writers.values(), *attendance.compactors.values()):
+        worker.start()
+    job_runner.start()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    dispatcher.stop()
+    flusher.stop()
+    loop_monitor.stop()
+    replica_set.stop()
+    leaderboards.stop()
+    search_backend.stop()
+    feed_trimmer.stop()
+    for worker in (*attendance.writers.values(), *attendance.compactors.values()):
+        worker.stop()
+    job_runner.stop()
+
+async def _call_throttle(func, *args):
+    # Redis bilan har bir chaqiruv tarmoq so'rovi: event loop'ni bloklamasin
+    if login_throttle.backend.is_remote:
+        return await run_in_threadpool(func, *args)
+    return func(*args)
 
 @app.post("/token")
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    # Bloklangan bo'lsa DB va bcrypt'ga umuman tegmaymiz
+    throttle_key = f"{form_data.username.lower()}|{client_ip(request.scope)}"
+    locked_for = await _call_throttle(login_throttle.locked_for, throttle_key)
+    if locked_for > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many failed login attempts",
+            headers={"Retry-After": str(math.ceil(locked_for))},
+        )
     user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
+        await _call_throttle(login_throttle.record_failure, throttle_key)
         raise HTTPException(status_code=401, detail="Incorrect username or password")
+    await _call_throttle(login_throttle.reset, throttle_key)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.id}, expires_delta=access_token_expires
+        data={"sub": user.id, "school": user.school_id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -34,6 +111,10 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
 def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Online School System"}
@@ -0,0 +1,114 @@
+"""Post-upload processing of lesson videos; runs in the job worker processes.
+
+This module must stay free of database imports: jobs.py sends `process` to a
+spawned worker process, which imports only this file.
+
+process() checks the stored file against the size the upload wrote and
+computes its SHA-256. When ffprobe/ffmpeg are installed it also reads
+duration, codecs and resolution, grabs a poster frame, and writes a copy scaled
+down to MEDIA_MAX_HEIGHT when the video is taller. Without them, only the
+container type is sniffed from the first bytes.
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+
+UPLOADS_DIR = "uploads"  # lesson videos, under the school's storage prefix (tenancy.storage_path)
+MEDIA_MAX_HEIGHT = int(os.getenv("MEDIA_MAX_HEIGHT", "720"))
+MEDIA_POSTER_WIDTH = int(os.getenv("MEDIA_POSTER_WIDTH", "640"))
+MEDIA_PROBE_TIMEOUT = float(os.getenv("MEDIA_PROBE_TIMEOUT", "60"))
+MEDIA_TRANSCODE_TIMEOUT = float(os.getenv("MEDIA_TRANSCODE_TIMEOUT", "1800"))
+CHUNK = 1024 * 1024
+
+
+class MediaError(Exception):
+    """The file itself is bad; retrying will not help."""
+
+    permanent = True
+
+
+def sha256_of(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sniff(path: str) -> str:
+    with open(path, "rb") as f:
+        head = f.read(16)
+    if head[4:8] == b"ftyp":
+        return "video/quicktime" if head[8:10] == b"qt" else "video/mp4"
+    if head.startswith(b"\x1aE\xdf\xa3"):
+        return "video/webm"
+    if head.startswith(b"RIFF") and head[8:12] == b"AVI ":
+        return "video/x-msvideo"
+    return "application/octet-stream"
+
+
+def _run(args, timeout: float) -> subprocess.CompletedProcess:
+    result = subprocess.run(args, capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        error = result.stderr.decode(errors="replace").strip().splitlines()
+        raise MediaError(f"{os.path.basename(args[0])}: {error[-1] if error else 'failed'}")
+    return result
+
+
+def probe(path: str) -> dict:
+    output = _run(["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+                  MEDIA_PROBE_TIMEOUT).stdout
+    data = json.loads(output or b"{}")
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    if video is None:
+        raise MediaError("No video stream")
+    duration = data.get("format", {}).get("duration") or video.get("duration")
+    return {
+        "duration": round(float(duration), 3) if duration else None,
+        "format": data.get("format", {}).get("format_name"),
+        "bit_rate": int(data["format"]["bit_rate"]) if data.get("format", {}).get("bit_rate") else None,
+        "video_codec": video.get("codec_name"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "audio_codec": audio.get("codec_name") if audio else None,
+    }
+
+
+def poster(path: str, duration) -> str:
+    target = os.path.splitext(path)[0] + ".poster.jpg"
+    offset = min(1.0, duration / 2) if duration else 0
+    _run(["ffmpeg", "-y", "-v", "error", "-ss", str(offset), "-i", path, "-frames:v", "1",
+          "-vf", f"scale={MEDIA_POSTER_WIDTH}:-2", target], MEDIA_PROBE_TIMEOUT)
+    return target
+
+
+def normalize(path: str) -> str:
+    target = f"{os.path.splitext(path)[0]}.{MEDIA_MAX_HEIGHT}p.mp4"
+    partial = target + ".part"
+    _run(["ffmpeg", "-y", "-v", "error", "-i", path, "-vf", f"scale=-2:{MEDIA_MAX_HEIGHT}",
+          "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-c:a", "aac", "-movflags", "+faststart",
+          "-f", "mp4", partial], MEDIA_TRANSCODE_TIMEOUT)
+    os.replace(partial, target)  # a half-written file never has the final name
+    return target
+
+
+def process(path: str, expected_size: int = None) -> dict:
+    """Returns what goes into media_info."""
+    if not path or not os.path.isfile(path):
+        raise MediaError(f"File not found: {path}")
+    size = os.path.getsize(path)
+    if expected_size is not None and size != expected_size:
+        raise MediaError(f"Stored file has {size} bytes, the upload wrote {expected_size}")
+    info = {"size": size, "sha256": sha256_of(path), "content_type": sniff(path)}
+    if shutil.which("ffprobe") is None or shutil.which("ffmpeg") is None:
+        info["probed"] = False
+        return info
+    info.update(probe(path), probed=True)
+    info["poster_path"] = poster(path, info["duration"])
+    if info["height"] and info["height"] > MEDIA_MAX_HEIGHT:
+        info["normalized_path"] = normalize(path)
+    return info
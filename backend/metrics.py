@@ -0,0 +1,345 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# gunicorn/uvicorn bir nechta worker bilan ishlaganda har bir worker o'z
+# qiymatlarini shu papkaga yozadi, /metrics esa hammasini jamlaydi.
+# Papka deploy paytida tozalanishi kerak.
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_INTERVAL = 5.0
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_SEPARATOR = "\x1f"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(value) for value in labelvalues)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = {_SEPARATOR.join(key): value for key, value in self._values.items()}
+        return {
+            "type": self.type,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "mode": getattr(self, "multiprocess_mode", "sum"),
+            "samples": samples,
+        }
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """`multiprocess_mode`: "livesum" adds up live workers, "max" keeps the largest value."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None, multiprocess_mode: str = "livesum"):
+        self.multiprocess_mode = multiprocess_mode
+        super().__init__(name, documentation, labelnames, registry)
+
+    def set(self, value: float, *labelvalues):
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1.0):
+        self.inc(*labelvalues, amount=-amount)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, *labelvalues):
+        key = self._key(labelvalues)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                # per-bucket counts (not cumulative), then sum and count
+                data = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+                    break
+            data[-2] += value
+            data[-1] += 1
+
+    def snapshot(self) -> dict:
+        result = super().snapshot()
+        result["buckets"] = [_format_value(bound) for bound in self.buckets]
+        result["samples"] = {key: list(value) for key, value in result["samples"].items()}
+        return result
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def add_collector(self, func):
+        """`func()` is called before every scrape/flush to refresh sampled gauges."""
+        self._collectors.append(func)
+        return func
+
+    def collect(self):
+        for func in self._collectors:
+            try:
+                func()
+            except Exception:
+                logger.exception("Metrics collector %s failed", getattr(func, "__name__", func))
+
+    def snapshot(self) -> dict:
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self) -> str:
+        self.collect()
+        snapshot = self.snapshot()
+        if METRICS_MULTIPROC_DIR:
+            write_snapshot(snapshot)
+            snapshot = merge_snapshots(read_snapshots())
+        return render_snapshot(snapshot)
+
+
+REGISTRY = Registry()
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_MULTIPROC_DIR, f"metrics_{pid}.json")
+
+
+def write_snapshot(snapshot: dict):
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    path = _snapshot_path(os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_snapshots():
+    """Yields (is_alive, snapshot) for every worker that has written one."""
+    for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, "metrics_*.json")):
+        try:
+            pid = int(os.path.basename(path)[len("metrics_"):-len(".json")])
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (ValueError, OSError):
+            continue
+        yield _pid_alive(pid), snapshot
+
+
+def merge_snapshots(snapshots) -> dict:
+    """Counters and histograms of dead workers are kept so totals never go backwards;
+    gauges only count live workers."""
+    merged = {}
+    for alive, snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            is_gauge = metric["type"] == "gauge"
+            if is_gauge and not alive:
+                continue
+            for key, value in metric["samples"].items():
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = value
+                elif metric["type"] == "histogram":
+                    target["samples"][key] = [a + b for a, b in zip(current, value)]
+                elif is_gauge and metric["mode"] == "max":
+                    target["samples"][key] = max(current, value)
+                else:
+                    target["samples"][key] = current + value
+    return merged
+
+
+def render_snapshot(snapshot: dict) -> str:
+    lines = []
+    for name, metric in snapshot.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric["labelnames"]
+        for key, value in sorted(metric["samples"].items()):
+            labelvalues = key.split(_SEPARATOR) if labelnames else []
+            labels = [f'{label}="{_escape(v)}"' for label, v in zip(labelnames, labelvalues)]
+            if metric["type"] == "histogram":
+                cumulative = 0
+                for bound, count in zip(metric["buckets"], value[:-2]):
+                    cumulative += count
+                    bucket_labels = ",".join(labels + [f'le="{bound}"'])
+                    lines.append(f"{name}_bucket{{{bucket_labels}}} {cumulative}")
+                suffix = "{" + ",".join(labels) + "}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{suffix} {value[-1]}")
+            else:
+                suffix = "{" + ",".join(labels) + "}" if labels else ""
+                lines.append(f"{name}{suffix} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class _Flusher:
+    def __init__(self, registry: Registry, interval: float):
+        self.registry = registry
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not METRICS_MULTIPROC_DIR or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.interval)
+            self.flush()
+
+    def flush(self):
+        self.registry.collect()
+        write_snapshot(self.registry.snapshot())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Metrics flush failed")
+
+
+flusher = _Flusher(REGISTRY, METRICS_FLUSH_INTERVAL)
+
+
+# --- HTTP metrics ----------------------------------------------------------
+
+http_requests_total = Counter(
+    "http_requests_total", "HTTP requests by route template and status code.", ("method", "route", "status"))
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served.")
+http_upload_bytes_total = Counter(
+    "http_upload_bytes_total", "Bytes received in multipart uploads; use rate() for bytes/s.", ("route",))
+
+
+def route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+        uploaded = 0
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-type" and value.startswith(b"multipart/"):
+                original_receive = receive
+
+                async def receive():
+                    nonlocal uploaded
+                    message = await original_receive()
+                    uploaded += len(message.get("body", b""))
+                    return message
+                break
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            route = route_template(scope)
+            method = scope["method"]
+            http_requests_total.inc(method, route, status)
+            http_request_duration_seconds.observe(time.perf_counter() - started, method, route)
+            if uploaded:
+                http_upload_bytes_total.inc(route, amount=uploaded)
+
+
+# --- DB pool ----------------------------------------------------------------
+
+db_pool_size = Gauge("db_pool_size", "Configured connection pool size.", ("db",))
+db_pool_checked_out = Gauge("db_pool_checked_out", "Connections currently in use.", ("db",))
+db_pool_overflow = Gauge("db_pool_overflow", "Connections opened above the pool size.", ("db",))
+
+
+def register_pool_metrics(engine, db: str = "primary"):
+    pool = engine.pool
+
+    def collect_pool():
+        for gauge, attr in ((db_pool_size, "size"), (db_pool_checked_out, "checkedout"), (db_pool_overflow, "overflow")):
+            if hasattr(pool, attr):
+                gauge.set(getattr(pool, attr)(), db)
+
+    REGISTRY.add_collector(collect_pool)
@@ -1,104 +1,330 @@
-from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, Float, Text
+from sqlalchemy import Boolean, Column, Date, Integer, JSON, String, ForeignKey, Float, Text, DateTime, Index, LargeBinary, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 from sqlalchemy import Time
+from datetime import datetime
 
-class User(Base):
+class School(Base):
+    # Maktablar ro'yxati faqat asosiy bazada turadi (tenancy.py)
+    __tablename__ = "schools"
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    slug = Column(String(50), unique=True, index=True)  # <slug>.TENANT_HOST_SUFFIX
+    database = Column(String(50), default="default")  # TENANT_DATABASE_URLS dagi nom
+    storage_prefix = Column(String(100), nullable=True)  # yuklangan fayllar uchun papka
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class SchoolScoped:
+    # tenancy.py har bir ORM so'roviga school_id shartini qo'shadi. Tashqi kalit yo'q:
+    # katta maktab qatorlari boshqa bazada, schools jadvali esa asosiy bazada.
+    # Maktabsiz yozilgan qatorlar (seed, Core insert) 1-maktabga tegishli.
+    school_id = Column(Integer, nullable=False, server_default="1")
+
+class User(SchoolScoped, Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    username = Column(String(50), unique=True, index=True)
+    username = Column(String(50))  # maktab ichida yagona
     hashed_password = Column(String(128))
     role = Column(String(20))
     fullname = Column(String(100))
-    phone_number = Column(String(15))
+    phone_number = Column(String(15), index=True)
     passport_image = Column(String(255), nullable=True)
+    # images.py/jobs.py: kichraytirilgan WebP va qayta ishlash holati (pending, ready, failed)
+    passport_thumbnail = Column(String(255), nullable=True)
+    passport_status = Column(String(20), nullable=True)
     is_active = Column(Boolean, default=False)
     verification_code = Column(String(6), nullable=True)
 
     teacher = relationship("Teacher", back_populates="user")
     student = relationship("Student", back_populates="user")
 
-class Teacher(Base):
+    __table_args__ = (
+        Index("ix_users_school_id_username", "school_id", "username", unique=True),
+    )
+
+class Teacher(SchoolScoped, Base):
     __tablename__ = 'teachers'
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
     name = Column(String(50))  # Teacher'ning ismi
     subject = Column(String(100))  # O'qitiladigan fan
     rating = Column(Float, default=0.0)  # Reyting
+    # ratings.py yangilaydi: rating = rating_sum / rating_count
+    rating_sum = Column(Integer, default=0)
+    rating_count = Column(Integer, default=0)
+    rating_decayed = Column(Float, nullable=True)  # Yangi baholar og'irroq
+    rating_decayed_sum = Column(Float, default=0.0)
+    rating_decayed_weight = Column(Float, default=0.0)
+    rating_updated_at = Column(DateTime, nullable=True)
 
     user = relationship("User", back_populates="teacher")
     students = relationship("Student", back_populates="teacher")
     tasks = relationship("Task", back_populates="teacher")
     groups = relationship("Group", back_populates="creator", primaryjoin="Teacher.id==Group.created_by")
 
-class Student(Base):
+class Student(SchoolScoped, Base):
     __tablename__ = 'students'
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
     teacher_id = Column(Integer, ForeignKey('teachers.id'), nullable=True)
+    # attendance.py yangilaydi: attendance = attendance_baseline + davomat yozuvlari soni
     attendance = Column(Float, default=0.0)
+    attendance_baseline = Column(Float, default=0.0)  # davomat jurnalidan oldingi hisoblagich
     rating = Column(Float, default=0.0)
+    # ratings.py yangilaydi: rating = rating_sum / rating_count
+    rating_sum = Column(Integer, default=0)
+    rating_count = Column(Integer, default=0)
+    rating_decayed = Column(Float, nullable=True)  # Yangi baholar og'irroq
+    rating_decayed_sum = Column(Float, default=0.0)
+    rating_decayed_weight = Column(Float, default=0.0)
+    rating_updated_at = Column(DateTime, nullable=True)
 
     user = relationship("User", back_populates="student")
     teacher = relationship("Teacher", back_populates="students")
     tasks = relationship("Task", back_populates="student")
     group_memberships = relationship("GroupMembership", back_populates="student")
 
-class Task(Base):
+class Task(SchoolScoped, Base):
     __tablename__ = 'tasks'
     id = Column(Integer, primary_key=True, index=True)
-    teacher_id = Column(Integer, ForeignKey('teachers.id'))
-    student_id = Column(Integer, ForeignKey('students.id'))
+    teacher_id = Column(Integer, ForeignKey('teachers.id'), index=True)
+    student_id = Column(Integer, ForeignKey('students.id'), index=True)
     task_description = Column(String(1000))
     grade = Column(Integer)  # 1-5 ballar
     video_path = Column(String(255))
     student_result_path = Column(String(255))  # O‘quvchining natija fayli
     start_time = Column(Time)  # Dars boshlanish vaqti
     end_time = Column(Time)    # Dars tugash vaqti
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=True, index=True)
+    graded_at = Column(DateTime, nullable=True)
+    # Baho qo'yilgandagi o'qituvchi fani: qayta baholashda eski baho shu fandan ayiriladi (ratings.py)
+    graded_subject = Column(String(100), nullable=True)
+    # jobs.py to'ldiradi: pending, ready, failed
+    media_status = Column(String(20), nullable=True)
+    media_info = Column(JSON, nullable=True)  # davomiylik, kodek, sha256, poster ...
 
     teacher = relationship("Teacher", back_populates="tasks")
     student = relationship("Student", back_populates="tasks")
 
-class Group(Base):
+class TaskArchive(SchoolScoped, Base):
+    # archive.py ko'chiradi: baholangan eski darslar. MySQL'da YEAR(graded_at) bo'yicha
+    # bo'limlangan, shuning uchun graded_at kalitda va tashqi kalitlar yo'q
+    __tablename__ = "tasks_archive"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    graded_at = Column(DateTime, primary_key=True)
+    teacher_id = Column(Integer)
+    student_id = Column(Integer)
+    task_description = Column(String(1000))
+    grade = Column(Integer)
+    video_path = Column(String(255))
+    student_result_path = Column(String(255))
+    start_time = Column(Time)
+    end_time = Column(Time)
+    group_id = Column(Integer, nullable=True)
+    graded_subject = Column(String(100), nullable=True)
+    media_status = Column(String(20), nullable=True)
+    media_info = Column(JSON, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    teacher = relationship("Teacher", primaryjoin="foreign(TaskArchive.teacher_id) == Teacher.id", viewonly=True)
+    student = relationship("Student", primaryjoin="foreign(TaskArchive.student_id) == Student.id", viewonly=True)
+
+    __table_args__ = (
+        Index("ix_tasks_archive_student_id_graded_at", "student_id", "graded_at"),
+        Index("ix_tasks_archive_teacher_id_graded_at", "teacher_id", "graded_at"),
+        Index("ix_tasks_archive_school_id_graded_at", "school_id", "graded_at"),  # archive._needs_archive
+    )
+
+class Group(SchoolScoped, Base):
     __tablename__ = "groups"
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), index=True)
     description = Column(Text, nullable=True)
-    created_by = Column(Integer, ForeignKey("teachers.id"))
+    created_by = Column(Integer, ForeignKey("teachers.id"), index=True)
+    # Juda katta guruhlar: lenta yozishda emas, o'qishda yig'iladi (feed.py)
+    fanout_on_read = Column(Boolean, default=False)
      
     creator = relationship("Teacher", back_populates="groups")
     memberships = relationship("GroupMembership", back_populates="group")
     homeworks = relationship("Homework", back_populates="group")
     videos = relationship("Video", back_populates="group")
 
-class GroupMembership(Base):
+    __table_args__ = (
+        Index("ft_groups_name_description", "name", "description", mysql_prefix="FULLTEXT").ddl_if(dialect="mysql"),
+    )
+
+class GroupMembership(SchoolScoped, Base):
     __tablename__ = "group_memberships"
     
     id = Column(Integer, primary_key=True, index=True)
     group_id = Column(Integer, ForeignKey("groups.id"))
-    student_id = Column(Integer, ForeignKey("students.id"))
+    student_id = Column(Integer, ForeignKey("students.id"), index=True)
     status = Column(String(20), default="pending")  # So'rov holati: pending, accepted, rejected
     
     group = relationship("Group", back_populates="memberships")
     student = relationship("Student", back_populates="group_memberships")
 
-class Homework(Base):
+    __table_args__ = (
+        Index("ix_group_memberships_group_id_status", "group_id", "status"),
+    )
+
+class Homework(SchoolScoped, Base):
     __tablename__ = "homeworks"
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), index=True)
     description = Column(Text)
-    group_id = Column(Integer, ForeignKey("groups.id"))
+    group_id = Column(Integer, ForeignKey("groups.id"), index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
     
     group = relationship("Group", back_populates="homeworks")
 
-class Video(Base):
+    __table_args__ = (
+        Index("ft_homeworks_title_description", "title", "description", mysql_prefix="FULLTEXT").ddl_if(dialect="mysql"),
+        Index("ix_homeworks_group_id_created_at", "group_id", "created_at"),
+    )
+
+class Video(SchoolScoped, Base):
     __tablename__ = "videos"
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), index=True)  # VARCHAR uzunligi qo‘shildi
     video_path = Column(String(255))
-    group_id = Column(Integer, ForeignKey("groups.id"))
+    group_id = Column(Integer, ForeignKey("groups.id"), index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # jobs.py to'ldiradi: pending, ready, failed
+    media_status = Column(String(20), nullable=True)
+    media_info = Column(JSON, nullable=True)
     
     group = relationship("Group", back_populates="videos")
+
+    __table_args__ = (
+        Index("ft_videos_title", "title", mysql_prefix="FULLTEXT").ddl_if(dialect="mysql"),
+        Index("ix_videos_group_id_created_at", "group_id", "created_at"),
+    )
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox_messages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String(20))  # sms, ...
+    recipient = Column(String(100))
+    body = Column(Text)
+    dedup_key = Column(String(100), unique=True, nullable=True)
+    status = Column(String(20), default="pending")  # pending, sending, sent, failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(String(255), nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbox_messages_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(64), primary_key=True)  # sha256(principal, method, path, Idempotency-Key)
+    fingerprint = Column(String(64))
+    status = Column(String(20), default="in_flight")  # in_flight, done
+    response_status = Column(Integer, nullable=True)
+    response_headers = Column(Text, nullable=True)  # JSON
+    response_body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True)
+
+class RatingBreakdown(Base):
+    __tablename__ = "rating_breakdowns"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_type = Column(String(20))  # student, teacher
+    owner_id = Column(Integer)  # students.id / teachers.id
+    dimension = Column(String(20))  # group, subject
+    dimension_key = Column(String(100))  # group id yoki fan nomi
+    rating_sum = Column(Integer, default=0)
+    rating_count = Column(Integer, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("owner_type", "owner_id", "dimension", "dimension_key",
+                         name="uq_rating_breakdowns_owner_dimension"),
+    )
+
+class FeedItem(Base):
+    __tablename__ = "feed_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("students.id"))
+    group_id = Column(Integer, ForeignKey("groups.id"))
+    item_type = Column(String(20))  # homework, video
+    item_id = Column(Integer)
+    created_at = Column(DateTime)  # uy vazifasi/video yaratilgan vaqt
+
+    __table_args__ = (
+        UniqueConstraint("student_id", "item_type", "item_id", name="uq_feed_items_student_item"),
+        Index("ix_feed_items_student_id_created_at", "student_id", "created_at", "item_type", "item_id"),
+    )
+
+class AttendanceEvent(SchoolScoped, Base):
+    __tablename__ = "attendance_events"
+
+    id = Column(Integer, primary_key=True)
+    student_id = Column(Integer, ForeignKey("students.id"))
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=True)
+    task_id = Column(Integer, nullable=True)  # dars; tashqi kalitsiz, dars arxivga ko'chishi mumkin
+    source = Column(String(20))  # api, teacher, kiosk
+    occurred_at = Column(DateTime)
+    recorded_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_attendance_events_student_id_occurred_at", "student_id", "occurred_at"),
+    )
+
+class AttendanceDaily(SchoolScoped, Base):
+    __tablename__ = "attendance_daily"
+
+    id = Column(Integer, primary_key=True)
+    student_id = Column(Integer, ForeignKey("students.id"))
+    group_id = Column(Integer, default=0)  # 0: guruhsiz davomat
+    day = Column(Date)
+    events = Column(Integer, default=0)
+    first_at = Column(DateTime)
+    last_at = Column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint("student_id", "day", "group_id", name="uq_attendance_daily_student_day_group"),
+        Index("ix_attendance_daily_group_id_day", "group_id", "day", "student_id"),
+    )
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String(50), primary_key=True)
+    last_id = Column(Integer, default=0)  # shu id'gacha bo'lgan yozuvlar yig'ilgan
+    updated_at = Column(DateTime, nullable=True)
+
+class Job(SchoolScoped, Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50))  # media.process, ...
+    payload = Column(JSON)
+    target_type = Column(String(20), nullable=True)  # task, video
+    target_id = Column(Integer, nullable=True)
+    status = Column(String(20), default="queued")  # queued, running, succeeded, failed
+    attempts = Column(Integer, default=0)
+    run_after = Column(DateTime, default=datetime.utcnow)
+    locked_by = Column(String(64), nullable=True)  # ishlayotgan runner
+    locked_until = Column(DateTime, nullable=True)
+    result = Column(JSON, nullable=True)
+    last_error = Column(String(255), nullable=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    notify = Column(String(100), nullable=True)  # tugaganda SMS yuboriladigan raqam
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        Index("ix_jobs_target_type_target_id", "target_type", "target_id"),
+    )
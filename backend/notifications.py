@@ -0,0 +1,285 @@
+import logging
+import random
+import re
+import threading
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import worker_sessions
+from metrics import Counter, Gauge, Histogram
+from models import OutboxMessage
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_POLL_INTERVAL = 1.0      # seconds between polls when the queue is empty
+OUTBOX_BATCH_SIZE = 100         # messages claimed per poll
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_BACKOFF_BASE = 2.0       # seconds, doubled per attempt
+OUTBOX_BACKOFF_MAX = 300.0
+OUTBOX_SENDING_TIMEOUT = 120.0  # a claim older than this is picked up again
+# Tasdiqlash kodlari logga tushmasin
+CODE_PATTERN = re.compile(r"\b\d{4,8}\b")
+
+outbox_queue_depth = Gauge(
+    "outbox_queue_depth", "Outbox messages waiting for delivery.", multiprocess_mode="max")
+outbox_messages_total = Counter(
+    "outbox_messages_total", "Outbox delivery attempts by provider and result.", ("provider", "result"))
+outbox_delivery_latency_seconds = Histogram(
+    "outbox_delivery_latency_seconds", "Time from enqueue to successful delivery.", ("provider",),
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 300, 900))
+
+
+class Provider:
+    """Delivery backend. `send_batch` returns {message_id: error or None}."""
+
+    name = "base"
+    rate = 10.0    # messages per second allowed by the provider
+    burst = 10
+    max_batch = 50
+
+    def __init__(self):
+        self.bucket = TokenBucket(self.rate, self.burst)
+
+    def send_batch(self, messages):
+        raise NotImplementedError
+
+
+def mask_codes(text: str) -> str:
+    return CODE_PATTERN.sub(lambda match: "*" * len(match.group()), text)
+
+
+class ConsoleSmsProvider(Provider):
+    """Development provider: logs the messages instead of sending them, with codes masked."""
+
+    name = "sms"
+
+    def send_batch(self, messages):
+        results = {}
+        for message in messages:
+            logger.info("SMS to %s: %s", message.recipient, mask_codes(message.body))
+            results[message.id] = None
+        return results
+
+
+class FakeProvider(Provider):
+    """In-memory provider for tests. Fails the first `fail_times` batches."""
+
+    def __init__(self, name: str = "sms", rate: float = 1000.0, burst: int = 1000, fail_times: int = 0):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        super().__init__()
+        self.sent = []
+        self.fail_times = fail_times
+
+    def send_batch(self, messages):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            return {message.id: "fake failure" for message in messages}
+        self.sent.extend((message.recipient, message.body) for message in messages)
+        return {message.id: None for message in messages}
+
+
+providers = {"sms": ConsoleSmsProvider()}
+
+
+def register_provider(name: str, provider: Provider):
+    providers[name] = provider
+
+
+def enqueue_message(db: Session, provider: str, recipient: str, body: str, dedup_key: str = None) -> OutboxMessage:
+    """Adds a message to the outbox. The caller commits it together with its own rows.
+
+    With a dedup_key the message is added once: the existing row is returned
+    instead. When a concurrent request adds the same key first, the insert
+    fails inside a savepoint and that row (None if it is not committed yet) is
+    returned, so the caller's transaction goes on.
+    """
+    if dedup_key:
+        existing = db.query(OutboxMessage).filter(OutboxMessage.dedup_key == dedup_key).first()
+        if existing:
+            return existing
+    message = OutboxMessage(
+        provider=provider,
+        recipient=recipient,
+        body=body,
+        dedup_key=dedup_key,
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    if not dedup_key:
+        db.add(message)
+        return message
+    try:
+        # begin_nested() flushes the caller's rows first, so only this insert can fail here
+        with db.begin_nested():
+            db.add(message)
+    except IntegrityError:
+        return db.query(OutboxMessage).filter(OutboxMessage.dedup_key == dedup_key).first()
+    return message
+
+
+def _percentile(values, q: float):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class OutboxDispatcher:
+    """Background thread that delivers pending outbox messages in per-provider batches.
+
+    Messages are claimed from every database in database.engines, since a
+    school on its own database queues its messages there.
+    """
+
+    def __init__(self, session_factories: dict = None, poll_interval: float = OUTBOX_POLL_INTERVAL,
+                 batch_size: int = OUTBOX_BATCH_SIZE):
+        self.session_factories = session_factories or worker_sessions  # database name -> sessionmaker
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.queue_depth = 0
+        self.sent_total = 0
+        self.failed_total = 0
+        self.retried_total = 0
+        self.latencies = deque(maxlen=1000)  # seconds from enqueue to delivery
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.dispatch_once()
+            except Exception:
+                logger.exception("Outbox dispatch failed")
+                processed = 0
+            if processed < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+    def dispatch_once(self) -> int:
+        processed = 0
+        queue_depth = 0
+        for session_factory in self.session_factories.values():
+            db = session_factory()
+            try:
+                claimed = self._claim(db)
+                by_provider = defaultdict(list)
+                for message in claimed:
+                    by_provider[message.provider].append(message)
+                for name, messages in by_provider.items():
+                    self._deliver(db, name, messages)
+                queue_depth += db.query(OutboxMessage).filter(OutboxMessage.status.in_(["pending", "sending"])).count()
+                processed += len(claimed)
+            finally:
+                db.close()
+        self.queue_depth = queue_depth
+        outbox_queue_depth.set(self.queue_depth)
+        return processed
+
+    def _claim(self, db: Session):
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=OUTBOX_SENDING_TIMEOUT)
+        messages = (
+            db.query(OutboxMessage)
+            .filter(or_(
+                and_(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= now),
+                and_(OutboxMessage.status == "sending", OutboxMessage.next_attempt_at <= stale),
+            ))
+            .order_by(OutboxMessage.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for message in messages:
+            message.status = "sending"
+            message.next_attempt_at = now
+        db.commit()
+        return messages
+
+    def _deliver(self, db: Session, name: str, messages):
+        provider = providers.get(name)
+        if provider is None:
+            for message in messages:
+                self._fail(message, f"Unknown provider: {name}", final=True)
+            db.commit()
+            return
+
+        # Provider rate limit: whatever doesn't fit in the bucket waits for the next poll
+        allowed = provider.bucket.take_up_to(len(messages))
+        deferred_until = datetime.utcnow() + timedelta(seconds=provider.bucket.retry_after(1))
+        for message in messages[allowed:]:
+            message.status = "pending"
+            message.next_attempt_at = deferred_until
+        messages = messages[:allowed]
+
+        for start in range(0, len(messages), provider.max_batch):
+            chunk = messages[start:start + provider.max_batch]
+            # The same text to the same recipient is delivered once
+            unique = {}
+            for message in chunk:
+                unique.setdefault((message.recipient, message.body), message)
+            try:
+                results = provider.send_batch(list(unique.values()))
+            except Exception as e:
+                logger.exception("Provider %s failed", name)
+                results = {message.id: str(e) for message in unique.values()}
+            now = datetime.utcnow()
+            for message in chunk:
+                error = results.get(unique[(message.recipient, message.body)].id, "No result from provider")
+                if error is None:
+                    message.status = "sent"
+                    message.sent_at = now
+                    message.last_error = None
+                    self.sent_total += 1
+                    outbox_messages_total.inc(name, "sent")
+                    if message.created_at:
+                        latency = (now - message.created_at).total_seconds()
+                        self.latencies.append(latency)
+                        outbox_delivery_latency_seconds.observe(latency, name)
+                else:
+                    outbox_messages_total.inc(name, "error")
+                    self._fail(message, error)
+        db.commit()
+
+    def _fail(self, message: OutboxMessage, error: str, final: bool = False):
+        message.attempts = (message.attempts or 0) + 1
+        message.last_error = str(error)[:255]
+        if final or message.attempts >= OUTBOX_MAX_ATTEMPTS:
+            message.status = "failed"
+            self.failed_total += 1
+            return
+        delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (message.attempts - 1))
+        message.status = "pending"
+        message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay * random.uniform(0.5, 1.0))
+        self.retried_total += 1
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "queue_depth": self.queue_depth,
+            "sent_total": self.sent_total,
+            "failed_total": self.failed_total,
+            "retried_total": self.retried_total,
+            "delivery_latency_p50": _percentile(latencies, 0.5),
+            "delivery_latency_p95": _percentile(latencies, 0.95),
+        }
+
+
+dispatcher = OutboxDispatcher()
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+
+from auth import get_current_user
+from database import SessionLocal
+from metrics import route_template
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_HEADER = b"x-profile"
+PROFILE_INTERVAL = 0.005  # seconds between stack samples
+PROFILE_MAX_STACK = 64
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))  # newest profiles kept in PROFILE_DIR
+
+
+def _parse_routes(value: str) -> dict:
+    """"GET /teacher/tasks/=0.05,/student/lessons/=0.01:0.002" -> {route: settings}.
+
+    Each entry is [METHOD ]<route template>=<rate>[:<interval>]; without a
+    method the route is profiled for every method.
+    """
+    routes = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        route, _, settings = item.strip().rpartition("=")
+        rate, _, interval = settings.partition(":")
+        method, _, path = route.strip().rpartition(" ")
+        routes[(method.upper() or None, path)] = {
+            "rate": float(rate),
+            "interval": float(interval) if interval else PROFILE_INTERVAL,
+        }
+    return routes
+
+
+# (method or None, route template) -> {"rate": share of requests profiled without a flag,
+#                                      "interval": sampling interval for this route}
+PROFILE_ROUTES = _parse_routes(os.getenv("PROFILE_ROUTES", ""))
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_STACK:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _stack_contains(frame, codes) -> bool:
+    while frame is not None:
+        if frame.f_code in codes:
+            return True
+        frame = frame.f_back
+    return False
+
+
+def _dependant_codes(dependant, codes=None) -> set:
+    codes = set() if codes is None else codes
+    code = getattr(getattr(dependant, "call", None), "__code__", None)
+    if code is not None:
+        codes.add(code)
+    for sub in dependant.dependencies:
+        _dependant_codes(sub, codes)
+    return codes
+
+
+class _Sampler(threading.Thread):
+    """Samples the loop thread while the profiled task runs, and worker threads
+    that are executing the route's endpoint or dependencies."""
+
+    def __init__(self, scope, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.scope = scope
+        self.interval = interval
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        self.loop_thread_id = threading.get_ident()
+        self.samples = Counter()
+        self._codes = None
+        self._done = threading.Event()
+
+    def _route_codes(self):
+        if self._codes is None:
+            route = self.scope.get("route")
+            if route is not None and hasattr(route, "dependant"):
+                self._codes = _dependant_codes(route.dependant)
+        return self._codes
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                if thread_id == self.loop_thread_id:
+                    if asyncio.current_task(self.loop) is not self.task:
+                        continue
+                else:
+                    codes = self._route_codes()
+                    if not codes or not _stack_contains(frame, codes):
+                        continue
+                self.samples[_fold(frame)] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def _matched_route(scope):
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", None)
+    return None
+
+
+def _flag_requested(scope) -> bool:
+    for name, value in scope.get("headers", []):
+        if name == PROFILE_HEADER:
+            return value not in (b"", b"0")
+    query = scope.get("query_string", b"")
+    return b"profile=" in query and parse_qs(query.decode("latin-1")).get("profile", ["0"])[0] not in ("", "0")
+
+
+def _is_admin(scope) -> bool:
+    token = None
+    for name, value in scope.get("headers", []):
+        if name == b"authorization" and value[:7].lower() == b"bearer ":
+            token = value[7:].decode("latin-1")
+    if not token:
+        return False
+    db = SessionLocal()
+    try:
+        return get_current_user(token=token, db=db).role == "admin"
+    except HTTPException:
+        return False
+    finally:
+        db.close()
+
+
+def _save(profile_id: str, scope, sampler: _Sampler, duration: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.folded"), "w") as f:
+        for stack, count in sampler.samples.most_common():
+            f.write(f"{stack} {count}\n")
+    meta = {
+        "id": profile_id,
+        "method": scope["method"],
+        "path": scope["path"],
+        "route": route_template(scope),
+        "duration_ms": round(duration * 1000, 2),
+        "samples": sum(sampler.samples.values()),
+        "interval_ms": sampler.interval * 1000,
+        "created_at": time.time(),
+    }
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w") as f:
+        json.dump(meta, f)
+    _prune()
+
+
+def _prune():
+    """Deletes all but the PROFILE_KEEP newest profiles."""
+    for meta in list_profiles()[PROFILE_KEEP:]:
+        for suffix in (".json", ".folded"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, f"{meta['id']}{suffix}"))
+            except FileNotFoundError:
+                pass  # another worker pruned it first
+
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(PROFILE_DIR, name)) as f:
+                    profiles.append(json.load(f))
+            except (FileNotFoundError, ValueError):
+                continue  # pruned or still being written by another worker
+    return sorted(profiles, key=lambda meta: meta["created_at"], reverse=True)
+
+
+def profile_path(profile_id: str):
+    """Path of the folded-stack file (flamegraph.pl / speedscope format), or None."""
+    try:
+        uuid.UUID(profile_id)
+    except ValueError:
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.folded")
+    return path if os.path.exists(path) else None
+
+
+class ProfilingMiddleware:
+    """Profiles a request when an admin sends `X-Profile: 1` (or `?profile=1`), or when
+    its route is listed in PROFILE_ROUTES. Other requests only pay a header scan."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        settings = None
+        if PROFILE_ROUTES:
+            route = _matched_route(scope)
+            settings = PROFILE_ROUTES.get((scope["method"], route)) or PROFILE_ROUTES.get((None, route))
+        sampled = settings is not None and random.random() < settings.get("rate", 0.0)
+        by_admin = _flag_requested(scope) and await run_in_threadpool(_is_admin, scope)
+        if not sampled and not by_admin:
+            return await self.app(scope, receive, send)
+
+        settings = settings or {}
+        profile_id = str(uuid.uuid4())
+        sampler = _Sampler(scope, settings.get("interval", PROFILE_INTERVAL))
+
+        async def send_wrapper(message):
+            # Faqat so'ragan admin profil id'sini ko'radi; tanlab olinganlar sezilmaydi
+            if by_admin and message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            await run_in_threadpool(sampler.stop)
+            await run_in_threadpool(_save, profile_id, scope, sampler, duration)
@@ -0,0 +1,144 @@
+import logging
+import os
+import re
+import time
+import collections
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import Counter, Histogram, route_template
+
+logger = logging.getLogger(__name__)
+
+APP_DEBUG = os.getenv("APP_DEBUG", "0") == "1"
+QUERY_COUNT_THRESHOLD = int(os.getenv("QUERY_COUNT_THRESHOLD", "50"))
+REPEATED_STATEMENT_THRESHOLD = int(os.getenv("REPEATED_STATEMENT_THRESHOLD", "10"))
+QUERY_BUDGET_ACTION = os.getenv("QUERY_BUDGET_ACTION", "log")  # log | raise
+SLOWEST_STATEMENTS = 3
+
+_PARAM_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_SPACES = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def statement_shape(statement: str) -> str:
+    """Normalizes a statement so N+1 repeats of the same query compare equal."""
+    shape = _SPACES.sub(" ", statement).strip()
+    shape = _PARAM_LIST.sub("(?)", shape)
+    return _NUMBER.sub("?", shape)
+
+
+class RequestQueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = collections.Counter()
+        self.slowest = []  # [(seconds, statement)], longest first
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.total_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+        if len(self.slowest) < SLOWEST_STATEMENTS or elapsed > self.slowest[-1][0]:
+            self.slowest.append((elapsed, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[SLOWEST_STATEMENTS:]
+
+    def most_repeated(self):
+        if not self.shapes:
+            return None, 0
+        return self.shapes.most_common(1)[0]
+
+
+_current_stats: ContextVar = ContextVar("request_query_stats", default=None)
+
+db_queries_total = Counter("db_queries_total", "SQL statements executed, by route template.", ("route",))
+db_query_seconds_total = Counter("db_query_seconds_total", "Time spent in SQL, by route template.", ("route",))
+db_queries_per_request = Histogram(
+    "db_queries_per_request", "SQL statements per request.", ("route",), buckets=(1, 2, 3, 5, 10, 20, 50, 100))
+
+
+def current_stats():
+    return _current_stats.get()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started_at")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+
+
+@event.listens_for(Engine, "handle_error")
+def _drop_failed_start(context):
+    # Xato bergan so'rov after_cursor_execute'ga yetmaydi; ro'yxat pool'dagi ulanishda o'sib ketmasin
+    conn = context.connection
+    started = conn.info.get("query_started_at") if conn is not None else None
+    if started:
+        started.pop()
+
+
+def _check_budget(route: str, stats: RequestQueryStats):
+    problems = []
+    if stats.count > QUERY_COUNT_THRESHOLD:
+        problems.append(f"{stats.count} queries (limit {QUERY_COUNT_THRESHOLD})")
+    shape, repeats = stats.most_repeated()
+    if repeats > REPEATED_STATEMENT_THRESHOLD:
+        problems.append(f"possible N+1: {repeats}x {shape[:200]}")
+    if not problems:
+        return
+    message = f"{route}: " + "; ".join(problems)
+    if QUERY_BUDGET_ACTION == "raise":
+        raise QueryBudgetExceeded(message)
+    logger.warning("Query budget exceeded on %s", message)
+
+
+class QueryStatsMiddleware:
+    """Counts SQL per request; adds X-DB-* headers when APP_DEBUG=1."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestQueryStats()
+        token = _current_stats.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                route = route_template(scope)
+                db_queries_total.inc(route, amount=stats.count)
+                db_query_seconds_total.inc(route, amount=stats.total_time)
+                db_queries_per_request.observe(stats.count, route)
+                _check_budget(route, stats)
+                if APP_DEBUG:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-db-query-count", str(stats.count).encode()))
+                    headers.append((b"x-db-time-ms", f"{stats.total_time * 1000:.2f}".encode()))
+                    for elapsed, statement in stats.slowest:
+                        text = f"{elapsed * 1000:.2f}ms {_SPACES.sub(' ', statement)[:200]}"
+                        headers.append((b"x-db-slowest", text.encode("latin-1", "replace")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_stats.reset(token)
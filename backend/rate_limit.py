@@ -0,0 +1,338 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from starlette.concurrency import run_in_threadpool
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"  # benchmarks turn it off
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")  # unset: per-process memory backend
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"
+MAX_FORM_BODY = 16 * 1024  # /token form bodies are tiny
+
+LOGIN_FAILURES_BEFORE_LOCKOUT = 5
+LOGIN_LOCKOUT_BASE = 30      # seconds, doubled for every further failure
+LOGIN_LOCKOUT_MAX = 3600
+LOGIN_FAILURE_WINDOW = 3600
+
+
+class TokenBucket:
+    """Simple token bucket: refills `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def consume(self, amount: float = 1) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return True
+            return False
+
+    def take_up_to(self, amount: int) -> int:
+        """Takes up to `amount` tokens and returns how many were taken."""
+        with self._lock:
+            self._refill(time.monotonic())
+            taken = min(amount, int(self.tokens))
+            self.tokens -= taken
+            return taken
+
+    def retry_after(self, amount: float = 1) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = amount - self.tokens
+            if missing <= 0:
+                return 0.0
+            return missing / self.rate
+
+
+class MemoryBackend:
+    """Per-process buckets and counters. Old keys are evicted past `max_keys`."""
+
+    is_remote = False
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._values = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def _remember(self, store: OrderedDict, key, value):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self.max_keys:
+            store.popitem(last=False)
+
+    def take(self, key: str, rate: float, capacity: float) -> float:
+        """Consumes one token; returns 0 if allowed, otherwise seconds to wait."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(rate, capacity)
+            self._remember(self._buckets, key, bucket)
+        if bucket.consume():
+            return 0.0
+        return bucket.retry_after()
+
+    def _get(self, key: str):
+        item = self._values.get(key)
+        if item is None:
+            return None
+        if item[1] <= time.monotonic():
+            del self._values[key]
+            return None
+        return item
+
+    def incr(self, key: str, ttl: float) -> int:
+        with self._lock:
+            item = self._get(key)
+            value = (item[0] if item else 0) + 1
+            expires_at = item[1] if item else time.monotonic() + ttl
+            self._remember(self._values, key, (value, expires_at))
+            return value
+
+    def set(self, key: str, ttl: float):
+        with self._lock:
+            self._remember(self._values, key, (1, time.monotonic() + ttl))
+
+    def ttl(self, key: str) -> float:
+        with self._lock:
+            item = self._get(key)
+            return max(0.0, item[1] - time.monotonic()) if item else 0.0
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+
+class RedisBackend:
+    """Shared state for several workers/hosts. Needs the `redis` package."""
+
+    is_remote = True
+
+    _TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local retry = 0
+if tokens >= 1 then tokens = tokens - 1 else retry = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry)
+"""
+
+    def __init__(self, url: str):
+        import redis  # only needed when this backend is configured
+
+        self.client = redis.Redis.from_url(url)
+        self._take = self.client.register_script(self._TAKE_SCRIPT)
+
+    def take(self, key: str, rate: float, capacity: float) -> float:
+        return float(self._take(keys=[key], args=[rate, capacity, time.time()]))
+
+    def incr(self, key: str, ttl: float) -> int:
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, int(math.ceil(ttl)), nx=True)
+        return int(pipe.execute()[0])
+
+    def set(self, key: str, ttl: float):
+        self.client.set(key, 1, px=int(ttl * 1000))
+
+    def ttl(self, key: str) -> float:
+        remaining = self.client.pttl(key)
+        return remaining / 1000 if remaining and remaining > 0 else 0.0
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+
+def _default_backend():
+    if RATE_LIMIT_REDIS_URL:
+        return RedisBackend(RATE_LIMIT_REDIS_URL)
+    return MemoryBackend()
+
+
+def client_ip(scope) -> str:
+    if TRUST_FORWARDED_FOR:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else ""
+
+
+class RatePolicy:
+    """`rate` requests per second (burst `capacity`) for one route, keyed by
+    "ip", "query:<param>" or "form:<field>"."""
+
+    def __init__(self, name: str, method: str, path: str, key: str, rate: float, capacity: float):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+
+    def key_for(self, scope, form):
+        if self.key == "ip":
+            return client_ip(scope)
+        source, _, field = self.key.partition(":")
+        if source == "query":
+            values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get(field)
+        elif source == "form":
+            values = (form or {}).get(field)
+        else:
+            raise ValueError(f"Unknown rate limit key: {self.key}")
+        return values[0].lower() if values else None
+
+
+PER_MINUTE = 1 / 60
+
+DEFAULT_POLICIES = [
+    RatePolicy("login-ip", "POST", "/token", "ip", 20 * PER_MINUTE, 20),
+    RatePolicy("login-user", "POST", "/token", "form:username", 5 * PER_MINUTE, 5),
+    RatePolicy("register-ip", "POST", "/student/register_student/", "ip", 5 * PER_MINUTE, 5),
+    RatePolicy("register-phone", "POST", "/student/register_student/", "query:phone_number", 0.3 * PER_MINUTE, 3),
+    RatePolicy("register-username", "POST", "/student/register_student/", "query:username", 1 * PER_MINUTE, 3),
+    RatePolicy("verify-ip", "POST", "/student/verify_code/", "ip", 10 * PER_MINUTE, 10),
+    RatePolicy("verify-phone", "POST", "/student/verify_code/", "query:phone_number", 0.5 * PER_MINUTE, 5),
+    RatePolicy("teacher-register-ip", "POST", "/admin/register_teacher/", "ip", 5 * PER_MINUTE, 5),
+    RatePolicy("teacher-verify-phone", "POST", "/admin/verify_teacher/", "query:phone_number", 0.5 * PER_MINUTE, 5),
+]
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+async def _buffer_form(scope, receive):
+    """Reads a small urlencoded body and returns (form, receive that replays it).
+
+    Chunked bodies (no Content-Length) are read too; a body over MAX_FORM_BODY
+    raises _BodyTooLarge, so padding the form cannot skip the form:<field> policies.
+    """
+    headers = dict(scope.get("headers", []))
+    content_type = headers.get(b"content-type", b"").split(b";")[0].strip()
+    if content_type != b"application/x-www-form-urlencoded":
+        return None, receive
+    length = headers.get(b"content-length")
+    if length is not None and int(length) > MAX_FORM_BODY:
+        raise _BodyTooLarge()
+
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] != "http.request":
+            return None, receive
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_FORM_BODY:
+            raise _BodyTooLarge()
+        chunks.append(chunk)
+        more_body = message.get("more_body", False)
+    body = b"".join(chunks)
+
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return parse_qs(body.decode("latin-1")), replay
+
+
+async def _reject(send, status: int, detail: str, retry_after: float = None):
+    body = ('{"detail":"%s"}' % detail).encode()
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    if retry_after is not None:
+        headers.append((b"retry-after", str(int(math.ceil(retry_after))).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    """Rejects over-limit requests before routing, so no DB or bcrypt work is done."""
+
+    def __init__(self, app, policies=None, backend=None):
+        self.app = app
+        self.backend = backend or limiter_backend
+        self.policies = {}
+        for policy in DEFAULT_POLICIES if policies is None else policies:
+            self.policies.setdefault((policy.method, policy.path), []).append(policy)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+        policies = self.policies.get((scope["method"], scope["path"]))
+        if not policies:
+            return await self.app(scope, receive, send)
+
+        form = None
+        if any(policy.key.startswith("form:") for policy in policies):
+            try:
+                form, receive = await _buffer_form(scope, receive)
+            except _BodyTooLarge:
+                return await _reject(send, 413, "Request body too large")
+
+        for policy in policies:
+            key = policy.key_for(scope, form)
+            if key is None:
+                continue
+            bucket_key = f"rl:{policy.name}:{key}"
+            if self.backend.is_remote:
+                retry_after = await run_in_threadpool(self.backend.take, bucket_key, policy.rate, policy.capacity)
+            else:
+                retry_after = self.backend.take(bucket_key, policy.rate, policy.capacity)
+            if retry_after > 0:
+                return await _reject(send, 429, "Too many requests", retry_after)
+
+        await self.app(scope, receive, send)
+
+
+class LoginThrottle:
+    """Exponential lockout after repeated failed logins for the same key."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def locked_for(self, key: str) -> float:
+        return self.backend.ttl(f"lock:{key}")
+
+    def record_failure(self, key: str):
+        failures = self.backend.incr(f"fail:{key}", LOGIN_FAILURE_WINDOW)
+        if failures >= LOGIN_FAILURES_BEFORE_LOCKOUT:
+            lockout = LOGIN_LOCKOUT_BASE * 2 ** (failures - LOGIN_FAILURES_BEFORE_LOCKOUT)
+            self.backend.set(f"lock:{key}", min(LOGIN_LOCKOUT_MAX, lockout))
+
+    def reset(self, key: str):
+        self.backend.delete(f"fail:{key}")
+
+
+limiter_backend = _default_backend()
+login_throttle = LoginThrottle(limiter_backend)
@@ -0,0 +1,305 @@
+"""Incremental ratings for students and teachers.
+
+Student.rating and Teacher.rating are the mean grade of their tasks. grade_task
+calls apply_grade() before it commits, so the running sum/count and the
+per-group/per-subject breakdowns change in the same transaction as the grade.
+Re-grading a task swaps the old grade for the new one. The subject breakdown
+uses the teacher's subject at the time the task was first graded
+(tasks.graded_subject), so a re-grade after the teacher's subject changes moves
+the grade within the same bucket. The student's new rating goes to the
+leaderboards once the transaction commits.
+
+rating_decayed weights each grade by 0.5 ** (age / RATING_HALF_LIFE_DAYS), so
+recent work counts more. The stored decayed sum and weight are as of
+rating_updated_at; ageing both by the same factor leaves their ratio unchanged,
+so rating_decayed only has to be recomputed when a grade changes.
+
+tasks.student_id/teacher_id hold user ids (see create_new_task), so owners are
+looked up by user_id. recompute() rebuilds everything from tasks and
+tasks_archive, a chunk of owners per transaction. It locks the owner rows like
+apply_grade does, so it is safe to run while teachers are grading:
+
+    python ratings.py            # rebuild the aggregates, on every database
+    python ratings.py --check    # only report owners whose stored aggregates differ
+"""
+import argparse
+import math
+import os
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from leaderboard import stage, student_ops
+from models import Group, RatingBreakdown, Student, Task, TaskArchive, Teacher
+
+RATING_HALF_LIFE_DAYS = float(os.getenv("RATING_HALF_LIFE_DAYS", "90"))
+MIN_GRADE = 1
+MAX_GRADE = 5
+# Decayed weight below this is float noise left over from removed grades
+EPSILON = 1e-9
+
+breakdowns = RatingBreakdown.__table__
+# Archived tasks (archive.py) keep counting towards ratings
+TASK_SOURCES = (Task, TaskArchive)
+
+
+def decay(age_seconds: float) -> float:
+    return math.pow(0.5, max(age_seconds, 0.0) / (RATING_HALF_LIFE_DAYS * 86400))
+
+
+def _owner_values(total: int, count: int, decayed_sum: float, decayed_weight: float, now) -> dict:
+    if count <= 0 or decayed_weight < EPSILON:
+        decayed_sum = decayed_weight = 0.0
+    return {
+        "rating": total / count if count > 0 else 0.0,
+        "rating_sum": total,
+        "rating_count": count,
+        "rating_decayed": decayed_sum / decayed_weight if decayed_weight else None,
+        "rating_decayed_sum": decayed_sum,
+        "rating_decayed_weight": decayed_weight,
+        "rating_updated_at": now,
+    }
+
+
+def _shift(owner, old, old_at, new, now):
+    """Takes `old` (graded at old_at) out of the owner's aggregates and puts `new` in."""
+    factor = decay((now - owner.rating_updated_at).total_seconds()) if owner.rating_updated_at else 0.0
+    total, count = owner.rating_sum or 0, owner.rating_count or 0
+    decayed_sum = (owner.rating_decayed_sum or 0.0) * factor
+    decayed_weight = (owner.rating_decayed_weight or 0.0) * factor
+    if old is not None:
+        weight = decay((now - (old_at or now)).total_seconds())
+        total, count = total - old, count - 1
+        decayed_sum, decayed_weight = decayed_sum - old * weight, decayed_weight - weight
+    if new is not None:
+        total, count = total + new, count + 1
+        decayed_sum, decayed_weight = decayed_sum + new, decayed_weight + 1.0
+    for name, value in _owner_values(total, count, decayed_sum, decayed_weight, now).items():
+        setattr(owner, name, value)
+
+
+def _upsert(db: Session, owner_type: str, owner_id: int, dimension: str, key: str, sum_delta: int, count_delta: int):
+    values = dict(owner_type=owner_type, owner_id=owner_id, dimension=dimension, dimension_key=key,
+                  rating_sum=sum_delta, rating_count=count_delta)
+    increments = dict(rating_sum=breakdowns.c.rating_sum + sum_delta,
+                      rating_count=breakdowns.c.rating_count + count_delta)
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(breakdowns).values(**values).on_duplicate_key_update(**increments)
+    else:
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = dialect_insert(breakdowns).values(**values).on_conflict_do_update(
+            index_elements=["owner_type", "owner_id", "dimension", "dimension_key"], set_=increments)
+    db.execute(stmt)
+
+
+def apply_grade(db: Session, task: Task, grade, now: datetime = None):
+    """Sets task.grade and updates the owners' ratings in the caller's transaction."""
+    if grade is not None and not MIN_GRADE <= grade <= MAX_GRADE:
+        raise ValueError(f"grade must be between {MIN_GRADE} and {MAX_GRADE}")
+    now = now or datetime.utcnow()
+    old, old_at = task.grade, task.graded_at
+    if old == grade:
+        return
+    # Always student first, then teacher: concurrent gradings lock in the same order
+    student = db.query(Student).filter(Student.user_id == task.student_id).with_for_update().first()
+    teacher = db.query(Teacher).filter(Teacher.user_id == task.teacher_id).with_for_update().first()
+    for owner in (student, teacher):
+        if owner is not None:
+            _shift(owner, old, old_at, grade, now)
+    if student is not None:
+        stage(db, student_ops(db, student))
+
+    sum_delta = (grade or 0) - (old or 0)
+    count_delta = (grade is not None) - (old is not None)
+    group_key = str(task.group_id) if task.group_id is not None else None
+    # A graded task stays in the subject it was first graded under
+    if old is not None:
+        subject = task.graded_subject
+    else:
+        subject = teacher.subject if teacher is not None else None
+    for owner_type, owner, dimension, key in (
+        ("student", student, "group", group_key),
+        ("student", student, "subject", subject),
+        ("teacher", teacher, "group", group_key),
+    ):
+        if owner is not None and key:
+            _upsert(db, owner_type, owner.id, dimension, key, sum_delta, count_delta)
+
+    task.grade = grade
+    task.graded_at = now if grade is not None else None
+    task.graded_subject = subject if grade is not None else None
+
+
+def summary(owner) -> dict:
+    return {"rating": owner.rating, "count": owner.rating_count or 0, "decayed_rating": owner.rating_decayed}
+
+
+def breakdown(db: Session, owner_type: str, owner_id: int) -> dict:
+    rows = db.query(RatingBreakdown).filter(
+        RatingBreakdown.owner_type == owner_type,
+        RatingBreakdown.owner_id == owner_id,
+        RatingBreakdown.rating_count > 0,
+    ).all()
+    group_ids = [int(row.dimension_key) for row in rows if row.dimension == "group"]
+    names = dict(db.query(Group.id, Group.name).filter(Group.id.in_(group_ids)).all()) if group_ids else {}
+    result = {"by_group": [], "by_subject": []}
+    for row in rows:
+        entry = {"rating": row.rating_sum / row.rating_count, "count": row.rating_count}
+        if row.dimension == "group":
+            group_id = int(row.dimension_key)
+            result["by_group"].append({"group_id": group_id, "name": names.get(group_id), **entry})
+        else:
+            result["by_subject"].append({"subject": row.dimension_key, **entry})
+    result["by_group"].sort(key=lambda entry: entry["group_id"])
+    result["by_subject"].sort(key=lambda entry: entry["subject"])
+    return result
+
+
+# --- Recompute / repair ---
+
+def _chunk_totals(conn, owner, owner_type, lo, hi, now):
+    totals = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    for source in TASK_SOURCES:
+        user_column = getattr(source, f"{owner_type}_id")
+        rows = conn.execute(
+            select(owner.id, source.grade, source.graded_at)
+            .join(owner, owner.user_id == user_column)
+            .where(user_column >= lo, user_column < hi, source.grade.is_not(None))
+        )
+        for owner_id, grade, graded_at in rows:
+            weight = decay((now - (graded_at or now)).total_seconds())
+            entry = totals[owner_id]
+            entry[0] += grade
+            entry[1] += 1
+            entry[2] += grade * weight
+            entry[3] += weight
+    return {owner_id: _owner_values(*entry, now) for owner_id, entry in totals.items()}
+
+
+def _breakdown_queries(source, owner_type, lo, hi):
+    graded = source.grade.is_not(None)
+    if owner_type == "student":
+        return [
+            ("group", select(Student.id, source.group_id, func.sum(source.grade), func.count())
+             .join(Student, Student.user_id == source.student_id)
+             .where(source.student_id >= lo, source.student_id < hi, graded, source.group_id.is_not(None))
+             .group_by(Student.id, source.group_id)),
+            ("subject", select(Student.id, source.graded_subject, func.sum(source.grade), func.count())
+             .join(Student, Student.user_id == source.student_id)
+             .where(source.student_id >= lo, source.student_id < hi, graded, source.graded_subject.is_not(None))
+             .group_by(Student.id, source.graded_subject)),
+        ]
+    return [
+        ("group", select(Teacher.id, source.group_id, func.sum(source.grade), func.count())
+         .join(Teacher, Teacher.user_id == source.teacher_id)
+         .where(source.teacher_id >= lo, source.teacher_id < hi, graded, source.group_id.is_not(None))
+         .group_by(Teacher.id, source.group_id)),
+    ]
+
+
+def _chunk_breakdowns(conn, owner_type, lo, hi):
+    result = {}
+    for source in TASK_SOURCES:
+        for dimension, stmt in _breakdown_queries(source, owner_type, lo, hi):
+            for owner_id, key, total, count in conn.execute(stmt):
+                if key:
+                    total_so_far, count_so_far = result.get((owner_id, dimension, str(key)), (0, 0))
+                    result[(owner_id, dimension, str(key))] = (total_so_far + int(total), count_so_far + count)
+    return result
+
+
+def _check_chunk(conn, owner, owner_type, owner_ids, totals, expected):
+    problems = []
+    empty = _owner_values(0, 0, 0.0, 0.0, None)
+    stored = conn.execute(
+        select(owner.id, owner.rating_sum, owner.rating_count, owner.rating_decayed).where(owner.id.in_(owner_ids)))
+    for owner_id, total, count, decayed in stored:
+        want = totals.get(owner_id, empty)
+        decayed_ok = (decayed is None and want["rating_decayed"] is None) or (
+            decayed is not None and want["rating_decayed"] is not None
+            and abs(decayed - want["rating_decayed"]) < 1e-6)
+        if (total or 0, count or 0) != (want["rating_sum"], want["rating_count"]) or not decayed_ok:
+            problems.append(f"{owner_type} {owner_id}: stored {total}/{count}, expected "
+                            f"{want['rating_sum']}/{want['rating_count']}")
+    rows = conn.execute(
+        select(breakdowns.c.owner_id, breakdowns.c.dimension, breakdowns.c.dimension_key,
+               breakdowns.c.rating_sum, breakdowns.c.rating_count)
+        .where(breakdowns.c.owner_type == owner_type, breakdowns.c.owner_id.in_(owner_ids),
+               breakdowns.c.rating_count != 0)
+    )
+    found = {(owner_id, dimension, key): (total, count) for owner_id, dimension, key, total, count in rows}
+    for key in sorted(set(found) | set(expected), key=str):
+        if found.get(key) != expected.get(key):
+            problems.append(f"{owner_type} {key[0]} {key[1]}={key[2]}: stored {found.get(key)}, expected {expected.get(key)}")
+    return problems
+
+
+def recompute(bind, check: bool = False, chunk: int = 1000, now: datetime = None, report=print) -> int:
+    """Rebuilds ratings and breakdowns from tasks; with check=True only reports.
+
+    Returns the number of owners written, or the number of problems found.
+    """
+    now = now or datetime.utcnow()
+    result = 0
+    for owner, owner_type in ((Student, "student"), (Teacher, "teacher")):
+        with bind.connect() as conn:
+            max_user_id = conn.execute(select(func.max(owner.user_id))).scalar() or 0
+        for lo in range(0, max_user_id + 1, chunk):
+            hi = lo + chunk
+            with bind.begin() as conn:
+                owner_ids = select(owner.id).where(owner.user_id >= lo, owner.user_id < hi)
+                # Same row locks as apply_grade: a grade is either already in tasks or waits for this chunk
+                owner_ids = conn.execute(owner_ids if check else owner_ids.with_for_update()).scalars().all()
+                if not owner_ids:
+                    continue
+                totals = _chunk_totals(conn, owner, owner_type, lo, hi, now)
+                expected = _chunk_breakdowns(conn, owner_type, lo, hi)
+                if check:
+                    for problem in _check_chunk(conn, owner, owner_type, owner_ids, totals, expected):
+                        report(problem)
+                        result += 1
+                    continue
+                table = owner.__table__
+                empty = _owner_values(0, 0, 0.0, 0.0, None)
+                conn.execute(update(table).where(table.c.id.in_(owner_ids)).values(**empty))
+                if totals:
+                    conn.execute(update(table).where(table.c.id == bindparam("owner_id")),
+                                 [{"owner_id": owner_id, **values} for owner_id, values in totals.items()])
+                conn.execute(delete(breakdowns).where(
+                    breakdowns.c.owner_type == owner_type, breakdowns.c.owner_id.in_(owner_ids)))
+                if expected:
+                    conn.execute(insert(breakdowns), [
+                        dict(owner_type=owner_type, owner_id=owner_id, dimension=dimension, dimension_key=key,
+                             rating_sum=total, rating_count=count)
+                        for (owner_id, dimension, key), (total, count) in expected.items()
+                    ])
+                result += len(owner_ids)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="report differences without writing")
+    parser.add_argument("--chunk", type=int, default=1000, help="user ids per transaction")
+    args = parser.parse_args()
+
+    from database import engines
+
+    problems = 0
+    for name, bind in engines.items():
+        count = recompute(bind, check=args.check, chunk=args.chunk)
+        if args.check:
+            print(f"{name}: {count} problems")
+            problems += count
+            continue
+        print(f"{name}: {count} owners recomputed")
+    if args.check:
+        raise SystemExit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Read replicas.
+
+GET/HEAD requests read from a replica; writes, everything in other requests and
+background work (no request context) use the primary. After a request writes,
+the same client (bearer token, or IP when anonymous) reads from the primary for
+READ_YOUR_WRITES_SECONDS, so it sees its own changes despite replication lag.
+A replica is ejected for REPLICA_EJECT_SECONDS when a query on it fails for a
+reason other than the statement itself, or when the health monitor finds it
+down or lagging; while none is healthy, reads go to the primary. Two SQLite
+files are enough to try this locally:
+
+    DATABASE_URL=sqlite:///primary.db DATABASE_REPLICA_URLS=sqlite:///replica.db uvicorn main:app
+"""
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import Select, event, exc, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+from starlette.concurrency import run_in_threadpool
+
+from metrics import Counter, Gauge, REGISTRY
+from rate_limit import client_ip, limiter_backend
+
+logger = logging.getLogger(__name__)
+
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+REPLICA_EJECT_SECONDS = float(os.getenv("REPLICA_EJECT_SECONDS", "30"))
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "5"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "10"))
+READ_ONLY_METHODS = {"GET", "HEAD"}
+
+db_statements_routed_total = Counter(
+    "db_statements_routed_total", "Statements sent to the primary or a replica.", ("target",))
+db_replica_ejections_total = Counter(
+    "db_replica_ejections_total", "Times a replica was taken out of rotation.", ("replica",))
+db_replica_healthy = Gauge(
+    "db_replica_healthy", "1 while the replica is in rotation.", ("replica",), multiprocess_mode="max")
+
+
+class RequestRouting:
+    def __init__(self, replica_ok: bool):
+        self.replica_ok = replica_ok
+        self.wrote = False
+
+
+# Middleware sets this per request; None (background threads, scripts) means primary only
+request_routing: ContextVar = ContextVar("request_routing", default=None)
+
+
+class ReplicaSet:
+    def __init__(self, engines, eject_seconds: float = REPLICA_EJECT_SECONDS,
+                 health_interval: float = REPLICA_HEALTH_INTERVAL, max_lag: float = REPLICA_MAX_LAG_SECONDS):
+        self.engines = list(engines)
+        self.names = {engine: f"replica{i}" for i, engine in enumerate(self.engines)}
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self.max_lag = max_lag
+        self._ejected_until = {}
+        self._cycle = itertools.count()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        for engine in self.engines:
+            event.listen(engine, "handle_error", self._on_error)
+        if self.engines:
+            REGISTRY.add_collector(self._collect)
+
+    def healthy(self):
+        now = time.monotonic()
+        return [engine for engine in self.engines if self._ejected_until.get(engine, 0) <= now]
+
+    def choose(self):
+        """Round-robin over healthy replicas; None if there are none."""
+        healthy = self.healthy()
+        if not healthy:
+            return None
+        return healthy[next(self._cycle) % len(healthy)]
+
+    def eject(self, engine, reason: str):
+        with self._lock:
+            was_healthy = self._ejected_until.get(engine, 0) <= time.monotonic()
+            self._ejected_until[engine] = time.monotonic() + self.eject_seconds
+        if was_healthy:
+            db_replica_ejections_total.inc(self.names[engine])
+            logger.warning("Replica %s ejected for %.0fs: %s", self.names[engine], self.eject_seconds, reason)
+
+    def _on_error(self, context):
+        # Errors caused by the statement itself would fail on the primary too
+        if isinstance(context.sqlalchemy_exception, (exc.ProgrammingError, exc.DataError, exc.IntegrityError)):
+            return
+        self.eject(context.engine, str(context.original_exception))
+
+    def check(self, engine):
+        """Returns None if the replica is usable, otherwise the reason it is not."""
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                if engine.dialect.name != "mysql":
+                    return None
+                try:
+                    status = conn.execute(text("SHOW REPLICA STATUS")).mappings().first()
+                except exc.DBAPIError:
+                    status = conn.execute(text("SHOW SLAVE STATUS")).mappings().first()
+        except exc.DBAPIError as e:
+            return str(e.orig)
+        if status is None:
+            return None  # not configured as a replica (e.g. a local copy)
+        lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+        if lag is None:
+            return "replication is not running"
+        if lag > self.max_lag:
+            return f"{lag}s behind the primary"
+        return None
+
+    def check_all(self):
+        for engine in self.engines:
+            reason = self.check(engine)
+            if reason is not None:
+                self.eject(engine, reason)
+
+    def _collect(self):
+        healthy = self.healthy()
+        for engine in self.engines:
+            db_replica_healthy.set(1 if engine in healthy else 0, self.names[engine])
+
+    def start(self):
+        if not self.engines or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.health_interval)
+
+    def _run(self):
+        # Probing more often than the ejection lasts keeps a dead replica out until it recovers
+        while not self._stop.wait(self.health_interval):
+            try:
+                self.check_all()
+            except Exception:
+                logger.exception("Replica health check failed")
+
+
+class RoutingSession(Session):
+    """Sends plain SELECTs to a replica when the current request allows it.
+
+    shard_for(session) may return the engine of the session's school database
+    (tenancy.py); that engine then replaces the primary, and its statements are
+    not sent to the replicas, which copy the default database.
+    """
+
+    def __init__(self, *args, replicas: ReplicaSet = None, shard_for=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+        self.shard_for = shard_for
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        primary = super().get_bind(mapper, clause=clause, **kw)
+        shard = self.shard_for(self) if self.shard_for is not None and kw.get("bind") is None else None
+        if shard is not None:
+            primary = shard
+        routing = request_routing.get()
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["wrote"] = True
+            if routing is not None:
+                routing.wrote = True
+        if (routing is None or not routing.replica_ok or not self.replicas or not self.replicas.engines
+                or shard is not None or self.info.get("wrote") or kw.get("bind") is not None
+                or not isinstance(clause, Select) or clause._for_update_arg is not None):
+            db_statements_routed_total.inc("primary")
+            return primary
+        replica = self.replicas.choose()
+        db_statements_routed_total.inc("replica" if replica is not None else "primary")
+        return replica if replica is not None else primary
+
+
+def _sticky_key(scope) -> str:
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            return "rw:" + hashlib.sha1(value).hexdigest()
+    return "rw:" + client_ip(scope)
+
+
+class ReadRoutingMiddleware:
+    def __init__(self, app, replicas: ReplicaSet, backend=None):
+        self.app = app
+        self.replicas = replicas
+        self.backend = backend or limiter_backend
+
+    async def _call_backend(self, func, *args):
+        if self.backend.is_remote:
+            return await run_in_threadpool(func, *args)
+        return func(*args)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.replicas.engines:
+            return await self.app(scope, receive, send)
+        key = _sticky_key(scope)
+        replica_ok = (scope["method"] in READ_ONLY_METHODS
+                      and await self._call_backend(self.backend.ttl, key) <= 0)
+        routing = RequestRouting(replica_ok)
+        token = request_routing.set(routing)
+
+        async def send_wrapper(message):
+            # Commit happens before the response starts, so the client's next read is sticky
+            if message["type"] == "http.response.start" and routing.wrote:
+                await self._call_backend(self.backend.set, key, READ_YOUR_WRITES_SECONDS)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_routing.reset(token)
@@ -1,11 +1,17 @@
+import os
 import random
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from database import get_db
 from models import User, Teacher, Student
 from schemas import TeacherCreate, StudentCreate, VerificationCode
-from crud import create_verification_code, update_user_role, verify_code, generate_verification_code
-from auth import hash_password
+from crud import update_user_role, verify_code, generate_verification_code
+from auth import hash_password, get_current_admin
+from notifications import enqueue_message, dispatcher
+from loop_monitor import monitor as loop_monitor
+from profiling import list_profiles, profile_path
 
 router = APIRouter()
 
@@ -28,9 +34,12 @@ def register_teacher(
         role="pending"
     )
     db.add(new_user)
+    enqueue_message(
+        db, "sms", phone_number, f"Tasdiqlash kodi: {verification_code}",
+        dedup_key=f"verify:{phone_number}:{verification_code}",
+    )
     db.commit()
     
-    create_verification_code(db, phone_number, verification_code)
     return {"msg": "Verification code sent", "code": verification_code}
 
 @router.post("/verify_teacher/")
@@ -78,3 +87,80 @@ def add_student(
     db.commit()
 
     return {"msg": "Student added successfully", "student_id": new_user.id}
+
+@router.get("/outbox/stats/")
+def outbox_stats(admin: User = Depends(get_current_admin)):
+    return dispatcher.stats()
+
+@router.get("/loop/blocks/")
+def loop_blocks(admin: User = Depends(get_current_admin)):
+    return list(loop_monitor.episodes)
+
+@router.get("/profiles/")
+def get_profiles(admin: User = Depends(get_current_admin)):
+    return list_profiles()
+
+@router.get("/profiles/{profile_id}")
+def download_profile(profile_id: str, admin: User = Depends(get_current_admin)):
+    path = profile_path(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
+
+
+# --- Passport tekshiruvi ---
+# Fayl nomlari har versiyada yangi (images.output_paths), shuning uchun ?v=<nom> bilan so'ralgan
+# fayl o'zgarmas: brauzer uni qayta so'ramaydi. ETag ham fayl nomining o'zi.
+
+def _passport_url(user: User, kind: str, path: str) -> str:
+    return f"/admin/users/{user.id}/passport/{kind}?v={_version(path)}"
+
+def _version(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+def _passport_file(request: Request, path: Optional[str], v: Optional[str], media_type: str):
+    if not path or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Rasm hali tayyor emas")
+    version = _version(path)
+    headers = {
+        "ETag": f'"{version}"',
+        "Cache-Control": "private, max-age=31536000, immutable" if v == version else "private, max-age=300",
+    }
+    if request.headers.get("if-none-match") in (f'"{version}"', f'W/"{version}"'):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+@router.get("/passports/")
+def list_passports(status: Optional[str] = None, limit: int = 50, offset: int = 0,
+                   db: Session = Depends(get_db), admin: User = Depends(get_current_admin)):
+    # Ro'yxat faqat kichik WebP'larni ko'rsatadi; asl rasm bosilganda ochiladi
+    limit = max(1, min(limit, 200))
+    query = db.query(User).filter(User.passport_image.isnot(None))
+    if status is not None:
+        query = query.filter(User.passport_status == status)
+    users = query.order_by(User.id.desc()).offset(max(offset, 0)).limit(limit).all()
+    return [
+        {
+            "user_id": user.id,
+            "fullname": user.fullname,
+            "is_active": user.is_active,
+            "passport_status": user.passport_status,
+            "thumbnail_url": _passport_url(user, "thumbnail", user.passport_thumbnail) if user.passport_thumbnail else None,
+            "image_url": _passport_url(user, "image", user.passport_image) if user.passport_status == "ready" else None,
+        }
+        for user in users
+    ]
+
+@router.get("/users/{user_id}/passport/thumbnail")
+def get_passport_thumbnail(user_id: int, request: Request, v: Optional[str] = None,
+                           db: Session = Depends(get_db), admin: User = Depends(get_current_admin)):
+    user = db.get(User, user_id)
+    return _passport_file(request, user.passport_thumbnail if user else None, v, "image/webp")
+
+@router.get("/users/{user_id}/passport/image")
+def get_passport_image(user_id: int, request: Request, v: Optional[str] = None,
+                       db: Session = Depends(get_db), admin: User = Depends(get_current_admin)):
+    user = db.get(User, user_id)
+    if user is None or user.passport_status != "ready":
+        raise HTTPException(status_code=404, detail="Rasm hali tayyor emas")
+    return _passport_file(request, user.passport_image, v, "image/jpeg")
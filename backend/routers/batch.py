@@ -0,0 +1,140 @@
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from auth import batch_principal, get_current_user, get_db, oauth2_scheme
+from database import shared_session
+from models import User
+
+router = APIRouter()
+
+MAX_BATCH_REQUESTS = 10
+BATCH_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE"}
+PARALLEL_METHODS = {"GET"}
+# Ichki so'rovlarga asl so'rovdan o'tadigan sarlavhalar
+FORWARDED_HEADERS = {b"authorization", b"x-forwarded-for", b"user-agent", b"accept-language"}
+
+
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    method: str = "GET"
+    path: str
+    params: Dict[str, Any] = {}
+    headers: Dict[str, str] = {}
+    body: Optional[Any] = None
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+    # false: hammasi ketma-ket, bitta sessiyada
+    parallel: bool = True
+
+
+async def _call(app, parent_scope, item: BatchItem):
+    body = b"" if item.body is None else json.dumps(item.body).encode()
+    headers = [(name, value) for name, value in parent_scope["headers"] if name in FORWARDED_HEADERS]
+    headers += [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in item.headers.items()]
+    if body:
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    path, _, query = item.path.partition("?")
+    query_string = "&".join(part for part in (query, urlencode(item.params, doseq=True)) if part)
+    scope = {
+        "type": "http",
+        "asgi": parent_scope.get("asgi", {"version": "3.0"}),
+        "http_version": parent_scope.get("http_version", "1.1"),
+        "method": item.method.upper(),
+        "scheme": parent_scope.get("scheme", "http"),
+        "server": parent_scope.get("server"),
+        "client": parent_scope.get("client"),
+        "root_path": parent_scope.get("root_path", ""),
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "headers": headers,
+    }
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    response = {"status": 500, "headers": [], "body": b""}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        response["status"] = 500
+        response["body"] = b'{"detail": "Internal Server Error"}'
+    content_type = dict(response["headers"]).get(b"content-type", b"")
+    result = response["body"].decode("utf-8", "replace")
+    if content_type.startswith(b"application/json") and response["body"]:
+        result = json.loads(response["body"])
+    return {"id": item.id, "status": response["status"], "body": result}
+
+
+async def _run(app, parent_scope, item: BatchItem, db: Optional[Session]):
+    # Context har bir vazifaga nusxalanadi, shuning uchun sessiya shu yerda o'rnatiladi
+    shared_session.set(db)
+    result = await _call(app, parent_scope, item)
+    if db is not None and result["status"] >= 500:
+        await run_in_threadpool(db.rollback)
+    return result
+
+
+@router.post("/batch")
+async def batch(
+    batch_request: BatchRequest,
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    items = batch_request.requests
+    if len(items) > MAX_BATCH_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_REQUESTS} requests per batch")
+    for item in items:
+        if item.method.upper() not in BATCH_METHODS:
+            raise HTTPException(status_code=400, detail=f"Method {item.method} is not allowed in a batch")
+        if not item.path.startswith("/") or item.path.startswith("/batch"):
+            raise HTTPException(status_code=400, detail=f"Invalid path {item.path}")
+
+    # JWT va foydalanuvchi bir marta: ichki so'rovlar get_current_user'da shu nusxani oladi
+    await run_in_threadpool(db.expunge, current_user)
+    batch_principal.set((token, current_user))
+
+    results = [None] * len(items)
+    pending = []  # ketma-ket kelgan GET'lar; birgalikda bajariladi
+
+    async def flush_parallel():
+        # Session thread-safe emas: parallel GET'lar pool'dan o'z sessiyasini oladi
+        # Bitta bo'lsa umumiy sessiyaning o'zi yetadi
+        session = db if len(pending) == 1 else None
+        done = await asyncio.gather(*(_run(request.app, request.scope, items[i], session) for i in pending))
+        for i, result in zip(pending, done):
+            results[i] = result
+        pending.clear()
+
+    for i, item in enumerate(items):
+        if batch_request.parallel and item.method.upper() in PARALLEL_METHODS:
+            pending.append(i)
+            continue
+        await flush_parallel()
+        results[i] = await _run(request.app, request.scope, item, db)
+    await flush_parallel()
+    return {"responses": results}
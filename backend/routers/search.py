@@ -0,0 +1,32 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from auth import get_current_user, get_db
+from models import Group, GroupMembership, Student, Teacher, User
+from search import DOCUMENTS, search
+
+router = APIRouter()
+
+
+def _visible_groups(db: Session, current_user: User):
+    # Uy vazifasi va videolar faqat foydalanuvchi guruhlaridan; admin hammasini ko'radi
+    if current_user.role == "admin":
+        return None
+    if current_user.role == "teacher":
+        query = db.query(Group.id).join(Teacher, Teacher.id == Group.created_by).filter(Teacher.user_id == current_user.id)
+    else:
+        query = (
+            db.query(GroupMembership.group_id)
+            .join(Student, Student.id == GroupMembership.student_id)
+            .filter(Student.user_id == current_user.id, GroupMembership.status == "accepted")
+        )
+    return {group_id for (group_id,) in query}
+
+
+@router.get("/")
+def search_content(q: str, types: Optional[str] = None, limit: int = 20, offset: int = 0,
+                   db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    wanted = [name.strip() for name in types.split(",") if name.strip()] if types else list(DOCUMENTS)
+    return search(db, q, wanted, _visible_groups(db, current_user), limit, offset)
@@ -1,17 +1,32 @@
+import os
 import shutil
 from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from auth import get_current_user, hash_password
+from auth import get_current_user, hash_password_async
 from database import get_db
 from models import GroupMembership, User, Student, Task
 from schemas import StudentCreate, VerificationCode
+from notifications import enqueue_message
+from ratings import apply_grade, breakdown, summary
+from leaderboard import around_page, board_page, group_board, school_board
+import archive
+import attendance
+import feed
+import images
+import jobs
+import tenancy
+from typing import Optional
 import random
-from datetime import datetime
+from datetime import date, datetime
 router = APIRouter()
 
-# SMS yoki email orqali tasdiqlash kodi yuborish
-def send_verification_code(phone_number: str, code: str):
-    print(f"Verification code {code} sent to {phone_number}")
+# SMS yoki email orqali tasdiqlash kodi yuborish (outbox orqali, commit chaqiruvchida)
+def send_verification_code(db: Session, phone_number: str, code: str):
+    enqueue_message(
+        db, "sms", phone_number, f"Tasdiqlash kodi: {code}",
+        dedup_key=f"verify:{phone_number}:{code}",
+    )
 
 # Student yaratish
 @router.post("/register_student/")
@@ -29,16 +44,19 @@ async def register_student(
         raise HTTPException(status_code=400, detail="Username allaqachon ro'yxatdan o'tgan")
 
     # Parolni hash qilish
-    hashed_password = hash_password(password)
+    hashed_password = await hash_password_async(password)
 
     # Tasdiqlash kodini yaratish
     verification_code = str(random.randint(100000, 999999))
-    send_verification_code(phone_number, verification_code)
 
-    # Passport rasmini saqlash
-    passport_image_path = f"passport_images/{passport_image.filename}"
-    with open(passport_image_path, "wb") as buffer:
-        shutil.copyfileobj(passport_image.file, buffer)
+    # Passport rasmini saqlash: hajm va sarlavha shu yerda tekshiriladi, qayta ishlash job'da (images.py)
+    try:
+        passport_root = tenancy.storage_path(tenancy.school_of(db), images.PASSPORT_DIR)
+        passport_image_path = await run_in_threadpool(images.receive, passport_image.file, root=passport_root)
+    except images.ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except images.ImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     # Yangi foydalanuvchini yaratish
     new_user = User(
@@ -51,6 +69,10 @@ async def register_student(
         verification_code=verification_code
     )
     db.add(new_user)
+    db.flush()
+    # SMS va rasm job'i foydalanuvchi bilan bitta tranzaksiyada navbatga qo'yiladi
+    jobs.enqueue_passport(db, new_user)
+    send_verification_code(db, phone_number, verification_code)
     db.commit()
     db.refresh(new_user)
 
@@ -80,15 +102,19 @@ def verify_code(phone_number: str, verification_code: str, db: Session = Depends
     else:
         raise HTTPException(status_code=400, detail="Noto'g'ri tasdiqlash kodi yoki telefon raqami")
 
-@router.post("/students/{student_id}/attend")
-def mark_attendance(student_id: int, db: Session = Depends(get_db)):
-    db_student = db.query(Student).filter(Student.id == student_id).first()
-    if not db_student:
+@router.post("/students/{student_id}/attend", status_code=202)
+def mark_attendance(student_id: int, group_id: Optional[int] = None, task_id: Optional[int] = None,
+                    source: str = "api", db: Session = Depends(get_db)):
+    # Student qatoriga yozilmaydi: davomat jurnalga navbat bilan tushadi (attendance.py)
+    if db.get(Student, student_id) is None:
         raise HTTPException(status_code=404, detail="Student topilmadi")
-    db_student.attendance += 1
-    db.commit()
-    db.refresh(db_student)
-    return db_student
+    if task_id is not None:
+        db_task = db.get(Task, task_id)
+        if db_task is None:
+            raise HTTPException(status_code=404, detail="Dars topilmadi")
+        group_id = group_id if group_id is not None else db_task.group_id
+    event = attendance.record(db, student_id, group_id=group_id, task_id=task_id, source=source)
+    return {"msg": "Davomat qabul qilindi", **event}
 
 
 @router.post("/groups/{group_id}/join-request/")
@@ -113,11 +139,24 @@ def send_join_request(group_id: int, db: Session = Depends(get_db), current_user
 
 
 @router.put("/tasks/{task_id}/grade")
-def grade_task(task_id: int, grade: int, db: Session = Depends(get_db)):
-    db_task = db.query(Task).filter(Task.id == task_id).first()
+def grade_task(task_id: int, grade: int, db: Session = Depends(get_db),
+               current_user: User = Depends(get_current_user)):
+    # Baho reytinglarni o'zgartiradi: faqat vazifaning o'z o'qituvchisi qo'yadi
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Faqat o'qituvchilar baholash mumkin")
+
+    # Qator qulflanadi: archive.py bu vazifani shu payt ko'chirmaydi
+    db_task = (db.query(Task).filter(Task.id == task_id, Task.teacher_id == current_user.id)
+               .with_for_update().first())
     if not db_task:
+        archived = archive.find(db, task_id)
+        if archived and archived.teacher_id == current_user.id:
+            raise HTTPException(status_code=409, detail="Vazifa arxivlangan, bahosini o'zgartirib bo'lmaydi")
         raise HTTPException(status_code=404, detail="Task topilmadi")
-    db_task.grade = grade
+    try:
+        apply_grade(db, db_task, grade)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     db.commit()
     db.refresh(db_task)
     return db_task
@@ -140,7 +179,9 @@ async def upload_task_result(
         raise HTTPException(status_code=404, detail="Vazifa topilmadi yoki siz bu vazifaning talabasi emassiz")
     
     # Natijani saqlash
-    result_path = f"task_results/{result_file.filename}"
+    results_dir = tenancy.storage_path(current_user.school_id, "task_results")
+    os.makedirs(results_dir, exist_ok=True)
+    result_path = os.path.join(results_dir, result_file.filename)
     with open(result_path, "wb") as buffer:
         shutil.copyfileobj(result_file.file, buffer)
 
@@ -152,12 +193,13 @@ async def upload_task_result(
 
 
 @router.get("/lessons/")
-def get_lessons(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_lessons(start: Optional[date] = None, end: Optional[date] = None,
+                db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     if current_user.role != "student":
         raise HTTPException(status_code=403, detail="Only students can view lessons")
 
-    lessons = db.query(Task).filter(Task.student_id == current_user.id).all()
-    return lessons
+    # Oraliq berilmasa joriy darslar; eski oraliq so'ralsa arxiv ham o'qiladi
+    return archive.lessons(db, current_user.id, start, end)
 
 @router.get("/lessons/ongoing/")
 def get_ongoing_lessons(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
@@ -166,4 +208,72 @@ def get_ongoing_lessons(db: Session = Depends(get_db), current_user: User = Depe
 
     now = datetime.now().time()
     ongoing_lessons = db.query(Task).filter(Task.start_time <= now, Task.end_time >= now, Task.student_id == current_user.id).all()
-    return ongoing_lessons
\ No newline at end of file
+    return ongoing_lessons
+
+@router.get("/rating/")
+def get_my_rating(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    if current_user.role != "student":
+        raise HTTPException(status_code=403, detail="Only students can view their rating")
+
+    db_student = db.query(Student).filter(Student.user_id == current_user.id).first()
+    if not db_student:
+        raise HTTPException(status_code=404, detail="Talaba profili topilmadi")
+    return {**summary(db_student), **breakdown(db, "student", db_student.id)}
+
+
+def _student_board(db: Session, current_user: User, group_id: Optional[int]):
+    # group_id bo'lmasa talabaning maktabi reytingi
+    if current_user.role != "student":
+        raise HTTPException(status_code=403, detail="Only students can view leaderboards")
+    db_student = db.query(Student).filter(Student.user_id == current_user.id).first()
+    if not db_student:
+        raise HTTPException(status_code=404, detail="Talaba profili topilmadi")
+    if group_id is None:
+        return db_student, school_board(db_student.school_id)
+    membership = db.query(GroupMembership.id).filter(
+        GroupMembership.group_id == group_id,
+        GroupMembership.student_id == db_student.id,
+        GroupMembership.status == "accepted",
+    ).first()
+    if not membership:
+        raise HTTPException(status_code=404, detail="Siz bu guruh a'zosi emassiz")
+    return db_student, group_board(db_student.school_id, group_id)
+
+@router.get("/leaderboard/")
+def get_leaderboard(group_id: Optional[int] = None, limit: int = 20, offset: int = 0,
+                    db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    db_student, board = _student_board(db, current_user, group_id)
+    return board_page(db, board, limit, offset, student_id=db_student.id)
+
+@router.get("/leaderboard/around-me")
+def get_leaderboard_around_me(group_id: Optional[int] = None, radius: int = 5,
+                              db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    db_student, board = _student_board(db, current_user, group_id)
+    return around_page(db, board, db_student.id, radius)
+
+@router.get("/feed/")
+def get_feed(cursor: Optional[str] = None, limit: int = 20,
+             db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    if current_user.role != "student":
+        raise HTTPException(status_code=403, detail="Only students have a feed")
+
+    db_student = db.query(Student).filter(Student.user_id == current_user.id).first()
+    if not db_student:
+        raise HTTPException(status_code=404, detail="Talaba profili topilmadi")
+    return feed.page(db, db_student, cursor, limit)
+
+@router.get("/attendance/")
+def get_my_attendance(start: Optional[date] = None, end: Optional[date] = None,
+                      db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    if current_user.role != "student":
+        raise HTTPException(status_code=403, detail="Only students can view their attendance")
+
+    db_student = db.query(Student).filter(Student.user_id == current_user.id).first()
+    if not db_student:
+        raise HTTPException(status_code=404, detail="Talaba profili topilmadi")
+    start, end = attendance.date_range(start, end)
+    return {
+        "attendance": db_student.attendance,
+        **attendance.student_rates(db, db_student.id, start, end),
+        "days": attendance.student_days(db, db_student.id, start, end),
+    }
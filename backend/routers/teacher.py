@@ -1,27 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, File, Form, UploadFile
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import shutil
 import os
 import uuid
-from models import User, Group as DBGroup, Teacher, Task, GroupMembership, Homework, Video
-from schemas import Group, GroupCreate, HomeworkCreate, HomeworkResponse, VideoCreate, VideoResponse, TaskCreate, TaskResponse
+from models import User, Group as DBGroup, Teacher, Student, Task, TaskArchive, GroupMembership, Homework, Video, Job
+from schemas import AttendanceMark, Group, GroupCreate, HomeworkCreate, HomeworkResponse, VideoCreate, VideoResponse, TaskCreate, TaskResponse
 from crud import create_group, add_member, create_homework, create_video, get_group_members_count, create_task
 from auth import get_current_user, get_db
-from datetime import datetime, timedelta
+from includes import check_page_size, loader_options, parse_include, serialize
+from ratings import apply_grade, breakdown, summary
+from leaderboard import board_page, group_board, membership_ops, stage
+import archive
+import attendance
+import feed
+import jobs
+import media
+import tenancy
+from datetime import date, datetime, timedelta
 router = APIRouter()
 
 @router.post("/tasks/", response_model=TaskResponse)
 async def create_new_task(
-    task: TaskCreate, 
+    task: str = Form(...),  # TaskCreate JSON ko'rinishida (multipart bilan JSON body birga kelolmaydi)
     video: UploadFile = File(...), 
+    notify: bool = Form(False),  # video tayyor bo'lganda SMS
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)  # Tizimga kirgan foydalanuvchi aniqlanadi
 ):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can create tasks")
 
-    uploads_dir = "uploads"
+    try:
+        task = TaskCreate.model_validate_json(task)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+    uploads_dir = tenancy.storage_path(current_user.school_id, media.UPLOADS_DIR)
     if not os.path.exists(uploads_dir):
         os.makedirs(uploads_dir)
 
@@ -31,21 +47,34 @@ async def create_new_task(
 
     with open(video_filename, "wb") as buffer:
         shutil.copyfileobj(video.file, buffer)
+        video_size = buffer.tell()
     
     db_task = Task(
         teacher_id=current_user.id,
         student_id=task.student_id,
         task_description=task.task_description,
-        grade=task.grade,
-        video_path=video_filename
+        video_path=video_filename,
+        group_id=task.group_id
     )
     
     db.add(db_task)
+    if task.grade is not None:
+        _grade(db, db_task, task.grade)
+    db.flush()
+    # Video tekshiruvi va probing job worker'da: so'rov kutib turmaydi
+    jobs.enqueue_media(db, db_task, video_filename, expected_size=video_size, user=current_user, notify=notify)
     db.commit()
     db.refresh(db_task)
     return db_task
 
 
+def _grade(db: Session, db_task: Task, grade: int):
+    try:
+        apply_grade(db, db_task, grade)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.put("/tasks/{task_id}/grade")
 def grade_task(
     task_id: int,
@@ -56,12 +85,17 @@ def grade_task(
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Faqat o'qituvchilar baholash mumkin")
 
-    db_task = db.query(Task).filter(Task.id == task_id).first()
+    # Qator qulflanadi: archive.py bu vazifani shu payt ko'chirmaydi
+    db_task = (db.query(Task).filter(Task.id == task_id, Task.teacher_id == current_user.id)
+               .with_for_update().first())
     if not db_task:
+        archived = archive.find(db, task_id)
+        if archived and archived.teacher_id == current_user.id:
+            raise HTTPException(status_code=409, detail="Vazifa arxivlangan, bahosini o'zgartirib bo'lmaydi")
         raise HTTPException(status_code=404, detail="Vazifa topilmadi")
 
-    # Baho qo'yish
-    db_task.grade = grade
+    # Baho qo'yish: reytinglar shu tranzaksiyada yangilanadi
+    _grade(db, db_task, grade)
     db.commit()
     db.refresh(db_task)
     return db_task
@@ -117,6 +151,8 @@ def accept_join_request(group_id: int, request_id: int, db: Session = Depends(ge
         raise HTTPException(status_code=404, detail="Join request not found")
 
     join_request.status = "accepted"
+    stage(db, membership_ops(join_request.student, group_id, accepted=True))
+    feed.backfill(db, join_request.student_id, group_id)
     db.commit()
     return {"detail": "Join request accepted"}
 
@@ -131,6 +167,8 @@ def reject_join_request(group_id: int, request_id: int, db: Session = Depends(ge
         raise HTTPException(status_code=404, detail="Join request not found")
 
     join_request.status = "rejected"
+    stage(db, membership_ops(join_request.student, group_id, accepted=False))
+    feed.remove(db, join_request.student_id, group_id)
     db.commit()
     return {"detail": "Join request rejected"}
 
@@ -157,11 +195,12 @@ def create_homework_route(homework: HomeworkCreate, db: Session = Depends(get_db
     return db_homework
 
 @router.post("/videos/", response_model=VideoResponse)
-def create_video_route(video: VideoCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def create_video_route(video: VideoCreate, notify: bool = False, db: Session = Depends(get_db),
+                       current_user: User = Depends(get_current_user)):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    db_video = create_video(db, video)
+    db_video = create_video(db, video, user=current_user, notify=notify)
     return db_video
 
 @router.get("/groups/{group_id}/members/count/")
@@ -201,21 +240,207 @@ async def create_lesson(
         teacher_id=current_user.id,
         student_id=lesson.student_id,
         task_description=lesson.task_description,
-        grade=lesson.grade,
         video_path=lesson.video_path,
         start_time=start_time,
-        end_time=end_time
+        end_time=end_time,
+        group_id=lesson.group_id
     )
     
     db.add(db_task)
+    if lesson.grade is not None:
+        _grade(db, db_task, lesson.grade)
     db.commit()
     db.refresh(db_task)
     return db_task
 
 @router.get("/lessons/")
-def get_lessons(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_lessons(start: Optional[date] = None, end: Optional[date] = None,
+                db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     if current_user.role != "student":
         raise HTTPException(status_code=403, detail="Only students can view lessons")
 
-    lessons = db.query(Task).filter(Task.student_id == current_user.id).all()
-    return lessons
\ No newline at end of file
+    return archive.lessons(db, current_user.id, start, end)
+
+
+# --- Dashboard uchun o'qish endpoint'lari: ?include=members.student.user,homeworks ---
+
+def _current_teacher(db: Session, current_user: User) -> Teacher:
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    db_teacher = db.query(Teacher).filter(Teacher.user_id == current_user.id).first()
+    if not db_teacher:
+        raise HTTPException(status_code=404, detail="Ushbu foydalanuvchi uchun o'qituvchi profili topilmadi")
+    return db_teacher
+
+def _teacher_students(db: Session, db_teacher: Teacher):
+    # O'qituvchi guruhlariga qabul qilingan talabalar
+    member_ids = (
+        db.query(GroupMembership.student_id)
+        .join(DBGroup, DBGroup.id == GroupMembership.group_id)
+        .filter(DBGroup.created_by == db_teacher.id, GroupMembership.status == "accepted")
+    )
+    return db.query(Student).filter(Student.id.in_(member_ids))
+
+@router.get("/groups/")
+def list_groups(include: Optional[str] = None, limit: int = 20, offset: int = 0,
+                db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    db_teacher = _current_teacher(db, current_user)
+    tree = parse_include(include, DBGroup)
+    check_page_size(limit, DBGroup, tree)
+    groups = (
+        db.query(DBGroup).options(*loader_options(DBGroup, tree))
+        .filter(DBGroup.created_by == db_teacher.id)
+        .order_by(DBGroup.id).offset(offset).limit(limit).all()
+    )
+    return [serialize(group, tree) for group in groups]
+
+@router.get("/groups/{group_id}")
+def get_group(group_id: int, include: Optional[str] = None,
+              db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    db_teacher = _current_teacher(db, current_user)
+    tree = parse_include(include, DBGroup)
+    group = (
+        db.query(DBGroup).options(*loader_options(DBGroup, tree))
+        .filter(DBGroup.id == group_id, DBGroup.created_by == db_teacher.id).first()
+    )
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found or not authorized")
+    return serialize(group, tree)
+
+@router.get("/students/")
+def list_students(include: Optional[str] = None, limit: int = 20, offset: int = 0,
+                  db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    db_teacher = _current_teacher(db, current_user)
+    tree = parse_include(include, Student)
+    check_page_size(limit, Student, tree)
+    students = (
+        _teacher_students(db, db_teacher).options(*loader_options(Student, tree))
+        .order_by(Student.id).offset(offset).limit(limit).all()
+    )
+    return [serialize(student, tree) for student in students]
+
+@router.get("/students/{student_id}")
+def get_student(student_id: int, include: Optional[str] = None,
+                db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    db_teacher = _current_teacher(db, current_user)
+    tree = parse_include(include, Student)
+    student = (
+        _teacher_students(db, db_teacher).options(*loader_options(Student, tree))
+        .filter(Student.id == student_id).first()
+    )
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found in your groups")
+    return serialize(student, tree)
+
+@router.get("/tasks/")
+def list_tasks(include: Optional[str] = None, limit: int = 20, offset: int = 0,
+               db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    tree = parse_include(include, Task)
+    check_page_size(limit, Task, tree)
+    # create_new_task teacher_id'ga foydalanuvchi id'sini yozadi
+    tasks = (
+        db.query(Task).options(*loader_options(Task, tree))
+        .filter(Task.teacher_id == current_user.id)
+        .order_by(Task.id.desc()).offset(offset).limit(limit).all()
+    )
+    return [serialize(task, tree) for task in tasks]
+
+@router.get("/tasks/{task_id}")
+def get_task(task_id: int, include: Optional[str] = None,
+             db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    tree = parse_include(include, Task)
+    task = (
+        db.query(Task).options(*loader_options(Task, tree))
+        .filter(Task.id == task_id, Task.teacher_id == current_user.id).first()
+    )
+    if not task:
+        # Eski vazifalar arxivda: id o'zgarmaydi, include'lar ham ishlaydi
+        task = archive.find(db, task_id, loader_options(TaskArchive, tree))
+        if not task or task.teacher_id != current_user.id:
+            raise HTTPException(status_code=404, detail="Vazifa topilmadi")
+    return serialize(task, tree)
+
+# --- Reyting: umumiy, guruh va fan bo'yicha ---
+
+@router.get("/rating/")
+def get_my_rating(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    db_teacher = _current_teacher(db, current_user)
+    return {**summary(db_teacher), **breakdown(db, "teacher", db_teacher.id)}
+
+@router.get("/students/{student_id}/rating")
+def get_student_rating(student_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    db_teacher = _current_teacher(db, current_user)
+    student = _teacher_students(db, db_teacher).filter(Student.id == student_id).first()
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found in your groups")
+    return {**summary(student), **breakdown(db, "student", student.id)}
+
+@router.get("/groups/{group_id}/leaderboard")
+def get_group_leaderboard(group_id: int, limit: int = 20, offset: int = 0,
+                          db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    db_teacher = _current_teacher(db, current_user)
+    group = db.query(DBGroup.id).filter(DBGroup.id == group_id, DBGroup.created_by == db_teacher.id).first()
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found or not authorized")
+    return board_page(db, group_board(current_user.school_id, group_id), limit, offset)
+
+# --- Davomat: jurnalga yoziladi, foizlar kunlik yig'indidan o'qiladi ---
+
+def _teacher_group(db: Session, current_user: User, group_id: int):
+    db_teacher = _current_teacher(db, current_user)
+    group = db.query(DBGroup.id).filter(DBGroup.id == group_id, DBGroup.created_by == db_teacher.id).first()
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found or not authorized")
+    return group
+
+def _group_member_ids(db: Session, group_id: int):
+    return [
+        student_id for (student_id,) in db.query(GroupMembership.student_id).filter(
+            GroupMembership.group_id == group_id, GroupMembership.status == "accepted"
+        ).distinct().order_by(GroupMembership.student_id)
+    ]
+
+@router.post("/groups/{group_id}/attendance", status_code=202)
+def mark_group_attendance(group_id: int, mark: AttendanceMark,
+                          db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    _teacher_group(db, current_user, group_id)
+    members = set(_group_member_ids(db, group_id))
+    unknown = sorted(set(mark.student_ids) - members)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Not members of this group: {unknown}")
+    rows = attendance.record_many(db, sorted(set(mark.student_ids)), group_id, task_id=mark.task_id)
+    return {"detail": "Attendance accepted", "count": len(rows)}
+
+@router.get("/groups/{group_id}/attendance")
+def get_group_attendance(group_id: int, start: Optional[date] = None, end: Optional[date] = None,
+                         db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    _teacher_group(db, current_user, group_id)
+    start, end = attendance.date_range(start, end)
+    return attendance.group_rates(db, group_id, _group_member_ids(db, group_id), start, end)
+
+# --- Fon ishlari (video qayta ishlash va h.k.) holati ---
+
+@router.get("/jobs/")
+def list_jobs(target_type: str, target_id: int,
+              db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    found = (
+        db.query(Job)
+        .filter(Job.target_type == target_type, Job.target_id == target_id, Job.created_by == current_user.id)
+        .order_by(Job.id.desc()).limit(20).all()
+    )
+    return [jobs.describe(job) for job in found]
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    job = db.query(Job).filter(Job.id == job_id, Job.created_by == current_user.id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.describe(job)
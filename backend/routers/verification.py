@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from crud import create_verification_code, verify_code, generate_verification_code
 from schemas import VerificationCode
 from auth import get_db
+from notifications import enqueue_message
 
 router = APIRouter()
 
@@ -13,8 +14,12 @@ def send_code(verification_data: VerificationCode, db: Session = Depends(get_db)
     user = create_verification_code(db, verification_data.phone_number, verification_code)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    # Bu yerda siz kodni yuborishingiz kerak bo'ladi
-    # SMS yuborishning o'rniga test kodini qaytaramiz
+    enqueue_message(
+        db, "sms", verification_data.phone_number, f"Tasdiqlash kodi: {verification_code}",
+        dedup_key=f"verify:{verification_data.phone_number}:{verification_code}",
+    )
+    db.commit()
+    # Test uchun kodni ham qaytaramiz
     return {"msg": "Verification code sent", "code": verification_code}
 
 @router.post("/verify_code/")
@@ -1,8 +1,8 @@
 from pydantic import BaseModel
 from typing import Optional
 from pydantic import BaseModel
-from typing import Optional
-from datetime import time
+from typing import List, Optional
+from datetime import datetime, time
 
 class UserBase(BaseModel):
     id: int
@@ -41,6 +41,7 @@ class TaskCreate(BaseModel):
     student_result_path: Optional[str] = None
     start_time: Optional[time] = None
     end_time: Optional[time] = None
+    group_id: Optional[int] = None
     class Config:
         orm_mode = True
 
@@ -54,6 +55,10 @@ class TaskResponse(BaseModel):
     student_result_path: Optional[str]
     start_time: Optional[time]
     end_time: Optional[time]
+    group_id: Optional[int] = None
+    graded_at: Optional[datetime] = None
+    media_status: Optional[str] = None
+    media_info: Optional[dict] = None
 
     class Config:
         orm_mode = True
@@ -100,6 +105,12 @@ class HomeworkResponse(HomeworkBase):
 
 class VideoResponse(VideoCreate):
     id: int
+    media_status: Optional[str] = None
+    media_info: Optional[dict] = None
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class AttendanceMark(BaseModel):
+    student_ids: List[int]
+    task_id: Optional[int] = None
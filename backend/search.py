@@ -0,0 +1,351 @@
+"""Full-text search over groups, homeworks and videos.
+
+    GET /search/?q=algebra mash&types=group,homework&limit=20&offset=0
+
+Every query word must match, and each word also matches as a prefix ("mash"
+finds "mashq"). Results are ranked by relevance; pages are fetched with one
+extra row to tell whether there is a next page, so no COUNT is needed.
+Homeworks and videos only come back from groups the caller belongs to.
+
+On MySQL the FULLTEXT indexes from migration 2c7f4e9a1b53 do the work
+(MATCH ... AGAINST in boolean mode). Elsewhere (SQLite, tests) an inverted
+index in the worker is used: BM25 scores, with prefixes expanded over a sorted
+vocabulary. There is one index per database in database.engines (ids repeat
+across databases); documents keep their school_id, and a query only scores the
+caller's school. The indexes are built at startup and every
+SEARCH_REBUILD_SECONDS; create_group/create_homework/create_video add new
+documents to them once their transaction commits.
+"""
+import bisect
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from fastapi import HTTPException
+from sqlalchemy import event, literal, select, union_all
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.orm import Session
+
+import tenancy
+from database import DEFAULT_DATABASE, engines
+from models import Group, Homework, Video
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")  # auto, mysql, memory
+SEARCH_REBUILD_SECONDS = float(os.getenv("SEARCH_REBUILD_SECONDS", "600"))
+MAX_QUERY_TERMS = 8
+MAX_PAGE_SIZE = 50
+MAX_PREFIX_EXPANSIONS = 50
+MIN_PREFIX_LENGTH = 2
+TITLE_WEIGHT = 2  # title words count twice
+PREFIX_WEIGHT = 0.7  # a prefix-only match scores less than the whole word
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# type -> (model, title column, other text columns)
+DOCUMENTS = {
+    "group": (Group, Group.name, (Group.description,)),
+    "homework": (Homework, Homework.title, (Homework.description,)),
+    "video": (Video, Video.title, ()),
+}
+
+_WORD = re.compile(r"\w+(?:'\w+)*")
+_APOSTROPHES = str.maketrans({"‘": "'", "’": "'", "ʻ": "'", "ʼ": "'", "`": "'"})
+
+
+def tokenize(text) -> list:
+    if not text:
+        return []
+    return _WORD.findall(text.lower().translate(_APOSTROPHES))
+
+
+def _group_of(doc_type: str, doc) -> int:
+    return doc.id if doc_type == "group" else doc.group_id
+
+
+class InvertedIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.postings = defaultdict(dict)  # term -> {doc key: weighted term frequency}
+        self.vocabulary = []  # sorted terms, for prefix lookups
+        self.doc_terms = {}  # doc key -> terms, to remove a document again
+        self.doc_length = {}
+        self.doc_school = {}
+        self.doc_group = {}
+        self.total_length = 0
+
+    def _add(self, key, school_id, group_id, title, texts):
+        self._remove(key)
+        counts = defaultdict(int)
+        for word in tokenize(title):
+            counts[word] += TITLE_WEIGHT
+        for text in texts:
+            for word in tokenize(text):
+                counts[word] += 1
+        for term, count in counts.items():
+            if term not in self.postings:
+                bisect.insort(self.vocabulary, term)
+            self.postings[term][key] = count
+        self.doc_terms[key] = list(counts)
+        self.doc_length[key] = sum(counts.values())
+        self.doc_school[key] = school_id
+        self.doc_group[key] = group_id
+        self.total_length += self.doc_length[key]
+
+    def _remove(self, key):
+        for term in self.doc_terms.pop(key, ()):
+            docs = self.postings[term]
+            docs.pop(key, None)
+            if not docs:
+                del self.postings[term]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+        self.total_length -= self.doc_length.pop(key, 0)
+        self.doc_school.pop(key, None)
+        self.doc_group.pop(key, None)
+
+    def add(self, key, school_id, group_id, title, texts=()):
+        with self._lock:
+            self._add(key, school_id, group_id, title, texts)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def replace(self, documents):
+        """documents: iterable of (key, school_id, group_id, title, texts)."""
+        fresh = InvertedIndex()
+        for document in documents:
+            fresh._add(*document)
+        with self._lock:
+            for name in ("postings", "vocabulary", "doc_terms", "doc_length", "doc_school", "doc_group",
+                         "total_length"):
+                setattr(self, name, getattr(fresh, name))
+
+    def _expand(self, word):
+        """[(term, weight)] for the word itself and the terms it is a prefix of."""
+        terms = [(word, 1.0)] if word in self.postings else []
+        if len(word) >= MIN_PREFIX_LENGTH:
+            start = bisect.bisect_right(self.vocabulary, word)
+            for term in self.vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+                if not term.startswith(word):
+                    break
+                terms.append((term, PREFIX_WEIGHT))
+        return terms
+
+    def search(self, words, types, school_id, groups, limit: int):
+        """Top `limit` (key, score) of the school; every word has to match.
+
+        school_id=None: every school; groups=None: no group filter.
+        """
+        with self._lock:
+            total_docs = len(self.doc_length)
+            if not total_docs or not words:
+                return []
+            average_length = self.total_length / total_docs
+            scores = None
+            for word in words:
+                word_scores = defaultdict(float)
+                for term, weight in self._expand(word):
+                    docs = self.postings[term]
+                    idf = math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for key, frequency in docs.items():
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_length[key] / average_length)
+                        word_scores[key] = max(word_scores[key], weight * idf * frequency * (BM25_K1 + 1) / (frequency + norm))
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {key: score + word_scores[key] for key, score in scores.items() if key in word_scores}
+                if not scores:
+                    return []
+            candidates = (
+                (key, score) for key, score in scores.items()
+                if key[0] in types and (school_id is None or self.doc_school[key] == school_id)
+                and (groups is None or key[0] == "group" or self.doc_group[key] in groups)
+            )
+            return heapq.nlargest(limit, candidates, key=lambda item: (item[1], item[0][1]))
+
+
+class MemorySearchBackend:
+    is_remote = False
+
+    def __init__(self, binds: dict, rebuild_interval: float = SEARCH_REBUILD_SECONDS):
+        self.binds = binds  # database name -> engine
+        self.rebuild_interval = rebuild_interval
+        self.indexes = {name: InvertedIndex() for name in binds}
+        self.ready = threading.Event()
+        self._replay = None  # (database, document) committed while a rebuild is reading
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, documents):
+        """documents: (database, document) pairs."""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.extend(documents)
+        for database, document in documents:
+            self.indexes[database].add(*document)
+
+    def _documents(self, conn):
+        for doc_type, (model, title, texts) in DOCUMENTS.items():
+            group_column = model.id if doc_type == "group" else model.group_id
+            for row in conn.execute(select(model.id, model.school_id, group_column, title, *texts)):
+                yield (doc_type, row[0]), row[1], row[2], row[3], row[4:]
+
+    def rebuild(self):
+        started = time.perf_counter()
+        with self._lock:
+            self._replay = []
+        try:
+            for name, bind in self.binds.items():
+                with bind.connect() as conn:
+                    self.indexes[name].replace(self._documents(conn))
+        finally:
+            with self._lock:
+                replay, self._replay = self._replay, None
+        self.add(replay)
+        self.ready.set()
+        logger.info("Search indexes rebuilt: %d documents in %.2fs",
+                    sum(len(index.doc_length) for index in self.indexes.values()), time.perf_counter() - started)
+
+    def search(self, db: Session, words, types, groups, offset: int, limit: int):
+        if not self.ready.is_set():
+            raise HTTPException(status_code=503, detail="Search index is being built", headers={"Retry-After": "5"})
+        index = self.indexes[tenancy.database_of(db)]
+        return index.search(words, types, tenancy.school_of(db), groups, offset + limit)[offset:]
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="search-rebuild", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.rebuild()
+            except Exception:
+                logger.exception("Search index rebuild failed")
+            # Until the first rebuild succeeds, retry every 30s
+            if self._stop.wait(self.rebuild_interval if self.ready.is_set() else 30):
+                break
+
+
+class MySQLSearchBackend:
+    """FULLTEXT indexes do the work; nothing to keep in memory."""
+
+    is_remote = True
+
+    def add(self, documents):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def search(self, db: Session, words, types, groups, offset: int, limit: int):
+        against = " ".join(f"+{word}*" for word in words)
+        selects = []
+        for doc_type, (model, title, texts) in DOCUMENTS.items():
+            if doc_type not in types:
+                continue
+            score = match(title, *texts, against=against).in_boolean_mode()
+            stmt = select(literal(doc_type).label("type"), model.id.label("id"), score.label("score")).where(score)
+            if groups is not None and doc_type != "group":
+                stmt = stmt.where(model.group_id.in_(groups))
+            school_id = tenancy.school_of(db)
+            if school_id is not None:
+                stmt = stmt.where(model.school_id == school_id)
+            selects.append(stmt)
+        query = union_all(*selects).subquery()
+        rows = db.execute(
+            select(query.c.type, query.c.id, query.c.score)
+            .order_by(query.c.score.desc(), query.c.id.desc()).offset(offset).limit(limit)
+        ).all()
+        return [((doc_type, doc_id), score) for doc_type, doc_id, score in rows]
+
+
+def _default_backend():
+    name = SEARCH_BACKEND
+    if name == "auto":
+        name = "mysql" if engines[DEFAULT_DATABASE].dialect.name == "mysql" else "memory"
+    if name == "mysql":
+        return MySQLSearchBackend()
+    return MemorySearchBackend(engines)
+
+
+backend = _default_backend()
+
+
+def stage(db: Session, doc_type: str, doc):
+    """Queues a new group/homework/video for the in-process index; call after flush."""
+    _, title, texts = DOCUMENTS[doc_type]
+    document = ((doc_type, doc.id), doc.school_id, _group_of(doc_type, doc), getattr(doc, title.key),
+                tuple(getattr(doc, column.key) for column in texts))
+    db.info.setdefault("search_documents", []).append(document)
+
+
+@event.listens_for(Session, "after_commit")
+def _index_staged(session):
+    documents = session.info.pop("search_documents", None)
+    if not documents:
+        return
+    try:
+        database = tenancy.database_of(session)
+        backend.add([(database, document) for document in documents])
+    except Exception:
+        logger.exception("Search index update failed")
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_staged(session):
+    session.info.pop("search_documents", None)
+
+
+def search(db: Session, q: str, types, groups, limit: int, offset: int) -> dict:
+    if not 1 <= limit <= MAX_PAGE_SIZE or offset < 0:
+        raise HTTPException(status_code=400, detail=f"limit must be 1-{MAX_PAGE_SIZE} and offset non-negative")
+    unknown = set(types) - set(DOCUMENTS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown types: {', '.join(sorted(unknown))}")
+    words = list(dict.fromkeys(tokenize(q)))
+    if not words:
+        raise HTTPException(status_code=400, detail="q must contain at least one word")
+    if len(words) > MAX_QUERY_TERMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_QUERY_TERMS} words per query")
+
+    hits = backend.search(db, words, set(types), groups, offset, limit + 1)
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    # Sarlavhalar: har bir tur uchun bitta so'rov
+    ids = defaultdict(list)
+    for (doc_type, doc_id), _ in hits:
+        ids[doc_type].append(doc_id)
+    titles = {}
+    for doc_type, doc_ids in ids.items():
+        model, title, _ = DOCUMENTS[doc_type]
+        group_column = model.id if doc_type == "group" else model.group_id
+        for doc_id, group_id, value in db.execute(select(model.id, group_column, title).where(model.id.in_(doc_ids))):
+            titles[(doc_type, doc_id)] = (group_id, value)
+    results = [
+        {"type": key[0], "id": key[1], "group_id": titles[key][0], "title": titles[key][1], "score": float(score)}
+        for key, score in hits if key in titles
+    ]
+    return {"query": q, "results": results, "offset": offset, "limit": limit, "has_more": has_more}
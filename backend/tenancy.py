@@ -0,0 +1,266 @@
+"""Schools (tenants).
+
+Rows of every school-owned table carry school_id (models.SchoolScoped). A
+request's school comes from its host, <slug>TENANT_HOST_SUFFIX, and from the
+"school" claim of its token; when both are there they have to agree. Without
+either the request belongs to TENANT_DEFAULT_SCHOOL_ID. When that is 0, such a
+request reads no school data and cannot write any.
+
+Scoping: the do_orm_execute listener adds `school_id = <school>` to every ORM
+SELECT, UPDATE and DELETE that touches a SchoolScoped model. It uses
+with_loader_criteria, so joins and relationship loads are filtered too.
+before_flush stamps new rows. A session's school is
+session.info["school_id"] (get_current_user sets it from the token), else the
+request's school. A session with neither (background workers, scripts) sees
+every school. Core statements run on an engine are not scoped.
+
+Routing: schools.database names an entry of TENANT_DATABASE_URLS (database.py)
+and the session's statements go to that engine instead of the primary. The
+schools table lives in the default database; it is read through a cache that
+refreshes every SCHOOL_CACHE_SECONDS. Every database is migrated on its own.
+Background workers (jobs, outbox, attendance, leaderboards, feed trimming) poll
+every database in database.engines, and what they stage from a request goes to
+the request's database (database_of()). Ids are only unique within one
+database, so anything keyed by id outside of it (leaderboard names) carries the
+school. Several SQLite files are enough to try it:
+
+    export DATABASE_URL=sqlite:///main.db TENANT_DATABASE_URLS=big=sqlite:///big.db
+    python tenancy.py --migrate
+    python tenancy.py --add big "Big School" --database big --storage-prefix schools/big
+    python tenancy.py --list
+    python jobs.py
+
+Storage: uploads of a school with a storage_prefix go under that directory
+(storage_path()); schools without one keep the old layout.
+"""
+import argparse
+import os
+import threading
+import time
+from collections import namedtuple
+from contextvars import ContextVar
+
+from fastapi import HTTPException
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, with_loader_criteria
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+from database import DEFAULT_DATABASE, TENANT_DATABASE_URLS, engine, shard_engines
+from models import School, SchoolScoped
+
+DEFAULT_SCHOOL_ID = 1  # the migration creates it; rows written without a school belong to it
+TENANT_DEFAULT_SCHOOL_ID = int(os.getenv("TENANT_DEFAULT_SCHOOL_ID", str(DEFAULT_SCHOOL_ID)))  # 0: required
+TENANT_HOST_SUFFIX = os.getenv("TENANT_HOST_SUFFIX", "")  # e.g. ".maktab.uz"
+SCHOOL_CACHE_SECONDS = float(os.getenv("SCHOOL_CACHE_SECONDS", "60"))
+MISS_RELOAD_SECONDS = 1.0  # an unknown slug or id reloads the cache at most this often
+# No school is known yet: matches no rows, and new rows cannot be written
+UNKNOWN_SCHOOL = 0
+
+SchoolInfo = namedtuple("SchoolInfo", "id slug database storage_prefix")
+
+
+class RequestSchool:
+    def __init__(self, school_id: int, from_host: bool):
+        self.school_id = school_id
+        self.from_host = from_host
+
+
+# TenantMiddleware sets this per request; None (background threads, scripts) means every school
+request_school: ContextVar = ContextVar("request_school", default=None)
+
+
+class SchoolDirectory:
+    """Cached copy of the schools table of the default database."""
+
+    def __init__(self, bind=engine, ttl: float = SCHOOL_CACHE_SECONDS):
+        self.bind = bind
+        self.ttl = ttl
+        self._by_id = {}
+        self._by_slug = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def reload(self):
+        with self.bind.connect() as conn:
+            rows = conn.execute(select(School.id, School.slug, School.database, School.storage_prefix)).all()
+        entries = [SchoolInfo(*row) for row in rows]
+        with self._lock:
+            self._by_id = {school.id: school for school in entries}
+            self._by_slug = {school.slug: school for school in entries}
+            self._loaded_at = time.monotonic()
+
+    def _lookup(self, index: str, key):
+        found = getattr(self, index).get(key)
+        age = time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+        if age is None or age >= self.ttl or (found is None and age >= MISS_RELOAD_SECONDS):
+            self.reload()
+            found = getattr(self, index).get(key)
+        return found
+
+    def get(self, school_id: int):
+        return self._lookup("_by_id", school_id)
+
+    def by_slug(self, slug: str):
+        return self._lookup("_by_slug", slug)
+
+    def all(self):
+        self.reload()
+        return sorted(self._by_id.values())
+
+
+schools = SchoolDirectory()
+
+
+def school_of(session: Session):
+    if "school_id" in session.info:
+        return session.info["school_id"]
+    current = request_school.get()
+    return current.school_id if current is not None else None
+
+
+def bind_token_school(session: Session, claim):
+    """Scopes the session to the school in the token; tokens from before tenancy have none."""
+    school_id = int(claim) if claim is not None else (TENANT_DEFAULT_SCHOOL_ID or UNKNOWN_SCHOOL)
+    current = request_school.get()
+    if current is not None and current.from_host and current.school_id != school_id:
+        raise HTTPException(status_code=401, detail="Token belongs to another school",
+                            headers={"WWW-Authenticate": "Bearer"})
+    session.info["school_id"] = school_id
+
+
+def database_of(session: Session) -> str:
+    """Name of the database the session's school is on (a key of database.engines)."""
+    if not shard_engines:
+        return DEFAULT_DATABASE
+    school_id = school_of(session)
+    school = schools.get(school_id) if school_id else None
+    if school is None or school.database == DEFAULT_DATABASE:
+        return DEFAULT_DATABASE
+    if school.database not in shard_engines:
+        raise RuntimeError(f"School {school_id} is on database '{school.database}', "
+                           f"which is missing from TENANT_DATABASE_URLS")
+    return school.database
+
+
+def school_engine(session: Session):
+    """Engine of the session's school database; None for the default database."""
+    name = database_of(session)
+    return None if name == DEFAULT_DATABASE else shard_engines[name]
+
+
+def storage_path(school_id: int, directory: str) -> str:
+    school = schools.get(school_id) if school_id else None
+    if school is None or not school.storage_prefix:
+        return directory
+    return os.path.join(school.storage_prefix, directory)
+
+
+# --- Sessiya hodisalari ---
+
+@event.listens_for(Session, "do_orm_execute")
+def _scope_to_school(state):
+    if not (state.is_select or state.is_update or state.is_delete) or state.is_column_load:
+        return
+    if state.execution_options.get("all_schools"):
+        return
+    school_id = school_of(state.session)
+    if school_id is None:
+        return
+    state.statement = state.statement.options(
+        with_loader_criteria(SchoolScoped, lambda cls: cls.school_id == school_id, include_aliases=True)
+    )
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_school(session, flush_context, instances):
+    school_id = school_of(session)
+    if school_id is None:
+        return
+    for obj in session.new:
+        if not isinstance(obj, SchoolScoped) or obj.school_id is not None:
+            continue
+        if school_id == UNKNOWN_SCHOOL:
+            raise HTTPException(status_code=400, detail="School is not known")
+        obj.school_id = school_id
+
+
+# --- Middleware ---
+
+def host_slug(scope):
+    if not TENANT_HOST_SUFFIX:
+        return None
+    for name, value in scope.get("headers", []):
+        if name == b"host":
+            host = value.decode("latin-1").split(":", 1)[0].lower()
+            if host.endswith(TENANT_HOST_SUFFIX) and len(host) > len(TENANT_HOST_SUFFIX):
+                return host[:-len(TENANT_HOST_SUFFIX)]
+            return None
+    return None
+
+
+class TenantMiddleware:
+    def __init__(self, app, directory: SchoolDirectory = None):
+        self.app = app
+        self.directory = directory or schools
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        slug = host_slug(scope)
+        if slug is None:
+            current = RequestSchool(TENANT_DEFAULT_SCHOOL_ID or UNKNOWN_SCHOOL, from_host=False)
+        else:
+            if self.directory.fresh():
+                school = self.directory.by_slug(slug)
+            else:
+                school = await run_in_threadpool(self.directory.by_slug, slug)
+            if school is None:
+                return await JSONResponse({"detail": "School not found"}, status_code=404)(scope, receive, send)
+            current = RequestSchool(school.id, from_host=True)
+        token = request_school.set(current)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_school.reset(token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--migrate", action="store_true", help="upgrade the default and every school database")
+    parser.add_argument("--add", nargs=2, metavar=("SLUG", "NAME"), help="register a school")
+    parser.add_argument("--database", default=DEFAULT_DATABASE, help="with --add: a TENANT_DATABASE_URLS name")
+    parser.add_argument("--storage-prefix", help="with --add: directory for the school's uploads")
+    parser.add_argument("--list", action="store_true", help="list the schools")
+    args = parser.parse_args()
+
+    from database import SQLALCHEMY_DATABASE_URL, SessionLocal
+    from migrations import upgrade_to_head
+
+    if args.migrate:
+        for name, url in [(DEFAULT_DATABASE, SQLALCHEMY_DATABASE_URL), *TENANT_DATABASE_URLS.items()]:
+            print(f"migrating {name}")
+            upgrade_to_head(url)
+    if args.add:
+        if args.database != DEFAULT_DATABASE and args.database not in TENANT_DATABASE_URLS:
+            parser.error(f"--database {args.database} is not in TENANT_DATABASE_URLS")
+        slug, name = args.add
+        # No school on the session: this goes to the default database, where the directory is
+        db = SessionLocal()
+        try:
+            school = School(slug=slug, name=name, database=args.database, storage_prefix=args.storage_prefix)
+            db.add(school)
+            db.commit()
+            print(f"school {school.id} ({slug}) on {args.database}")
+        finally:
+            db.close()
+    if args.list:
+        for school in schools.all():
+            print(f"{school.id:>5}  {school.slug:<20} {school.database:<12} {school.storage_prefix or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Two SQLite files in a temporary directory: the default database and the
+database of the "big" school (TENANT_DATABASE_URLS). Settings are read when
+the modules are imported, so they are set here first.
+
+    python -m pytest tests      # from backend/; needs pytest
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DATA_DIR = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{DATA_DIR}/default.db",
+    "TENANT_DATABASE_URLS": f"big=sqlite:///{DATA_DIR}/big.db",
+    "TENANT_HOST_SUFFIX": ".maktab.uz",
+    "SCHEMA_CHECK": "off",
+    "JOB_WORKERS": "0",
+})
+for name in ("DATABASE_REPLICA_URLS", "RATE_LIMIT_REDIS_URL", "LEADERBOARD_REDIS_URL", "LOOP_BLOCK_FAIL_MS"):
+    os.environ.pop(name, None)
+
+from sqlalchemy import delete  # noqa: E402
+
+from database import SQLALCHEMY_DATABASE_URL, TENANT_DATABASE_URLS, SessionLocal, engines  # noqa: E402
+from migrations import upgrade_to_head  # noqa: E402
+from models import (  # noqa: E402
+    AttendanceDaily, AttendanceEvent, FeedItem, Group, GroupMembership, Homework, IdempotencyKey, Job, OutboxMessage,
+    RatingBreakdown, RollupWatermark, School, Student, Task, TaskArchive, Teacher, User, Video,
+)
+
+BIG_SCHOOL_HOST = "big.maktab.uz"
+# Child tables first
+CLEARED = (OutboxMessage, Job, AttendanceEvent, AttendanceDaily, RollupWatermark, FeedItem, Homework, Video, Task,
+           TaskArchive, RatingBreakdown, GroupMembership, Group, Student, Teacher, User, IdempotencyKey)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    for url in (SQLALCHEMY_DATABASE_URL, *TENANT_DATABASE_URLS.values()):
+        upgrade_to_head(url)
+    db = SessionLocal()
+    try:
+        school = School(slug="big", name="Big School", database="big")
+        db.add(school)
+        db.commit()
+        return {"default": 1, "big": school.id}
+    finally:
+        db.close()
+
+
+@pytest.fixture(autouse=True)
+def clean_tables():
+    yield
+    for bind in engines.values():
+        with bind.begin() as conn:
+            for model in CLEARED:
+                conn.execute(delete(model.__table__))
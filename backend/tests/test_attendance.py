@@ -0,0 +1,122 @@
+"""Attendance log: buffered writes, compaction into rollups, and rates."""
+from datetime import date, datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import insert, select, update
+
+import attendance
+from attendance import AttendanceCompactor, AttendanceWriter
+from database import engines
+from models import AttendanceDaily, Student
+
+bind = engines["default"]
+DAY = datetime(2026, 10, 5, 8, 0)
+
+
+@pytest.fixture(autouse=True)
+def students():
+    with bind.begin() as conn:
+        conn.execute(insert(Student.__table__), [
+            {"id": 1, "attendance": 3.0, "attendance_baseline": 3.0},
+            {"id": 2, "attendance": 0.0, "attendance_baseline": 0.0},
+        ])
+
+
+def check_in(student_id, occurred_at, group_id=1):
+    writer = AttendanceWriter(bind)
+    writer.record([dict(school_id=1, student_id=student_id, group_id=group_id, task_id=None, source="api",
+                        occurred_at=occurred_at)])
+    return writer.flush()
+
+
+def counters():
+    with bind.connect() as conn:
+        return dict(conn.execute(select(Student.id, Student.attendance)).all())
+
+
+def rollups():
+    with bind.connect() as conn:
+        return conn.execute(
+            select(AttendanceDaily.student_id, AttendanceDaily.day, AttendanceDaily.events)
+            .order_by(AttendanceDaily.student_id, AttendanceDaily.day)).all()
+
+
+def test_events_are_counted_once_across_compaction_runs():
+    compactor = AttendanceCompactor(bind, settle=0, batch=2)
+    for hour in range(3):
+        check_in(1, DAY + timedelta(hours=hour))
+
+    assert compactor.compact() == 3
+    assert compactor.compact() == 0
+    check_in(1, DAY + timedelta(days=1))
+    check_in(2, DAY)
+    assert compactor.compact() == 2
+
+    assert counters() == {1: 7.0, 2: 1.0}  # student 1 had 3 before the log
+    assert rollups() == [(1, DAY.date(), 3), (1, DAY.date() + timedelta(days=1), 1), (2, DAY.date(), 1)]
+    assert compactor.check(report=lambda line: None) == 0
+
+
+def test_unsettled_events_wait_for_the_next_run():
+    check_in(1, DAY)
+
+    assert AttendanceCompactor(bind, settle=3600).compact() == 0
+    assert counters()[1] == 3.0
+    assert AttendanceCompactor(bind, settle=0).compact() == 1
+    assert counters()[1] == 4.0
+
+
+def test_rebuild_matches_incremental_compaction():
+    compactor = AttendanceCompactor(bind, settle=0)
+    for hour in range(4):
+        check_in(1 + hour % 2, DAY + timedelta(hours=hour))
+    compactor.compact()
+    folded = counters(), rollups()
+
+    assert compactor.rebuild() == 4
+    assert (counters(), rollups()) == folded
+
+
+def test_check_reports_a_drifted_counter():
+    compactor = AttendanceCompactor(bind, settle=0)
+    check_in(1, DAY)
+    compactor.compact()
+    with bind.begin() as conn:
+        conn.execute(update(Student.__table__).where(Student.id == 1).values(attendance=10.0))
+
+    reports = []
+    assert compactor.check(report=reports.append) == 1
+    assert "student 1" in reports[0]
+
+
+def test_full_buffer_rejects_check_ins():
+    writer = AttendanceWriter(bind, max_pending=1)
+    row = dict(school_id=1, student_id=1, group_id=None, task_id=None, source="api", occurred_at=DAY)
+    writer.record([row])
+
+    with pytest.raises(HTTPException) as error:
+        writer.record([row])
+    assert error.value.status_code == 503
+
+
+def test_rates_use_the_groups_session_days():
+    check_in(1, DAY)
+    check_in(1, DAY + timedelta(days=1))
+    check_in(2, DAY + timedelta(days=1))
+    check_in(2, DAY + timedelta(days=2), group_id=None)
+    AttendanceCompactor(bind, settle=0).compact()
+    start, end = DAY.date(), DAY.date() + timedelta(days=6)
+
+    with bind.connect() as conn:
+        mine = attendance.student_rates(conn, 2, start, end)
+        group = attendance.group_rates(conn, 1, [1, 2], start, end)
+
+    assert (mine["attended_days"], mine["session_days"], mine["rate"], mine["ungrouped_days"]) == (1, 2, 0.5, 1)
+    assert [(member["student_id"], member["rate"]) for member in group["members"]] == [(1, 1.0), (2, 0.5)]
+    assert group["rate"] == 0.75
+
+
+def test_range_is_limited():
+    with pytest.raises(HTTPException):
+        attendance.date_range(date(2025, 1, 1), date(2026, 6, 1))
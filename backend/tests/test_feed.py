@@ -0,0 +1,133 @@
+"""Student feed: cursor paging, fan-out on read, backfill and trimming."""
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+import crud
+import feed
+from database import SessionLocal, engines
+from models import FeedItem, Group, GroupMembership, Student, Video
+from schemas import HomeworkCreate
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+def make_group(db, *members):
+    group = Group(name="7-A", created_by=1)
+    db.add(group)
+    db.flush()
+    for student in members:
+        db.add(GroupMembership(group_id=group.id, student_id=student.id, status="accepted"))
+    db.commit()
+    return group
+
+
+def make_students(db, count):
+    students = [Student(rating_sum=0, rating_count=0) for _ in range(count)]
+    db.add_all(students)
+    db.commit()
+    return students
+
+
+def homework(db, group, title="Uy vazifasi"):
+    return crud.create_homework(db, HomeworkCreate(title=title, description="", group_id=group.id))
+
+
+def video(db, group, title="Dars videosi"):
+    item = Video(title=title, group_id=group.id)
+    db.add(item)
+    db.flush()
+    feed.fan_out(db, "video", item)
+    db.commit()
+    return item
+
+
+def walk(db, student, limit):
+    """Every (type, id) of the feed, page by page."""
+    seen, cursor = [], None
+    while True:
+        result = feed.page(db, student, cursor, limit)
+        seen.extend((item["type"], item["id"]) for item in result["items"])
+        cursor = result["next_cursor"]
+        if cursor is None:
+            return seen
+
+
+def feed_rows(student):
+    with engines["default"].connect() as conn:
+        return conn.execute(select(func.count()).select_from(FeedItem).where(FeedItem.student_id == student.id)).scalar()
+
+
+def test_pages_walk_every_item_once_newest_first(db):
+    ali, vali = make_students(db, 2)
+    group = make_group(db, ali, vali)
+    created = [("homework", homework(db, group).id) for _ in range(7)] + [("video", video(db, group).id) for _ in range(2)]
+
+    items = walk(db, ali, limit=2)
+
+    assert sorted(items) == sorted(created)
+    assert items[:2] == [created[-1], created[-2]]  # videos were added last
+    assert walk(db, vali, limit=50) == items
+
+
+def test_large_group_is_read_on_demand(db, monkeypatch):
+    monkeypatch.setattr(feed, "FEED_FANOUT_LIMIT", 1)
+    ali, vali = make_students(db, 2)
+    group = make_group(db, ali, vali)
+
+    item = homework(db, group)
+
+    db.refresh(group)
+    assert group.fanout_on_read
+    assert feed_rows(ali) == 0
+    assert walk(db, ali, limit=10) == [("homework", item.id)]
+
+
+def test_fanned_out_and_on_demand_items_merge_without_duplicates(db, monkeypatch):
+    ali, vali = make_students(db, 2)
+    big, small = make_group(db, ali, vali), make_group(db, ali)
+    before = homework(db, big, "oldin")  # fanned out while the group was small
+    monkeypatch.setattr(feed, "FEED_FANOUT_LIMIT", 1)
+    between = homework(db, small, "kichik guruh")
+    after = homework(db, big, "keyin")  # switches the big group to fan-out on read
+
+    assert walk(db, ali, limit=1) == [("homework", after.id), ("homework", between.id), ("homework", before.id)]
+
+
+def test_backfill_and_remove_on_membership_change(db):
+    ali, vali = make_students(db, 2)
+    group = make_group(db, ali)
+    items = [homework(db, group).id for _ in range(3)]
+
+    feed.backfill(db, vali.id, group.id)
+    db.commit()
+    assert sorted(item_id for _, item_id in walk(db, vali, limit=10)) == items
+
+    feed.remove(db, vali.id, group.id)
+    db.commit()
+    assert walk(db, vali, limit=10) == []
+
+
+def test_trimmer_keeps_the_newest_items(db):
+    ali, = make_students(db, 1)
+    group = make_group(db, ali)
+    items = [homework(db, group).id for _ in range(5)]
+    trimmer = feed.FeedTrimmer(engines, max_items=2)
+
+    trimmer.touch("default", [group.id])
+
+    assert trimmer.trim() == 3
+    assert walk(db, ali, limit=10) == [("homework", items[4]), ("homework", items[3])]
+
+
+def test_bad_cursor_is_rejected(db):
+    ali, = make_students(db, 1)
+
+    with pytest.raises(HTTPException) as error:
+        feed.page(db, ali, "not-a-cursor", 10)
+    assert error.value.status_code == 400
@@ -0,0 +1,79 @@
+"""Idempotency-Key: replays, key reuse with a different body, and failures."""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from database import engines
+from idempotency import IdempotencyMiddleware, IdempotencyStore
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def client(calls):
+    app = FastAPI()
+    app.add_middleware(IdempotencyMiddleware, store=IdempotencyStore(engines["default"]))
+
+    @app.post("/groups", status_code=201)
+    def create_group(body: dict):
+        calls.append(body)
+        return {"id": len(calls), **body}
+
+    @app.post("/broken")
+    def broken():
+        calls.append(None)
+        raise RuntimeError("bazaga ulanib bo'lmadi")
+
+    return TestClient(app, raise_server_exceptions=False)
+
+
+def post(client, body, key="abc", token="Bearer ali"):
+    return client.post("/groups", json=body, headers={"Idempotency-Key": key, "Authorization": token})
+
+
+def test_retry_gets_the_stored_response(client, calls):
+    first = post(client, {"name": "7-A"})
+    again = post(client, {"name": "7-A"})
+
+    assert (again.status_code, again.json()) == (201, first.json())
+    assert again.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert len(calls) == 1
+
+
+def test_different_body_under_the_same_key_is_a_conflict(client, calls):
+    post(client, {"name": "7-A"})
+
+    response = post(client, {"name": "7-B"})
+
+    assert response.status_code == 409
+    assert "different request" in response.json()["detail"]
+    assert len(calls) == 1
+
+
+def test_keys_are_scoped_to_the_caller(client, calls):
+    post(client, {"name": "7-A"})
+
+    response = post(client, {"name": "7-A"}, token="Bearer vali")
+
+    assert "idempotent-replayed" not in response.headers
+    assert len(calls) == 2
+
+
+def test_failed_request_can_be_retried(client, calls):
+    headers = {"Idempotency-Key": "abc"}
+
+    assert client.post("/broken", headers=headers).status_code == 500
+    assert client.post("/broken", headers=headers).status_code == 500
+    assert len(calls) == 2
+
+
+def test_requests_without_a_key_run_every_time(client, calls):
+    client.post("/groups", json={"name": "7-A"})
+    client.post("/groups", json={"name": "7-A"})
+
+    assert len(calls) == 2
+    assert client.post("/groups", json={}, headers={"Idempotency-Key": ""}).status_code == 400
@@ -0,0 +1,153 @@
+"""Job runner: claims, retries with backoff, leases and the process pool."""
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+import jobs
+from database import SessionLocal, engines
+from jobs import JobRunner, Kind
+from models import Job, OutboxMessage
+
+bind = engines["default"]
+
+
+class PermanentError(Exception):
+    permanent = True
+
+
+@pytest.fixture(autouse=True)
+def kinds(monkeypatch):
+    monkeypatch.setitem(jobs.KINDS, "test.pid", Kind(os.getpid, max_attempts=3, max_running=2, timeout=60))
+    monkeypatch.setitem(jobs.KINDS, "test.stat", Kind(os.stat, max_attempts=3, timeout=60))
+
+
+def enqueue(kind="test.pid", payload=None, notify=None):
+    db = SessionLocal()
+    try:
+        job = jobs.enqueue(db, kind, payload or {}, notify=notify)
+        db.commit()
+        return job.id
+    finally:
+        db.close()
+
+
+def job_row(job_id):
+    with bind.connect() as conn:
+        return conn.execute(select(Job.__table__).where(Job.id == job_id)).one()
+
+
+def make_due(job_id, **values):
+    with bind.begin() as conn:
+        conn.execute(update(Job.__table__).where(Job.id == job_id).values(**values))
+
+
+def claimed_ids(runner, limit=10):
+    return [job_id for job_id, _, _ in runner._claim("default", limit)]
+
+
+def test_failure_is_retried_with_growing_backoff():
+    runner = JobRunner(workers=1)
+    job_id = enqueue()
+
+    for attempt, delay in ((1, 10), (2, 20)):
+        assert claimed_ids(runner) == [job_id]
+        started = datetime.utcnow()
+        runner._finish("default", job_id, None, RuntimeError("ffmpeg crashed"))
+        job = job_row(job_id)
+        assert (job.status, job.attempts, job.last_error) == ("queued", attempt, "ffmpeg crashed")
+        assert abs((job.run_after - started).total_seconds() - delay) < 2
+        assert claimed_ids(runner) == []  # waits for run_after
+        make_due(job_id, run_after=datetime.utcnow() - timedelta(seconds=1))
+
+
+def test_job_fails_after_max_attempts_and_notifies():
+    runner = JobRunner(workers=1)
+    job_id = enqueue(notify="998901")
+
+    for _ in range(3):
+        claimed_ids(runner)
+        runner._finish("default", job_id, None, RuntimeError("boom"))
+        make_due(job_id, run_after=datetime.utcnow() - timedelta(seconds=1))
+
+    job = job_row(job_id)
+    assert (job.status, job.attempts) == ("failed", 3)
+    assert job.finished_at is not None
+    with bind.connect() as conn:
+        assert conn.execute(select(OutboxMessage.dedup_key)).scalars().all() == [f"job:{job_id}:failed"]
+
+
+def test_permanent_error_fails_at_once():
+    runner = JobRunner(workers=1)
+    job_id = enqueue()
+    claimed_ids(runner)
+
+    runner._finish("default", job_id, None, PermanentError("not a video"))
+
+    assert (job_row(job_id).status, job_row(job_id).attempts) == ("failed", 1)
+
+
+def test_expired_lease_is_taken_over_by_another_runner():
+    first, second = JobRunner(workers=1), JobRunner(workers=1)
+    job_id = enqueue()
+    assert claimed_ids(first) == [job_id]
+    assert claimed_ids(second) == []  # leased
+
+    make_due(job_id, locked_until=datetime.utcnow() - timedelta(seconds=1))
+    assert claimed_ids(second) == [job_id]
+    first._finish("default", job_id, 1, None)  # too late: ignored
+
+    job = job_row(job_id)
+    assert (job.status, job.locked_by, job.attempts) == ("running", second.id, 2)
+    second._finish("default", job_id, 2, None)
+    assert (job_row(job_id).status, job_row(job_id).result) == ("succeeded", 2)
+
+
+def test_lease_expiring_on_the_last_attempt_fails_the_job():
+    runner = JobRunner(workers=1)
+    job_id = enqueue()
+    claimed_ids(runner)
+    make_due(job_id, attempts=3, locked_until=datetime.utcnow() - timedelta(seconds=1))
+
+    assert claimed_ids(runner) == []
+    assert (job_row(job_id).status, job_row(job_id).last_error) == ("failed", "Lease expired on the last attempt")
+
+
+def test_max_running_limits_claims_per_kind():
+    runner = JobRunner(workers=10)
+    job_ids = [enqueue() for _ in range(3)]
+
+    assert claimed_ids(runner) == job_ids[:2]
+    assert claimed_ids(runner) == []
+
+
+def test_released_jobs_go_back_to_the_queue():
+    runner = JobRunner(workers=1)
+    job_id = enqueue()
+    claimed_ids(runner)
+
+    runner._release("default", [job_id])
+
+    job = job_row(job_id)
+    assert (job.status, job.attempts, job.locked_by) == ("queued", 0, None)
+    assert claimed_ids(JobRunner(workers=1)) == [job_id]
+
+
+def test_pool_runs_jobs_and_records_results():
+    runner = JobRunner(workers=1)
+    ok, missing = enqueue(), enqueue("test.stat", {"path": "/nonexistent/file"})
+    runner._pool = runner._new_pool()
+    try:
+        runner.run_once()
+        deadline = time.monotonic() + 60
+        while runner._inflight and time.monotonic() < deadline:
+            time.sleep(0.1)
+            runner.run_once()
+    finally:
+        runner._pool.shutdown()
+
+    assert job_row(ok).status == "succeeded"
+    assert job_row(ok).result != os.getpid()  # ran in a pool process
+    assert (job_row(missing).status, job_row(missing).attempts) == ("queued", 1)
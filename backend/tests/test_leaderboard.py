@@ -0,0 +1,96 @@
+"""Leaderboard ranks, ties, staged updates and rebuilds."""
+import pytest
+from sqlalchemy import event, insert
+
+from database import SessionLocal, engines
+from leaderboard import Leaderboards, MemorySortedSets, leaderboards, school_board, stage
+from models import Student
+
+
+@pytest.fixture
+def boards():
+    return Leaderboards(MemorySortedSets(), [engines["default"]])
+
+
+def ranking(boards, board="school:1"):
+    return [(entry["rank"], entry["student_id"], entry["rating"]) for entry in boards.page(board, 0, 10)]
+
+
+def test_ranks_by_rating_and_ties_by_id_descending(boards):
+    boards.apply([("set", "school:1", 1, 4.5), ("set", "school:1", 2, 4.5), ("set", "school:1", 3, 5.0)])
+
+    assert ranking(boards) == [(1, 3, 5.0), (2, 2, 4.5), (3, 1, 4.5)]
+    assert boards.position("school:1", 1) == (3, 4.5)
+    assert boards.position("school:1", 4) is None
+
+
+def test_update_moves_student_and_remove_drops_them(boards):
+    boards.apply([("set", "school:1", 1, 3.0), ("set", "school:1", 2, 4.0)])
+
+    boards.apply([("set", "school:1", 1, 4.8), ("remove", "school:1", 2, None)])
+
+    assert ranking(boards) == [(1, 1, 4.8)]
+    assert boards.size("school:1") == 1
+
+
+def test_pages_and_around(boards):
+    boards.apply([("set", "school:1", student_id, float(student_id)) for student_id in range(1, 11)])
+
+    assert [entry["student_id"] for entry in boards.page("school:1", 2, 5)] == [8, 7, 6]
+    assert [entry["rank"] for entry in boards.around("school:1", 5, 2)] == [4, 5, 6, 7, 8]
+    assert [entry["student_id"] for entry in boards.around("school:1", 10, 1)] == [10, 9]
+
+
+def _students(*ratings):
+    with engines["default"].begin() as conn:
+        for student_id, rating in enumerate(ratings, start=1):
+            conn.execute(insert(Student.__table__).values(
+                id=student_id, rating=rating, rating_sum=0, rating_count=1 if rating is not None else 0))
+
+
+def test_rebuild_reads_graded_students(boards):
+    _students(4.0, None, 4.5)
+    boards.apply([("set", "school:1", 99, 5.0)])  # not in the database any more
+
+    boards.rebuild()
+
+    assert ranking(boards) == [(1, 3, 4.5), (2, 1, 4.0)]
+    assert boards.ready.is_set()
+
+
+def test_updates_during_rebuild_are_replayed(boards):
+    _students(4.0, 3.0)
+    bind = engines["default"]
+    applied = []
+
+    def grade_committed_meanwhile(conn, cursor, statement, parameters, context, executemany):
+        if not applied:
+            applied.append(True)
+            boards.apply([("set", "school:1", 2, 5.0)])
+
+    event.listen(bind, "before_cursor_execute", grade_committed_meanwhile)
+    try:
+        boards.rebuild()
+    finally:
+        event.remove(bind, "before_cursor_execute", grade_committed_meanwhile)
+
+    # The snapshot read 3.0 for student 2; the replayed update wins
+    assert ranking(boards) == [(1, 2, 5.0), (2, 1, 4.0)]
+
+
+def test_staged_updates_apply_only_after_commit():
+    board = school_board(77)
+    db = SessionLocal()
+    try:
+        db.query(Student).count()
+        stage(db, [("set", board, 1, 4.0)])
+        db.rollback()
+        assert leaderboards.size(board) == 0
+
+        db.query(Student).count()
+        stage(db, [("set", board, 1, 4.0)])
+        db.commit()
+        assert leaderboards.position(board, 1) == (1, 4.0)
+    finally:
+        db.close()
+        leaderboards.apply([("remove", board, 1, None)])
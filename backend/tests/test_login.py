@@ -0,0 +1,50 @@
+"""Login throttle calls stay off the event loop when the backend is remote."""
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app, login_throttle
+from rate_limit import MemoryBackend
+
+
+class RemoteBackend(MemoryBackend):
+    """MemoryBackend that says it is remote and records which thread calls it."""
+
+    is_remote = True
+
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+
+    def ttl(self, key: str) -> float:
+        self.threads.append(threading.current_thread().name)
+        return super().ttl(key)
+
+    def incr(self, key: str, ttl: float) -> int:
+        self.threads.append(threading.current_thread().name)
+        return super().incr(key, ttl)
+
+
+@pytest.fixture
+def remote_backend(monkeypatch):
+    backend = RemoteBackend()
+    monkeypatch.setattr(login_throttle, "backend", backend)
+    return backend
+
+
+def test_remote_throttle_runs_in_threadpool(remote_backend):
+    response = TestClient(app).post("/token", data={"username": "nobody", "password": "x"})
+
+    assert response.status_code == 401
+    assert len(remote_backend.threads) == 2  # locked_for, record_failure
+    assert all(name.startswith("AnyIO worker thread") for name in remote_backend.threads)
+
+
+def test_locked_user_is_rejected_before_password_check(remote_backend):
+    remote_backend.set("lock:locked|testclient", 30)
+
+    response = TestClient(app).post("/token", data={"username": "locked", "password": "x"})
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
@@ -0,0 +1,74 @@
+"""Event loop block detection; LOOP_BLOCK_FAIL_MS fails the request that blocked."""
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import loop_monitor
+from loop_monitor import LoopBlockedError, LoopMonitor, LoopMonitorMiddleware
+
+
+@pytest.fixture
+def monitor(monkeypatch):
+    monitor = LoopMonitor(threshold_ms=20)
+    monkeypatch.setattr(loop_monitor, "monitor", monitor)
+    monkeypatch.setattr(loop_monitor, "LOOP_BLOCK_FAIL_MS", "50")
+    return monitor
+
+
+@pytest.fixture
+def client(monitor):
+    app = FastAPI()
+    app.add_middleware(LoopMonitorMiddleware)
+
+    @app.on_event("startup")
+    async def start_monitor():
+        monitor.start()
+
+    @app.on_event("shutdown")
+    def stop_monitor():
+        monitor.stop()
+
+    @app.get("/blocking")
+    async def blocking():
+        time.sleep(0.3)
+        return {}
+
+    @app.get("/sleeping")
+    async def sleeping():
+        await asyncio.sleep(0.3)
+        return {}
+
+    with TestClient(app) as client:
+        yield client
+
+
+def wait_for_episodes(monitor, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not monitor.episodes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return list(monitor.episodes)
+
+
+def test_blocking_route_fails_in_test_mode(client, monitor):
+    with pytest.raises(LoopBlockedError, match="/blocking blocked the event loop"):
+        client.get("/blocking")
+
+    [episode] = wait_for_episodes(monitor)
+    assert episode["route"] == "/blocking"
+    assert episode["blocked_ms"] >= 50
+    assert "time.sleep(0.3)" in episode["stack"]
+
+
+def test_awaiting_route_passes(client, monitor):
+    assert client.get("/sleeping").status_code == 200
+    assert not wait_for_episodes(monitor, timeout=0.2)
+
+
+def test_blocks_are_only_recorded_without_test_mode(client, monitor, monkeypatch):
+    monkeypatch.setattr(loop_monitor, "LOOP_BLOCK_FAIL_MS", None)
+
+    assert client.get("/blocking").status_code == 200
+    assert [episode["route"] for episode in wait_for_episodes(monitor)] == ["/blocking"]
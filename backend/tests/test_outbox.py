@@ -0,0 +1,164 @@
+"""Outbox delivery through a provider, retries and dedup_key."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, insert, update
+
+import notifications
+from database import SessionLocal, engine
+from models import OutboxMessage, User
+from notifications import FakeProvider, OutboxDispatcher, enqueue_message, register_provider
+
+
+@pytest.fixture
+def fake():
+    provider = FakeProvider("fake")
+    register_provider("fake", provider)
+    yield provider
+    notifications.providers.pop("fake", None)
+
+
+def enqueue(*messages, provider="fake"):
+    db = SessionLocal()
+    try:
+        for recipient, body in messages:
+            enqueue_message(db, provider, recipient, body)
+        db.commit()
+    finally:
+        db.close()
+
+
+def outbox():
+    with engine.connect() as conn:
+        return conn.execute(
+            OutboxMessage.__table__.select().order_by(OutboxMessage.id)).all()
+
+
+def test_dispatch_delivers_pending_messages(fake):
+    enqueue(("998901", "salom"), ("998902", "xayr"))
+    dispatcher = OutboxDispatcher()
+
+    assert dispatcher.dispatch_once() == 2
+    assert fake.sent == [("998901", "salom"), ("998902", "xayr")]
+    assert [row.status for row in outbox()] == ["sent", "sent"]
+    assert dispatcher.stats()["sent_total"] == 2
+    assert dispatcher.stats()["queue_depth"] == 0
+
+
+def test_same_text_to_same_recipient_is_sent_once(fake):
+    enqueue(("998901", "salom"), ("998901", "salom"))
+
+    OutboxDispatcher().dispatch_once()
+
+    assert fake.sent == [("998901", "salom")]
+    assert [row.status for row in outbox()] == ["sent", "sent"]
+
+
+def test_failed_message_is_retried_after_backoff(fake):
+    fake.fail_times = 1
+    enqueue(("998901", "salom"))
+    dispatcher = OutboxDispatcher()
+
+    dispatcher.dispatch_once()
+    [row] = outbox()
+    assert (row.status, row.attempts, row.last_error) == ("pending", 1, "fake failure")
+    assert row.next_attempt_at > datetime.utcnow()
+    assert dispatcher.dispatch_once() == 0  # not due yet
+
+    with engine.begin() as conn:
+        conn.execute(update(OutboxMessage.__table__).values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+    assert dispatcher.dispatch_once() == 1
+    assert fake.sent == [("998901", "salom")]
+    assert dispatcher.stats()["retried_total"] == 1
+
+
+def test_message_fails_after_max_attempts(fake, monkeypatch):
+    monkeypatch.setattr(notifications, "OUTBOX_MAX_ATTEMPTS", 1)
+    fake.fail_times = 1
+    enqueue(("998901", "salom"))
+    dispatcher = OutboxDispatcher()
+
+    dispatcher.dispatch_once()
+
+    [row] = outbox()
+    assert (row.status, row.attempts) == ("failed", 1)
+    assert dispatcher.stats()["failed_total"] == 1
+
+
+def test_unknown_provider_fails_without_retry():
+    enqueue(("998901", "salom"), provider="pigeon")
+
+    OutboxDispatcher().dispatch_once()
+
+    [row] = outbox()
+    assert (row.status, row.last_error) == ("failed", "Unknown provider: pigeon")
+
+
+def test_provider_rate_limit_defers_the_rest(fake):
+    limited = FakeProvider("limited", rate=0.01, burst=1)
+    register_provider("limited", limited)
+    try:
+        enqueue(("998901", "bir"), ("998902", "ikki"), provider="limited")
+        OutboxDispatcher().dispatch_once()
+    finally:
+        notifications.providers.pop("limited", None)
+
+    assert limited.sent == [("998901", "bir")]
+    assert [row.status for row in outbox()] == ["sent", "pending"]
+
+
+def test_console_provider_masks_codes(caplog):
+    enqueue(("998901", "Tasdiqlash kodi: 483920"), provider="sms")
+
+    with caplog.at_level("INFO", logger="notifications"):
+        OutboxDispatcher().dispatch_once()
+
+    assert "Tasdiqlash kodi: ******" in caplog.text
+    assert "483920" not in caplog.text
+
+
+# --- dedup_key ---
+
+def test_dedup_key_returns_the_existing_message():
+    ids = []
+    for _ in range(2):
+        db = SessionLocal()
+        try:
+            message = enqueue_message(db, "fake", "998901", "kod", dedup_key="verify:998901:1")
+            db.commit()
+            ids.append(message.id)
+        finally:
+            db.close()
+
+    assert ids[0] == ids[1]
+    assert len(outbox()) == 1
+
+
+def test_dedup_conflict_keeps_the_callers_rows():
+    db = SessionLocal()
+    raced = []
+
+    @event.listens_for(db, "do_orm_execute")
+    def commit_same_key_elsewhere(state):
+        # Another request commits the same key right after this one's lookup missed
+        if raced or not state.is_select:
+            return None
+        result = state.invoke_statement()
+        with engine.begin() as conn:
+            conn.execute(insert(OutboxMessage.__table__).values(
+                provider="fake", recipient="998901", body="birinchi", dedup_key="verify:998901:1",
+                status="pending", attempts=0, next_attempt_at=datetime.utcnow()))
+        raced.append(True)
+        return result
+
+    try:
+        db.add(User(username="ali", fullname="Ali", phone_number="998901", role="pending"))
+        message = enqueue_message(db, "fake", "998901", "ikkinchi", dedup_key="verify:998901:1")
+        db.commit()
+
+        assert raced
+        assert message.body == "birinchi"
+        assert db.query(User).filter(User.username == "ali").count() == 1
+        assert [row.body for row in outbox()] == ["birinchi"]
+    finally:
+        db.close()
@@ -0,0 +1,50 @@
+"""Route sampling (PROFILE_ROUTES) and admin-requested profiles."""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import profiling
+from profiling import ProfilingMiddleware, list_profiles
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_ROUTES", profiling._parse_routes("GET /sampled=1"))
+    monkeypatch.setattr(profiling, "_is_admin", lambda scope: dict(scope["headers"]).get(b"authorization") == b"admin")
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware)
+
+    @app.get("/sampled")
+    def sampled():
+        return {}
+
+    @app.get("/plain")
+    def plain():
+        return {}
+
+    return TestClient(app)
+
+
+def test_sampled_request_is_profiled_without_telling_the_client(client):
+    response = client.get("/sampled")
+
+    assert "x-profile-id" not in response.headers
+    assert [meta["route"] for meta in list_profiles()] == ["/sampled"]
+
+
+def test_admin_gets_the_profile_id(client):
+    response = client.get("/plain", headers={"X-Profile": "1", "Authorization": "admin"})
+
+    assert [meta["id"] for meta in list_profiles()] == [response.headers["x-profile-id"]]
+
+
+def test_admin_flag_on_a_sampled_route_returns_the_id(client):
+    assert "x-profile-id" in client.get("/sampled", headers={"X-Profile": "1", "Authorization": "admin"}).headers
+
+
+def test_flag_from_anyone_else_is_ignored(client):
+    response = client.get("/plain", headers={"X-Profile": "1"})
+
+    assert "x-profile-id" not in response.headers
+    assert list_profiles() == []
@@ -0,0 +1,17 @@
+"""Per-connection query timing survives failing statements."""
+import pytest
+from sqlalchemy import exc, text
+
+import query_stats  # noqa: F401  (registers the listeners)
+from database import make_engine
+
+
+def test_failed_statement_does_not_leave_a_start_time(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path}/stats.db")
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(exc.OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+        conn.execute(text("SELECT 1"))
+
+        assert conn.info["query_started_at"] == []
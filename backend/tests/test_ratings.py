@@ -0,0 +1,113 @@
+"""Incremental ratings: grades, re-grades and the recompute that checks them."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select
+
+import ratings
+from database import SessionLocal, engines
+from models import RatingBreakdown, Student, Task, TaskArchive, Teacher
+
+bind = engines["default"]
+NOW = datetime(2026, 10, 5, 12, 0)
+STUDENT_USER, TEACHER_USER = 10, 20
+
+
+@pytest.fixture
+def db():
+    with bind.begin() as conn:
+        conn.execute(insert(Student.__table__).values(id=1, user_id=STUDENT_USER))
+        conn.execute(insert(Teacher.__table__).values(id=1, user_id=TEACHER_USER, subject="Matematika"))
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+def task(db, group_id=5):
+    item = Task(student_id=STUDENT_USER, teacher_id=TEACHER_USER, group_id=group_id, task_description="Mashq")
+    db.add(item)
+    db.commit()
+    return item
+
+
+def grade(db, item, value, days=0):
+    ratings.apply_grade(db, item, value, now=NOW + timedelta(days=days))
+    db.commit()
+
+
+def stored():
+    """Owner aggregates and non-empty breakdowns as they are in the database."""
+    with bind.connect() as conn:
+        owners = [conn.execute(select(model.rating, model.rating_sum, model.rating_count, model.rating_decayed)).all()
+                  for model in (Student, Teacher)]
+        table = RatingBreakdown.__table__
+        rows = conn.execute(
+            select(table.c.owner_type, table.c.dimension, table.c.dimension_key, table.c.rating_sum,
+                   table.c.rating_count).where(table.c.rating_count != 0)).all()
+    return owners, sorted(rows)
+
+
+def test_regrades_match_recompute(db):
+    first, second, third = task(db), task(db), task(db, group_id=6)
+    grade(db, first, 5)
+    grade(db, second, 3, days=1)
+    grade(db, third, 4, days=2)
+    grade(db, first, 2, days=3)  # re-grade
+    grade(db, third, None, days=4)  # grade taken back
+    with bind.begin() as conn:  # archived tasks count as well
+        conn.execute(insert(TaskArchive.__table__).values(
+            id=99, student_id=STUDENT_USER, teacher_id=TEACHER_USER, group_id=6, grade=5,
+            graded_at=NOW - timedelta(days=30), graded_subject="Matematika"))
+    ratings.recompute(bind, now=NOW + timedelta(days=4))  # picks up the archived grade
+    grade(db, second, 4, days=5)
+    now = NOW + timedelta(days=5)
+
+    assert ratings.recompute(bind, check=True, now=now, report=lambda line: None) == 0
+    owners, rows = stored()
+    assert ratings.recompute(bind, now=now) == 2
+    rebuilt_owners, rebuilt_rows = stored()
+    assert rebuilt_rows == rows
+    for rebuilt, incremental in zip(rebuilt_owners, owners):
+        assert [tuple(row) for row in rebuilt] == [pytest.approx(tuple(row)) for row in incremental]
+    assert owners[0][0][:3] == (11 / 3, 11, 3)
+    assert ("student", "group", "5", 6, 2) in rows and ("teacher", "group", "6", 5, 1) in rows
+
+
+def test_regrade_stays_in_the_subject_it_was_graded_under(db):
+    item = task(db)
+    grade(db, item, 3)
+    db.query(Teacher).update({Teacher.subject: "Fizika"})
+    db.commit()
+
+    grade(db, item, 5, days=1)
+
+    subjects = [row[2:] for row in stored()[1] if row[1] == "subject"]
+    assert subjects == [("Matematika", 5, 1)]
+    assert item.graded_subject == "Matematika"
+    assert ratings.recompute(bind, check=True, now=NOW + timedelta(days=1), report=lambda line: None) == 0
+
+
+def test_recent_grades_weigh_more(db):
+    old, new = task(db), task(db)
+    grade(db, old, 2)
+    grade(db, new, 4, days=ratings.RATING_HALF_LIFE_DAYS)
+
+    student = db.query(Student).one()
+    db.refresh(student)
+    assert student.rating == 3.0
+    assert student.rating_decayed == pytest.approx((2 * 0.5 + 4) / 1.5)
+
+
+def test_check_reports_drift(db):
+    grade(db, task(db), 4)
+    with bind.begin() as conn:
+        conn.execute(Student.__table__.update().values(rating_sum=40))
+
+    reports = []
+    assert ratings.recompute(bind, check=True, now=NOW, report=reports.append) == 1
+    assert reports[0].startswith("student 1")
+
+
+def test_grade_out_of_range_is_rejected(db):
+    with pytest.raises(ValueError):
+        ratings.apply_grade(db, task(db), 6)
@@ -0,0 +1,117 @@
+"""Read replica routing and fallback to the primary, with two SQLite files."""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import Column, Integer, MetaData, String, Table, exc, insert, select, text, update
+from sqlalchemy.orm import sessionmaker
+
+from database import make_engine
+from rate_limit import MemoryBackend
+from replicas import ReadRoutingMiddleware, ReplicaSet, RequestRouting, RoutingSession, request_routing
+
+metadata = MetaData()
+notes = Table("notes", metadata, Column("id", Integer, primary_key=True), Column("body", String(20)))
+
+
+@pytest.fixture
+def primary(tmp_path):
+    return _database(tmp_path / "primary.db", "primary")
+
+
+@pytest.fixture
+def replicas(tmp_path):
+    return ReplicaSet([_database(tmp_path / "replica.db", "replica")], eject_seconds=60)
+
+
+@pytest.fixture
+def session(primary, replicas):
+    db = sessionmaker(class_=RoutingSession, bind=primary, replicas=replicas)()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def read_only_request():
+    token = request_routing.set(RequestRouting(replica_ok=True))
+    yield
+    request_routing.reset(token)
+
+
+def _database(path, body: str):
+    engine = make_engine(f"sqlite:///{path}")
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(notes).values(id=1, body=body))
+    return engine
+
+
+def read(db) -> str:
+    return db.execute(select(notes.c.body).where(notes.c.id == 1)).scalar()
+
+
+def test_read_only_request_reads_from_replica(session, read_only_request):
+    assert read(session) == "replica"
+
+
+def test_background_work_reads_from_primary(session):
+    assert read(session) == "primary"
+
+
+def test_session_reads_primary_after_it_writes(session, read_only_request):
+    session.execute(update(notes).values(body="primary"))
+    assert read(session) == "primary"
+    assert request_routing.get().wrote
+
+
+def test_locking_read_goes_to_primary(session, read_only_request):
+    assert session.execute(select(notes.c.body).with_for_update()).scalar() == "primary"
+
+
+def test_failing_replica_is_ejected(session, replicas, read_only_request):
+    with replicas.engines[0].begin() as conn:
+        conn.execute(text("DROP TABLE notes"))
+
+    with pytest.raises(exc.OperationalError):
+        read(session)
+    session.rollback()
+
+    assert replicas.healthy() == []
+    assert read(session) == "primary"
+
+
+def test_health_check_ejects_unreachable_replica(tmp_path):
+    replicas = ReplicaSet([make_engine(f"sqlite:///{tmp_path}/missing/replica.db")])
+
+    replicas.check_all()
+
+    assert replicas.healthy() == []
+    assert replicas.choose() is None
+
+
+# --- Middleware ---
+
+async def echo_target(scope, receive, send):
+    routing = request_routing.get()
+    if scope["method"] == "POST":
+        routing.wrote = True
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"replica" if routing.replica_ok else b"primary"})
+
+
+@pytest.fixture
+def client(replicas):
+    return TestClient(ReadRoutingMiddleware(echo_target, replicas=replicas, backend=MemoryBackend()))
+
+
+def test_get_reads_from_replica_and_post_from_primary(client):
+    assert client.get("/").text == "replica"
+    assert client.post("/").text == "primary"
+
+
+def test_client_reads_its_own_writes_from_primary(client):
+    alice = {"Authorization": "Bearer alice"}
+    bob = {"Authorization": "Bearer bob"}
+
+    client.post("/", headers=alice)
+
+    assert client.get("/", headers=alice).text == "primary"
+    assert client.get("/", headers=bob).text == "replica"
@@ -0,0 +1,96 @@
+"""In-process search: prefix matching, ranking, group filter and pagination."""
+import pytest
+from fastapi import HTTPException
+
+import crud
+from database import SessionLocal
+from models import Group
+from schemas import GroupCreate, HomeworkCreate
+from search import backend, search, stage
+
+
+@pytest.fixture
+def db():
+    backend.rebuild()  # start from the (empty) database
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+def group(db, name, description=None):
+    return crud.create_group(db, GroupCreate(name=name, description=description), creator_id=1)
+
+
+def titles(result):
+    return [hit["title"] for hit in result["results"]]
+
+
+def test_word_matches_as_prefix(db):
+    group(db, "Mashqlar to'plami")
+    group(db, "Tarix")
+
+    assert titles(search(db, "mash", ["group"], None, 10, 0)) == ["Mashqlar to'plami"]
+    assert titles(search(db, "to‘plami", ["group"], None, 10, 0)) == ["Mashqlar to'plami"]  # apostrophe variants
+
+
+def test_every_word_has_to_match(db):
+    group(db, "Algebra 7-sinf")
+    group(db, "Algebra 8-sinf")
+
+    assert titles(search(db, "algebra 8", ["group"], None, 10, 0)) == ["Algebra 8-sinf"]
+    assert titles(search(db, "algebra fizika", ["group"], None, 10, 0)) == []
+
+
+def test_title_match_ranks_above_description_match(db):
+    group(db, "Fizika", description="algebra")
+    group(db, "Algebra", description="fizika")
+
+    assert titles(search(db, "algebra", ["group"], None, 10, 0)) == ["Algebra", "Fizika"]
+
+
+def test_whole_word_ranks_above_prefix(db):
+    group(db, "Algebralik")
+    group(db, "Algebra")
+
+    assert titles(search(db, "algebra", ["group"], None, 10, 0)) == ["Algebra", "Algebralik"]
+
+
+def test_homeworks_only_from_visible_groups(db):
+    mine, other = group(db, "7-A"), group(db, "7-B")
+    crud.create_homework(db, HomeworkCreate(title="Kasrlar", description="1-mashq", group_id=mine.id))
+    crud.create_homework(db, HomeworkCreate(title="Kasrlar", description="2-mashq", group_id=other.id))
+
+    result = search(db, "kasr", ["homework"], {mine.id}, 10, 0)
+
+    assert [hit["group_id"] for hit in result["results"]] == [mine.id]
+    assert len(search(db, "kasr", ["homework"], None, 10, 0)["results"]) == 2
+
+
+def test_pages_follow_the_ranking(db):
+    for number in range(5):
+        group(db, f"Geometriya {number}")
+
+    first = search(db, "geometriya", ["group"], None, 2, 0)
+    last = search(db, "geometriya", ["group"], None, 2, 4)
+    everything = search(db, "geometriya", ["group"], None, 10, 0)
+
+    assert first["has_more"] and not last["has_more"]
+    assert titles(first) + titles(search(db, "geometriya", ["group"], None, 2, 2)) + titles(last) == titles(everything)
+    assert len(set(titles(everything))) == 5
+
+
+def test_rolled_back_document_is_not_indexed(db):
+    draft = Group(name="Qoralama", created_by=1)
+    db.add(draft)
+    db.flush()
+    stage(db, "group", draft)
+    db.rollback()
+
+    assert titles(search(db, "qoralama", ["group"], None, 10, 0)) == []
+
+
+def test_bad_queries_are_rejected(db):
+    for q, types, limit in (("", ["group"], 10), ("algebra", ["lesson"], 10), ("algebra", ["group"], 0)):
+        with pytest.raises(HTTPException) as error:
+            search(db, q, types, None, limit, 0)
+        assert error.value.status_code == 400
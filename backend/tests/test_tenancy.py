@@ -0,0 +1,182 @@
+"""School isolation across the default database and a school database.
+
+Both databases get a student with id 1 in group 1, so anything that reads or
+writes the wrong database shows up as the other school's data.
+"""
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert, select
+
+import attendance
+import jobs
+from auth import create_access_token
+from conftest import BIG_SCHOOL_HOST
+from database import engines, worker_sessions
+from leaderboard import group_board, leaderboards, school_board
+from main import app
+from models import AttendanceDaily, AttendanceEvent, Group, GroupMembership, Job, OutboxMessage, Student, User
+from notifications import FakeProvider, OutboxDispatcher, enqueue_message, providers, register_provider
+from search import InvertedIndex, backend as search_backend
+
+
+@pytest.fixture
+def students(schema):
+    """School id -> database name; the student in school N has rating N."""
+    placement = {schema["default"]: "default", schema["big"]: "big"}
+    for school_id, database in placement.items():
+        with engines[database].begin() as conn:
+            conn.execute(insert(User.__table__).values(
+                id=1, username="ali", fullname=f"Ali {database}", role="student", phone_number="998901",
+                school_id=school_id))
+            conn.execute(insert(Student.__table__).values(
+                id=1, user_id=1, attendance=0.0, attendance_baseline=0.0, rating=float(school_id),
+                rating_sum=school_id, rating_count=1, school_id=school_id))
+            conn.execute(insert(Group.__table__).values(id=1, name=f"Algebra {database}", school_id=school_id))
+            conn.execute(insert(GroupMembership.__table__).values(
+                group_id=1, student_id=1, status="accepted", school_id=school_id))
+    return placement
+
+
+@pytest.fixture
+def client():
+    # No `with`: the background workers stay off, the tests drive them
+    return TestClient(app)
+
+
+def compact_all():
+    for writer in attendance.writers.values():
+        writer.flush()
+    for name, bind in engines.items():
+        attendance.AttendanceCompactor(bind, settle=0).compact()
+
+
+def rows(database: str, *columns):
+    with engines[database].connect() as conn:
+        return conn.execute(select(*columns)).all()
+
+
+# --- Davomat ---
+
+def test_check_in_is_written_to_the_school_database(client, students, schema):
+    response = client.post("/student/students/1/attend", params={"group_id": 1}, headers={"host": BIG_SCHOOL_HOST})
+    assert response.status_code == 202
+    assert response.json()["school_id"] == schema["big"]
+
+    compact_all()
+
+    assert rows("big", AttendanceEvent.school_id, AttendanceEvent.student_id) == [(schema["big"], 1)]
+    assert rows("big", AttendanceDaily.school_id, AttendanceDaily.events) == [(schema["big"], 1)]
+    assert rows("big", Student.attendance) == [(1.0,)]
+    assert rows("default", AttendanceEvent.id) == []
+    assert rows("default", Student.attendance) == [(0.0,)]
+
+
+def test_check_in_without_school_host_stays_in_default_database(client, students, schema):
+    assert client.post("/student/students/1/attend").status_code == 202
+
+    compact_all()
+
+    assert rows("default", AttendanceEvent.school_id) == [(schema["default"],)]
+    assert rows("default", Student.attendance) == [(1.0,)]
+    assert rows("big", AttendanceEvent.id) == []
+
+
+def test_attendance_check_passes_on_every_database(client, students):
+    client.post("/student/students/1/attend", headers={"host": BIG_SCHOOL_HOST})
+    client.post("/student/students/1/attend")
+    compact_all()
+
+    reports = []
+    for bind in engines.values():
+        assert attendance.AttendanceCompactor(bind).check(report=reports.append) == 0
+    assert reports == []
+
+
+# --- Reyting ---
+
+def test_leaderboards_are_rebuilt_from_every_database(students, schema):
+    leaderboards.rebuild()
+
+    for school_id in students:
+        expected = [{"rank": 1, "student_id": 1, "rating": float(school_id)}]
+        assert leaderboards.page(school_board(school_id), 0, 10) == expected
+        assert leaderboards.page(group_board(school_id, 1), 0, 10) == expected
+
+
+# --- Qidiruv ---
+
+def test_search_reads_the_index_of_the_school_database(client, students, schema):
+    search_backend.rebuild()
+
+    for school_id, database in students.items():
+        token = create_access_token({"sub": "1", "school": school_id})
+        headers = {"Authorization": f"Bearer {token}"}
+        if database == "big":
+            headers["host"] = BIG_SCHOOL_HOST
+        response = client.get("/search/", params={"q": "algeb"}, headers=headers)
+        assert [hit["title"] for hit in response.json()["results"]] == [f"Algebra {database}"]
+        assert response.json()["has_more"] is False
+
+
+def test_search_skips_other_schools_before_paging():
+    index = InvertedIndex()
+    index.add(("group", 1), 2, 1, "Algebra", ("algebra algebra",))  # scores higher, other school
+    index.add(("group", 2), 1, 2, "Algebra")
+
+    assert [key for key, _ in index.search(["algebra"], {"group"}, 1, None, 1)] == [("group", 2)]
+    assert len(index.search(["algebra"], {"group"}, None, None, 2)) == 2
+
+
+# --- Fon ishlari ---
+
+def test_outbox_is_delivered_from_the_school_database(students):
+    provider = FakeProvider("fake")
+    register_provider("fake", provider)
+    db = worker_sessions["big"]()
+    try:
+        enqueue_message(db, "fake", "998901", "salom")
+        db.commit()
+        assert OutboxDispatcher().dispatch_once() == 1
+    finally:
+        db.close()
+        providers.pop("fake", None)
+
+    assert provider.sent == [("998901", "salom")]
+    assert rows("big", OutboxMessage.status) == [("sent",)]
+
+
+def test_jobs_are_claimed_from_the_school_database(students, monkeypatch):
+    monkeypatch.setitem(jobs.KINDS, "test.pid", jobs.Kind(os.getpid))
+    db = worker_sessions["big"]()
+    try:
+        job = jobs.enqueue(db, "test.pid", {})
+        db.commit()
+        job_id = job.id
+    finally:
+        db.close()
+    runner = jobs.JobRunner(workers=1)
+
+    assert runner._claim("default", 1) == []
+    assert [claimed[0] for claimed in runner._claim("big", 1)] == [job_id]
+    runner._finish("big", job_id, 42, None)
+
+    assert rows("big", Job.status, Job.result) == [("succeeded", 42)]
+
+
+# --- So'rovlar ---
+
+def test_token_reads_its_own_school(client, students, schema):
+    token = create_access_token({"sub": "1", "school": schema["big"]})
+    big = {"host": BIG_SCHOOL_HOST, "Authorization": f"Bearer {token}"}
+
+    assert client.get("/users/me", headers=big).json()["fullname"] == "Ali big"
+
+
+def test_token_of_another_school_is_rejected(client, students, schema):
+    token = create_access_token({"sub": "1", "school": schema["default"]})
+
+    response = client.get("/users/me", headers={"host": BIG_SCHOOL_HOST, "Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 401
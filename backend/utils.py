@@ -1,6 +1,10 @@
-from passlib.context import CryptContext
+from functools import lru_cache
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@lru_cache(maxsize=None)
+def password_context():
+    # passlib importi ~60ms oladi: worker startida emas, birinchi hash/verify'da yuklanadi
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
\ No newline at end of file
+    return password_context().hash(password)